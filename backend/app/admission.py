@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONCURRENCY = int(os.environ.get("ADMISSION_SEARCH_CONCURRENCY", "16"))
+SEARCH_QUEUE = int(os.environ.get("ADMISSION_SEARCH_QUEUE", "64"))
+INGEST_CONCURRENCY = int(os.environ.get("ADMISSION_INGEST_CONCURRENCY", "2"))
+INGEST_QUEUE = int(os.environ.get("ADMISSION_INGEST_QUEUE", "4"))
+# How long a request may wait for a slot before it is turned away
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "5"))
+# Longest a running ingest pauses between bulk chunks while reads are waiting
+INGEST_MAX_PAUSE = float(os.environ.get("ADMISSION_INGEST_MAX_PAUSE", "2"))
+
+# (method, path prefix) -> lane; first match wins, unmatched requests are not limited
+ROUTES: Tuple[Tuple[str, str, str], ...] = (
+    ("POST", "/api/ingest/", "ingest"),
+    ("POST", "/api/risk/recompute", "ingest"),
+    ("GET", "/api/devices/export", "ingest"),
+    ("GET", "/api/devices", "search"),
+    ("GET", "/api/stats", "search"),
+    ("GET", "/api/dashboard", "search"),
+    ("GET", "/api/cves", "search"),
+)
+
+class Lane:
+    """Concurrency limit plus a bounded FIFO of waiters for one class of requests"""
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.rejected = 0
+        # EWMA of how long a request holds its slot, for Retry-After
+        self.service_time = 0.1
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request should have drained"""
+        return max(1, math.ceil((len(self.waiters) + 1) * self.service_time / max(1, self.limit)))
+
+class AdmissionController:
+    """Per-lane admission with priority for interactive reads.
+
+    Searches and ingest get separate slot pools, so a bulk load can never
+    take every worker. Ingest is also held back while searches are queued:
+    a freed ingest slot goes to the next ingest request only once no search
+    is waiting. Lanes live on the event loop; yield_to_interactive() is the
+    one method meant for worker threads.
+    """
+
+    def __init__(self, search_limit: int = SEARCH_CONCURRENCY, search_queue: int = SEARCH_QUEUE,
+                 ingest_limit: int = INGEST_CONCURRENCY, ingest_queue: int = INGEST_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.search = Lane("search", search_limit, search_queue)
+        self.ingest = Lane("ingest", ingest_limit, ingest_queue)
+        self.lanes = {"search": self.search, "ingest": self.ingest}
+        self.queue_timeout = queue_timeout
+
+    def _can_start(self, lane: Lane) -> bool:
+        if lane.active >= lane.limit:
+            return False
+        return lane is self.search or not self.search.waiters
+
+    async def acquire(self, lane: Lane) -> bool:
+        """Take a slot, waiting in the lane's queue if needed; False if the request should get a 429"""
+        if not lane.waiters and self._can_start(lane):
+            lane.active += 1
+            return True
+        if len(lane.waiters) >= lane.max_queue:
+            lane.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._abandon(lane, waiter)
+            raise
+        if waiter.done():
+            return True
+        self._abandon(lane, waiter)
+        lane.rejected += 1
+        return False
+
+    def _abandon(self, lane: Lane, waiter: asyncio.Future):
+        if waiter.done():
+            # Granted a slot just as the wait was given up: hand it on
+            self.release(lane)
+        else:
+            waiter.cancel()
+            lane.waiters.remove(waiter)
+            # Ingest waiters may have been held back only by this queued search
+            self._wake()
+
+    def release(self, lane: Lane, held: Optional[float] = None):
+        if held is not None:
+            lane.service_time = 0.8 * lane.service_time + 0.2 * held
+        lane.active -= 1
+        self._wake()
+
+    def _wake(self):
+        # Searches first; ingest only gets a slot when no search is queued
+        for lane in (self.search, self.ingest):
+            while lane.waiters and self._can_start(lane):
+                waiter = lane.waiters.popleft()
+                if not waiter.done():
+                    lane.active += 1
+                    waiter.set_result(True)
+
+    def yield_to_interactive(self, max_pause: float = INGEST_MAX_PAUSE):
+        """Called by bulk writers between chunks: pause while searches are queued, up to max_pause"""
+        deadline = time.monotonic() + max_pause
+        while self.search.waiters and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"active": lane.active, "queued": len(lane.waiters), "limit": lane.limit,
+                   "rejected": lane.rejected}
+            for name, lane in self.lanes.items()
+        }
+
+def route_lane(method: str, path: str) -> Optional[str]:
+    for route_method, prefix, lane in ROUTES:
+        if method == route_method and path.startswith(prefix):
+            return lane
+    return None
+
+class AdmissionMiddleware:
+    """Queue or reject requests per lane before they reach a worker thread"""
+
+    def __init__(self, app: Callable, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        lane_name = route_lane(scope.get("method", ""), scope.get("path", "")) if scope["type"] == "http" else None
+        if lane_name is None:
+            await self.app(scope, receive, send)
+            return
+        lane = self.controller.lanes[lane_name]
+        if not await self.controller.acquire(lane):
+            retry_after = lane.retry_after()
+            logger.warning(f"Rejected {scope['method']} {scope['path']}: {lane_name} lane saturated (retry in {retry_after}s)")
+            body = json.dumps({"detail": f"Too many {lane_name} requests, retry later"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        started = time.monotonic()
+        # Background tasks run inside this call, so a Shodan ingest keeps its slot until it finishes
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(lane, time.monotonic() - started)
@@ -16,7 +16,11 @@ with st.sidebar:
     if st.button("Load sample data (safe)"):
         resp = requests.post(f"{API_BASE}/api/ingest/shodan_sample")
         if resp.ok:
-            st.success(f"Loaded sample: {resp.json().get('indexed')} items")
+            body = resp.json()
+            if "spooled" in body:
+                st.success(f"Queued sample: {body['spooled']} items")
+            else:
+                st.success(f"Loaded sample: {body.get('indexed')} items")
         else:
             st.error(f"Error: {resp.text}")
 
@@ -0,0 +1,165 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import cve_map
+from .reverse_match import DEVICE_TEXT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+MATCH_WORKERS = int(os.environ.get("MATCH_WORKERS", str(os.cpu_count() or 1)))
+MATCH_CHUNK_SIZE = int(os.environ.get("MATCH_CHUNK_SIZE", "500"))
+MATCH_MEMO_SIZE = int(os.environ.get("MATCH_MEMO_SIZE", "10000"))
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", "50000"))
+
+class MatchMemo:
+    """Thread-safe LRU of text -> matches; fleets repeat the same banners a lot"""
+
+    def __init__(self, max_entries: int = MATCH_MEMO_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            matches = self._entries.get((text, limit))
+            if matches is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((text, limit))
+            self.hits += 1
+            return matches
+
+    def put(self, text: str, limit: int, matches: List[Dict[str, Any]]):
+        with self._lock:
+            self._entries[(text, limit)] = matches
+            self._entries.move_to_end((text, limit))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+memo = MatchMemo()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _init_worker(store_path: str):
+    # Workers map the same store file, so they share its pages with the API
+    # process; an in-memory fallback store is rebuilt the same way
+    cve_map.load_cve_store(store_path)
+
+def _match_texts(texts: List[str], limit: int) -> List[List[Dict[str, Any]]]:
+    return [cve_map.match_cves_text(text, limit) for text in texts]
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # The API process runs threads (drainer, uvicorn workers); forking it could copy
+            # a held lock into the child, so workers start from a clean interpreter
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(
+                max_workers=MATCH_WORKERS,
+                mp_context=multiprocessing.get_context(method),
+                initializer=_init_worker,
+                initargs=(cve_map.get_cve_store().source,)
+            )
+            logger.info(f"Started CVE match pool with {MATCH_WORKERS} {method} workers")
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+def device_text(device: Dict[str, Any]) -> str:
+    """Banner text of a device record, as the reverse matcher reads it"""
+    return " ".join(str(device[field]) for field in DEVICE_TEXT_FIELDS if device.get(field))
+
+class _Chunk:
+    def __init__(self, start: int, texts: List[str]):
+        self.start = start
+        self.texts = texts
+        self.results: List[Optional[List[Dict[str, Any]]]] = [None] * len(texts)
+        self.pending: List[str] = []
+        self.found: Dict[str, List[Dict[str, Any]]] = {}
+        # Texts an earlier, still running chunk is already matching
+        self.borrowed: Dict[int, "_Chunk"] = {}
+        self.future: Optional[Future] = None
+
+def _submit(chunk: _Chunk, limit: int, use_pool: bool, inflight: Dict[str, _Chunk]):
+    """Fill memo hits; send the distinct misses to the pool (or match inline)"""
+    missing: Dict[str, None] = {}
+    for i, text in enumerate(chunk.texts):
+        cached = memo.get(text, limit) if text else []
+        if cached is not None:
+            chunk.results[i] = cached
+        elif inflight.get(text, chunk) is not chunk:
+            chunk.borrowed[i] = inflight[text]
+        else:
+            inflight[text] = chunk
+            missing.setdefault(text, None)
+    chunk.pending = list(missing)
+    if chunk.pending:
+        if use_pool:
+            chunk.future = get_pool().submit(_match_texts, chunk.pending, limit)
+        else:
+            chunk.future = Future()
+            chunk.future.set_result(_match_texts(chunk.pending, limit))
+
+def _collect(chunk: _Chunk, limit: int) -> List[List[Dict[str, Any]]]:
+    if chunk.future is not None:
+        chunk.found = dict(zip(chunk.pending, chunk.future.result()))
+        for text, matches in chunk.found.items():
+            memo.put(text, limit, matches)
+    for i, text in enumerate(chunk.texts):
+        if chunk.results[i] is None:
+            owner = chunk.borrowed.get(i, chunk)
+            chunk.results[i] = owner.found[text]
+    return chunk.results
+
+def match_batch(texts: List[str], limit: int = 5, ids: Optional[List[Optional[str]]] = None,
+                chunk_size: int = MATCH_CHUNK_SIZE) -> Iterator[str]:
+    """NDJSON lines of {index, id, matches}, in input order.
+
+    Chunks are submitted a few ahead of the one being written, so workers
+    stay busy while results stream out in order. Batches that fit in one
+    chunk are matched inline; the pool round trip would cost more.
+    """
+    chunks = [_Chunk(start, texts[start:start + chunk_size]) for start in range(0, len(texts), chunk_size)]
+    use_pool = len(chunks) > 1 and MATCH_WORKERS > 1
+    window = max(2, MATCH_WORKERS * 2)
+    inflight: Dict[str, _Chunk] = {}
+    for chunk in chunks[:window]:
+        _submit(chunk, limit, use_pool, inflight)
+    try:
+        for n, chunk in enumerate(chunks):
+            if n + window < len(chunks):
+                _submit(chunks[n + window], limit, use_pool, inflight)
+            for offset, matches in enumerate(_collect(chunk, limit)):
+                index = chunk.start + offset
+                yield json.dumps({"index": index, "id": ids[index] if ids else None, "matches": matches}) + "\n"
+    finally:
+        # Client went away: don't leave queued chunks running
+        for chunk in chunks:
+            if chunk.future is not None:
+                chunk.future.cancel()
+
+def batch_inputs(texts: Optional[Iterable[str]], devices: Optional[Iterable[Dict[str, Any]]]) -> Tuple[List[str], Optional[List[Optional[str]]]]:
+    """Normalized texts (and device ids, for device input) of a batch request"""
+    if devices:
+        devices = list(devices)
+        return ([device_text(d).strip() for d in devices],
+                [d.get('device_id') or d.get('_id') for d in devices])
+    return [(t or "").strip() for t in texts or []], None
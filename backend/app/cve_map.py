@@ -1,21 +1,31 @@
 import logging
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, Optional
 import re
 
+from .cve_store import CVEStore
+
 logger = logging.getLogger(__name__)
 
-# Sample CVE database (in production, this would be a real database)
+CVE_STORE_PATH = os.environ.get("CVE_STORE_PATH", "data/cves.bin")
+CVE_ID_RE = re.compile(r'cve[-\_]?(\d{4})[-\_]?(\d+)', re.IGNORECASE)
+
+# Fallback CVE set used when no compiled store exists (see scripts/build_cve_store.py)
 SAMPLE_CVES = [
     {
         "cve_id": "CVE-2024-1234",
         "description": "Camera firmware buffer overflow vulnerability",
         "cvss_score": 8.2,
+        "published_date": "2024-01-15",
+        "affected_devices": ["Camera Firmware v2.1.3"],
         "keywords": ["camera", "firmware", "buffer", "overflow", "cctv"]
     },
     {
         "cve_id": "CVE-2024-1235", 
         "description": "Default credentials in web interface",
         "cvss_score": 7.5,
+        "published_date": "2024-01-10",
+        "affected_devices": ["Multiple CCTV models"],
         "keywords": ["default", "credentials", "web", "interface", "admin", "password"]
     },
     {
@@ -26,35 +36,47 @@ SAMPLE_CVES = [
     }
 ]
 
-def match_cves_text(text: str) -> List[Dict[str, Any]]:
-    """Match CVEs against input text"""
+_store: Optional[CVEStore] = None
+
+def load_cve_store(path: str = CVE_STORE_PATH) -> CVEStore:
+    """Memory-map the compiled CVE store, falling back to SAMPLE_CVES if it is missing"""
+    global _store
+    try:
+        _store = CVEStore.open(path)
+        logger.info(f"Loaded CVE store {path}: {len(_store)} CVEs")
+    except (OSError, ValueError) as e:
+        logger.warning(f"CVE store unavailable ({e}); using the built-in sample CVEs")
+        _store = CVEStore.from_records(SAMPLE_CVES)
+    return _store
+
+def get_cve_store() -> CVEStore:
+    return _store if _store is not None else load_cve_store()
+
+def match_cves_text(text: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """Match CVEs against input text.
+
+    CVE IDs named in the text resolve directly and come first; the rest are
+    ranked by BM25 relevance of the text to CVE descriptions and keywords.
+    """
     if not text:
         return []
     
-    text_lower = text.lower()
+    store = get_cve_store()
     matches = []
+    seen = set()
+    for year, number in CVE_ID_RE.findall(text):
+        i = store.index_of(f"CVE-{year}-{number}")
+        if i is not None and i not in seen:
+            seen.add(i)
+            matches.append({**store.record(i), 'match_score': None, 'match_type': 'cve_id', 'matched_keywords': []})
     
-    for cve in SAMPLE_CVES:
-        score = 0
-        matched_keywords = []
-        
-        # Check for keyword matches
-        for keyword in cve['keywords']:
-            if keyword in text_lower:
-                score += 1
-                matched_keywords.append(keyword)
-        
-        # Check for CVE ID pattern
-        if re.search(r'cve[-\_]?\d{4}[-\_]?\d+', text_lower, re.IGNORECASE):
-            score += 2
-        
-        if score > 0:
-            matches.append({
-                **cve,
-                'match_score': score,
-                'matched_keywords': matched_keywords
-            })
-    
-    # Sort by match score (descending)
-    matches.sort(key=lambda x: x['match_score'], reverse=True)
-    return matches
\ No newline at end of file
+    for i, score, terms in store.rank(text, limit + len(seen)):
+        if i in seen:
+            continue
+        matches.append({
+            **store.record(i),
+            'match_score': round(score, 3),
+            'match_type': 'text',
+            'matched_keywords': terms
+        })
+    return matches[:limit]
@@ -0,0 +1,280 @@
+import datetime
+import io
+import logging
+import mmap
+import re
+import struct
+from collections import Counter
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# Compiled CVE database, built offline by scripts/build_cve_store.py and
+# memory-mapped read-only by every API worker, so the pages are shared
+# through the OS page cache and opening it costs no parsing.
+#
+# Layout: a fixed header, then 8-byte aligned little-endian sections.
+# Per-record columns are indexed by record number; text lives once in an
+# interned string table and records refer to it by string number. The
+# vocab/postings sections are a terms x records CSR matrix of BM25 weights,
+# wrapped by scipy without copying.
+MAGIC = b"AVCVEDB\0"
+FORMAT_VERSION = 2
+ID_BYTES = 24
+
+SECTIONS = (
+    ("ids", f"S{ID_BYTES}"),        # CVE ID, NUL padded
+    ("cvss", "<f4"),                # base score, CVSS v3 when present
+    ("published", "<i4"),           # days since 1970-01-01, -1 if unknown
+    ("description", "<u4"),         # string number
+    ("keywords", "<u4"),            # string number of space-separated keywords
+    ("affected", "<u4"),            # string number of newline-separated products
+    ("slots", "<i4"),               # open-addressing hash table: record number or -1
+    ("vocab", "<u4"),               # term string numbers, sorted
+    ("posting_offsets", "<i4"),     # vocab entry -> start in postings (CSR indptr)
+    ("postings", "<i4"),            # record numbers per term (CSR indices)
+    ("posting_weights", "<f4"),     # BM25 weight of the term in the record (CSR data)
+    ("string_offsets", "<u8"),      # string number -> byte offset in strings
+    ("strings", "u1"),              # UTF-8 blob
+)
+HEADER = struct.Struct("<8sI" + "QQ" * len(SECTIONS))
+
+EPOCH = datetime.date(1970, 1, 1)
+KEYWORD_RE = re.compile(r"[a-z0-9][a-z0-9_\-]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "could", "does", "for", "from", "has",
+    "have", "in", "into", "is", "it", "its", "may", "not", "of", "on", "or", "that", "the", "this",
+    "to", "via", "was", "when", "which", "with", "allows", "allow", "attacker", "attackers", "user",
+    "users", "issue", "vulnerability", "vulnerable", "versions", "version", "prior", "before",
+}
+
+# Okapi BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def fnv1a(data: bytes) -> int:
+    """64-bit FNV-1a; stable across processes, unlike hash()"""
+    h = 0xcbf29ce484222325
+    for byte in data:
+        h = ((h ^ byte) * 0x100000001b3) & 0xffffffffffffffff
+    return h
+
+def text_terms(text: str) -> List[str]:
+    """Lowercase index terms of a description or query, repeats kept"""
+    terms = []
+    for word in KEYWORD_RE.findall(text.lower()):
+        word = word.strip("-_")
+        if len(word) > 2 and word not in STOPWORDS and not word.isdigit():
+            terms.append(word)
+    return terms
+
+def _days(published: Optional[str]) -> int:
+    if not published:
+        return -1
+    try:
+        return (datetime.date.fromisoformat(str(published)[:10]) - EPOCH).days
+    except ValueError:
+        return -1
+
+def build_cve_store(records: Iterable[Dict[str, Any]], out: BinaryIO) -> int:
+    """Write records (cve_id, description, cvss_score, published_date, keywords,
+    affected_devices) in the binary format; returns the record count.
+
+    Records are stored newest first, so listing order needs no sort at read time.
+    """
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        cve_id = (record.get("cve_id") or "").strip().upper()
+        if cve_id and len(cve_id.encode()) <= ID_BYTES:
+            by_id[cve_id] = record
+    ordered = sorted(by_id.items(), key=lambda item: (-_days(item[1].get("published_date")), item[0]))
+    count = len(ordered)
+
+    strings: Dict[str, int] = {"": 0}
+
+    def intern(text: str) -> int:
+        return strings.setdefault(text, len(strings))
+
+    columns = {name: np.zeros(count, dtype=dtype) for name, dtype in SECTIONS[:6]}
+    postings: Dict[int, List[Tuple[int, int]]] = {}
+    lengths = np.zeros(count, dtype=np.float32)
+    for i, (cve_id, record) in enumerate(ordered):
+        terms = text_terms(record.get("description") or "")
+        keywords = record.get("keywords") or list(dict.fromkeys(terms))
+        # Curated keywords count as terms even when the description doesn't use them
+        present = set(terms)
+        terms += [k.lower() for k in keywords if k.lower() not in present]
+        lengths[i] = len(terms)
+        columns["ids"][i] = cve_id.encode()
+        columns["cvss"][i] = float(record.get("cvss_score") or 0.0)
+        columns["published"][i] = _days(record.get("published_date"))
+        columns["description"][i] = intern(record.get("description") or "")
+        columns["keywords"][i] = intern(" ".join(keywords))
+        columns["affected"][i] = intern("\n".join(record.get("affected_devices") or []))
+        for term, tf in Counter(terms).items():
+            postings.setdefault(intern(term), []).append((i, tf))
+
+    # Load factor <= 0.5 keeps linear probes short
+    capacity = 1 << max(4, (2 * count - 1).bit_length())
+    slots = np.full(capacity, -1, dtype="<i4")
+    for i, (cve_id, _) in enumerate(ordered):
+        slot = fnv1a(cve_id.encode()) & (capacity - 1)
+        while slots[slot] != -1:
+            slot = (slot + 1) & (capacity - 1)
+        slots[slot] = i
+    columns["slots"] = slots
+
+    texts = list(strings)
+    vocab = sorted(postings, key=lambda s: texts[s])
+    columns["vocab"] = np.array(vocab, dtype="<u4")
+    sizes = [len(postings[s]) for s in vocab]
+    columns["posting_offsets"] = np.concatenate(([0], np.cumsum(sizes))).astype("<i4")
+    columns["postings"] = np.array([i for s in vocab for i, _ in postings[s]], dtype="<i4")
+    tf = np.array([tf for s in vocab for _, tf in postings[s]], dtype=np.float32)
+    df = np.repeat(np.array(sizes, dtype=np.float32), sizes)
+    idf = np.log1p((count - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[columns["postings"]] / max(float(lengths.mean()) if count else 0.0, 1.0))
+    columns["posting_weights"] = (idf * tf * (BM25_K1 + 1) / (tf + norm)).astype("<f4")
+
+    encoded = [text.encode("utf-8") for text in texts]
+    columns["string_offsets"] = np.concatenate(([0], np.cumsum([len(b) for b in encoded]))).astype("<u8")
+    columns["strings"] = np.frombuffer(b"".join(encoded), dtype="u1")
+
+    layout = []
+    offset = HEADER.size
+    for name, _ in SECTIONS:
+        offset = (offset + 7) & ~7
+        layout += [offset, columns[name].nbytes]
+        offset += columns[name].nbytes
+    out.write(HEADER.pack(MAGIC, FORMAT_VERSION, *layout))
+    position = HEADER.size
+    for (name, _), start in zip(SECTIONS, layout[::2]):
+        out.write(b"\0" * (start - position))
+        out.write(columns[name].tobytes())
+        position = start + columns[name].nbytes
+    return count
+
+class CVEStore:
+    """Read-only view over a compiled CVE database (a memory map or bytes)"""
+
+    def __init__(self, buffer: Any, source: str = "<memory>"):
+        self.source = source
+        self._buffer = buffer
+        magic, version, *layout = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{source} is not a version {FORMAT_VERSION} CVE store")
+        for (name, dtype), start, nbytes in zip(SECTIONS, layout[::2], layout[1::2]):
+            count = nbytes // np.dtype(dtype).itemsize
+            setattr(self, name, np.frombuffer(buffer, dtype=dtype, count=count, offset=start))
+        self._mask = len(self.slots) - 1
+        self._vocab_words: Optional[List[str]] = None
+        self._term_positions: Optional[Dict[str, int]] = None
+        self._matrix: Optional[sparse.csr_matrix] = None
+
+    @classmethod
+    def open(cls, path: str) -> "CVEStore":
+        with open(path, "rb") as f:
+            # The mapping stays valid after the file object is closed
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, path)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "CVEStore":
+        buffer = io.BytesIO()
+        build_cve_store(records, buffer)
+        return cls(buffer.getvalue())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, cve_id: str) -> bool:
+        return self.index_of(cve_id) is not None
+
+    def string(self, number: int) -> str:
+        start, end = self.string_offsets[number], self.string_offsets[number + 1]
+        return bytes(self.strings[start:end]).decode("utf-8")
+
+    def index_of(self, cve_id: str) -> Optional[int]:
+        """Record number for a CVE ID via the hash table"""
+        key = cve_id.strip().upper().encode()
+        slot = fnv1a(key) & self._mask
+        while True:
+            i = int(self.slots[slot])
+            if i == -1:
+                return None
+            if self.ids[i] == key:
+                return i
+            slot = (slot + 1) & self._mask
+
+    def record(self, i: int) -> Dict[str, Any]:
+        days = int(self.published[i])
+        keywords = self.string(self.keywords[i])
+        affected = self.string(self.affected[i])
+        return {
+            "cve_id": self.ids[i].decode(),
+            "description": self.string(self.description[i]),
+            "cvss_score": round(float(self.cvss[i]), 1),
+            "published_date": (EPOCH + datetime.timedelta(days=days)).isoformat() if days >= 0 else None,
+            "keywords": keywords.split(" ") if keywords else [],
+            "affected_devices": affected.split("\n") if affected else [],
+        }
+
+    def get(self, cve_id: str) -> Optional[Dict[str, Any]]:
+        i = self.index_of(cve_id)
+        return self.record(i) if i is not None else None
+
+    def page(self, offset: int = 0, size: int = 100, min_cvss: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """A page of records, newest first, and the total matching min_cvss"""
+        if min_cvss is None:
+            total = len(self)
+            selected = range(offset, min(offset + size, total))
+        else:
+            matching = np.flatnonzero(self.cvss >= min_cvss)
+            total = len(matching)
+            selected = matching[offset:offset + size]
+        return [self.record(int(i)) for i in selected], total
+
+    def vocabulary(self) -> List[str]:
+        """Every indexed term, decoded once per process on first use"""
+        if self._vocab_words is None:
+            self._vocab_words = [self.string(s) for s in self.vocab]
+            self._term_positions = {term: position for position, term in enumerate(self._vocab_words)}
+        return self._vocab_words
+
+    def keyword_records(self, position: int) -> np.ndarray:
+        """Record numbers for the term at a vocabulary position"""
+        return self.postings[self.posting_offsets[position]:self.posting_offsets[position + 1]]
+
+    def term_matrix(self) -> sparse.csr_matrix:
+        """terms x records BM25 weights over the mapped sections"""
+        if self._matrix is None:
+            self._matrix = sparse.csr_matrix(
+                (self.posting_weights, self.postings, self.posting_offsets),
+                shape=(len(self.vocab), len(self)), copy=False
+            )
+        return self._matrix
+
+    def rank(self, text: str, limit: int = 10) -> List[Tuple[int, float, List[str]]]:
+        """Top records for free text by BM25: (record number, score, matched terms)"""
+        self.vocabulary()
+        terms = list(dict.fromkeys(t for t in text_terms(text) if t in self._term_positions))
+        if not terms or not len(self):
+            return []
+        rows = np.array([self._term_positions[t] for t in terms])
+        query = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (np.zeros(len(rows), dtype=np.int32), rows)),
+                                  shape=(1, len(self.vocab)))
+        scores = (query @ self.term_matrix()).tocsr()
+        records, values = scores.indices, scores.data
+        if len(records) > limit:
+            top = np.argpartition(-values, limit)[:limit]
+            records, values = records[top], values[top]
+        order = np.lexsort((records, -values))
+        records, values = records[order], values[order]
+        hits = self.term_matrix()[rows][:, records].toarray() > 0
+        return [
+            (int(record), float(value), [terms[t] for t in np.flatnonzero(hits[:, n])])
+            for n, (record, value) in enumerate(zip(records, values))
+        ]
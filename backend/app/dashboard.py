@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# One page render of the Command Center is one summary; repeated renders inside this window reuse it
+DASHBOARD_CACHE_TTL = float(os.environ.get("DASHBOARD_CACHE_TTL", "5"))
+DASHBOARD_TOP = 10
+INGEST_WINDOW_HOURS = 24
+HOUR_MS = 3600 * 1000
+
+class SummaryCache:
+    """Short-lived cache of dashboard summaries keyed by `top`.
+
+    Computation is single-flight per key: concurrent callers for an expired
+    entry wait for the one running aggregation instead of each sending their
+    own. Fresh entries are read without locking, so a slow aggregation for
+    one `top` never holds up another.
+    """
+
+    def __init__(self, ttl: float = DASHBOARD_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self._computing: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, top: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(top)
+        if entry and time.time() - entry[0] <= self.ttl:
+            return {**entry[1], "cached": True}
+        return None
+
+    def get_or_compute(self, top: int, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        cached = self._fresh(top)
+        if cached is not None:
+            return cached
+        with self._lock:
+            key_lock = self._computing.setdefault(top, threading.Lock())
+        with key_lock:
+            # Computed by the call we waited on
+            cached = self._fresh(top)
+            if cached is not None:
+                return cached
+            summary = compute()
+            self._entries[top] = (time.time(), summary)
+        return {**summary, "cached": False}
+
+def ingest_window(now_ms: Optional[int] = None) -> Tuple[int, int]:
+    """(start, end) in epoch ms of the ingest-rate window, starting on an hour boundary"""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    return (now_ms // HOUR_MS - INGEST_WINDOW_HOURS + 1) * HOUR_MS, now_ms
+
+def build_summary_body(top: int, since: int, now: int, severity_ranges: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregation-only search body computing every Command Center figure in one request"""
+    return {
+        "size": 0,
+        "track_total_hits": True,
+        "aggs": {
+            "status": {"terms": {"field": "status", "size": 20, "missing": "unknown"}},
+            "vulnerable": {
+                "filter": {"range": {"vuln_count": {"gte": 1}}},
+                "aggs": {"severity": {"range": {"field": "max_cvss", "keyed": True, "ranges": severity_ranges}}}
+            },
+            "services": {"terms": {"field": "service", "size": top}},
+            "ports": {"terms": {"field": "port", "size": top}},
+            # first_seen, not indexed_at: risk recomputes and re-ingest bump indexed_at but aren't new ingest
+            "ingested": {
+                "filter": {"range": {"first_seen": {"gte": since, "lte": now}}},
+                "aggs": {"hourly": {"date_histogram": {"field": "first_seen", "fixed_interval": "1h", "min_doc_count": 1}}}
+            }
+        }
+    }
+
+def parse_summary_response(response: Dict[str, Any], since: int, now: int) -> Dict[str, Any]:
+    aggs = response.get("aggregations", {})
+    vulnerable = aggs.get("vulnerable", {})
+    severity = vulnerable.get("severity", {}).get("buckets", {})
+    return summarize(
+        total=response["hits"]["total"]["value"],
+        status={b["key"]: b["doc_count"] for b in aggs.get("status", {}).get("buckets", [])},
+        vulnerable=vulnerable.get("doc_count", 0),
+        severity={key: bucket.get("doc_count", 0) for key, bucket in severity.items()},
+        services=[(b["key"], b["doc_count"]) for b in aggs.get("services", {}).get("buckets", [])],
+        ports=[(b["key"], b["doc_count"]) for b in aggs.get("ports", {}).get("buckets", [])],
+        hourly={int(b["key"]): b["doc_count"] for b in aggs.get("ingested", {}).get("hourly", {}).get("buckets", [])},
+        since=since,
+        now=now
+    )
+
+def summarize(total: int = 0, status: Optional[Dict[str, int]] = None, vulnerable: int = 0,
+              severity: Optional[Dict[str, int]] = None, services: Optional[List[Tuple[str, int]]] = None,
+              ports: Optional[List[Tuple[int, int]]] = None, hourly: Optional[Dict[int, int]] = None,
+              since: Optional[int] = None, now: Optional[int] = None) -> Dict[str, Any]:
+    """The summary document both stores return; `hourly` maps hour-start ms to devices first indexed that hour"""
+    if since is None or now is None:
+        since, now = ingest_window()
+    status = status or {}
+    hourly = hourly or {}
+    series = [{"time": hour, "count": hourly.get(hour, 0)} for hour in range(since, now + 1, HOUR_MS)]
+    ingested = sum(point["count"] for point in series)
+    return {
+        "total_devices": total,
+        "status": status,
+        "online": status.get("online", 0),
+        "online_ratio": round(status.get("online", 0) / total, 4) if total else 0.0,
+        "vulnerable_devices": vulnerable,
+        "vulnerable_ratio": round(vulnerable / total, 4) if total else 0.0,
+        # Vulnerable devices by their highest CVSS score
+        "severity": severity or {},
+        "top_services": [{"service": service, "count": count} for service, count in services or []],
+        "top_ports": [{"port": port, "count": count} for port, count in ports or []],
+        "ingest": {
+            "last_24h": ingested,
+            "per_hour": round(ingested / INGEST_WINDOW_HOURS, 2),
+            "hourly": series
+        },
+        "generated_at": now
+    }
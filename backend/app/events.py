@@ -0,0 +1,115 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Raw banners can be large and the live feed never shows them
+EVENT_EXCLUDED_FIELDS = ("data",)
+
+class Subscription:
+    """One SSE client: a bounded queue owned by the event loop serving it"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = False
+
+class EventBroker:
+    """In-process fan-out of device events to SSE subscribers.
+
+    publish() may be called from any thread (the bulk indexer runs in worker
+    threads). Every subscriber has a bounded queue; a subscriber that falls
+    behind is dropped rather than buffered without limit, and can resume
+    from the replay buffer by reconnecting with Last-Event-ID.
+    """
+
+    def __init__(self, max_queue: int = 256, max_subscribers: int = 100, replay_size: int = 1000):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._recent: deque = deque(maxlen=replay_size)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Optional[Subscription]:
+        """Register a subscriber for the running event loop; None if at capacity"""
+        sub = Subscription(asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            backlog = self._replay(last_event_id)
+            self._subscribers.add(sub)
+        for event in backlog[-self.max_queue:]:
+            sub.queue.put_nowait(event)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event_type: str, data: Dict[str, Any]):
+        """Fan an event out to every subscriber without blocking the caller"""
+        with self._lock:
+            event = (next(self._ids), event_type, data)
+            self._recent.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(self._offer, sub, event)
+            except RuntimeError:
+                # Event loop already closed
+                self.unsubscribe(sub)
+
+    def publish_devices(self, results: List[Tuple[str, Dict[str, Any]]]):
+        """Bulk-indexer listener: publish committed devices as indexed/changed events"""
+        for result, device in results:
+            event_type = "device.indexed" if result == "created" else "device.changed"
+            payload = {k: v for k, v in device.items() if k not in EVENT_EXCLUDED_FIELDS}
+            self.publish(event_type, payload)
+
+    async def stream(self, sub: Subscription, keepalive: float = 15.0) -> AsyncIterator[str]:
+        """Yield SSE frames for a subscription until it is dropped"""
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            event_id, event_type, data = event
+            yield f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    def _offer(self, sub: Subscription, event: Tuple[int, str, Dict[str, Any]]):
+        # Runs on the subscriber's event loop
+        if sub.dropped:
+            return
+        try:
+            sub.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Dropping slow event stream subscriber")
+            sub.dropped = True
+            self.unsubscribe(sub)
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            sub.queue.put_nowait(None)
+
+    def _replay(self, last_event_id: Optional[str]) -> List[Tuple[int, str, Dict[str, Any]]]:
+        if not last_event_id:
+            return []
+        try:
+            last = int(last_event_id)
+        except ValueError:
+            return []
+        return [event for event in self._recent if event[0] > last]
@@ -0,0 +1,111 @@
+import io
+import logging
+import os
+import tempfile
+from typing import List, Dict, Any, Iterable, Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Flat, analyst-friendly layout of a device document. Nested vulnerabilities
+# become parallel list columns so pandas gets plain object/list columns
+# instead of dicts that have to be normalized row by row.
+DEVICE_SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("device_id", pa.string()),
+    ("ip", pa.string()),
+    ("port", pa.int32()),
+    ("hostname", pa.string()),
+    ("service", pa.string()),
+    ("status", pa.string()),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("last_seen", pa.string()),
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("indexed_at", pa.timestamp("ms", tz="UTC")),
+    ("vulnerabilities_cve_id", pa.list_(pa.string())),
+    ("vulnerabilities_cvss_score", pa.list_(pa.float32())),
+    ("vulnerabilities_type", pa.list_(pa.string())),
+])
+
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _to_int(value: Any):
+    try:
+        return int(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+def _to_float(value: Any):
+    try:
+        return float(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+def _to_str(value: Any):
+    return None if value is None else str(value)
+
+def devices_to_record_batch(devices: List[Dict[str, Any]]) -> pa.RecordBatch:
+    """Convert a page of device documents into a RecordBatch of DEVICE_SCHEMA"""
+    columns: Dict[str, list] = {field.name: [] for field in DEVICE_SCHEMA}
+    for device in devices:
+        location = device.get("location") or {}
+        if not isinstance(location, dict):
+            location = {}
+        vulns = device.get("vulnerabilities") or []
+
+        columns["_id"].append(_to_str(device.get("_id")))
+        columns["device_id"].append(_to_str(device.get("device_id")))
+        columns["ip"].append(_to_str(device.get("ip")))
+        columns["port"].append(_to_int(device.get("port")))
+        columns["hostname"].append(_to_str(device.get("hostname")))
+        columns["service"].append(_to_str(device.get("service")))
+        columns["status"].append(_to_str(device.get("status")))
+        columns["lat"].append(_to_float(location.get("lat")))
+        columns["lon"].append(_to_float(location.get("lon")))
+        columns["last_seen"].append(_to_str(device.get("last_seen")))
+        columns["timestamp"].append(_to_int(_to_float(device.get("timestamp"))))
+        columns["indexed_at"].append(_to_int(device.get("indexed_at")))
+        columns["vulnerabilities_cve_id"].append([_to_str(v.get("cve_id")) for v in vulns])
+        columns["vulnerabilities_cvss_score"].append([_to_float(v.get("cvss_score")) for v in vulns])
+        columns["vulnerabilities_type"].append([_to_str(v.get("type")) for v in vulns])
+
+    arrays = [pa.array(columns[field.name], type=field.type) for field in DEVICE_SCHEMA]
+    return pa.RecordBatch.from_arrays(arrays, schema=DEVICE_SCHEMA)
+
+def arrow_ipc_stream(pages: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """Encode device pages as an Arrow IPC stream, yielding bytes as each batch is written"""
+    buffer = io.BytesIO()
+    writer = pa.ipc.new_stream(pa.PythonFile(buffer, mode="w"), DEVICE_SCHEMA)
+    rows = 0
+    for devices in pages:
+        writer.write_batch(devices_to_record_batch(devices))
+        rows += len(devices)
+        # Hand each encoded batch off and reuse the buffer, so memory stays bounded by one page
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    writer.close()
+    yield buffer.getvalue()
+    logger.info(f"Exported {rows} devices as Arrow IPC stream")
+
+def write_parquet(pages: Iterable[List[Dict[str, Any]]], compression: str = "zstd") -> str:
+    """Write device pages to a temporary Parquet file (one row group per page); returns its path"""
+    handle = tempfile.NamedTemporaryFile(prefix="avapt-devices-", suffix=".parquet", delete=False)
+    handle.close()
+    rows = 0
+    try:
+        with pq.ParquetWriter(handle.name, DEVICE_SCHEMA, compression=compression) as writer:
+            for devices in pages:
+                writer.write_batch(devices_to_record_batch(devices))
+                rows += len(devices)
+    except BaseException:
+        os.remove(handle.name)
+        raise
+    logger.info(f"Exported {rows} devices to Parquet")
+    return handle.name
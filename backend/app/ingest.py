@@ -23,27 +23,7 @@ def ingest_shodan_query_safe(es: OpenSearchHelper, query: str, api_key: str) ->
         api = shodan.Shodan(api_key)
         results = api.search(query)
         
-        devices = []
-        for result in results['matches'][:50]:  # Limit to 50 results
-            device = {
-                'ip': result['ip_str'],
-                'port': result['port'],
-                'hostname': result.get('hostnames', [''])[0],
-                'service': result.get('product', 'Unknown'),
-                'status': 'online',
-                'data': result.get('data', ''),
-                'timestamp': time.time() * 1000,
-                'vulnerabilities': []
-            }
-            
-            # Add location if available
-            if 'location' in result:
-                device['location'] = {
-                    'lat': result['location']['latitude'],
-                    'lon': result['location']['longitude']
-                }
-            
-            devices.append(device)
+        devices = [parse_shodan_banner(result) for result in results['matches'][:50]]  # Limit to 50 results
         
         success = es.bulk_index_devices(devices)
         return len(devices) if success else 0
@@ -55,6 +35,29 @@ def ingest_shodan_query_safe(es: OpenSearchHelper, query: str, api_key: str) ->
         logger.error(f"Error in Shodan query ingestion: {e}")
         return 0
 
+def parse_shodan_banner(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a Shodan banner into a device document"""
+    device = {
+        'ip': result['ip_str'],
+        'port': result['port'],
+        'hostname': (result.get('hostnames') or [''])[0],
+        'service': result.get('product', 'Unknown'),
+        'status': 'online',
+        'data': result.get('data', ''),
+        'timestamp': time.time() * 1000,
+        'vulnerabilities': []
+    }
+    
+    # Add location if available
+    location = result.get('location') or {}
+    if location.get('latitude') is not None and location.get('longitude') is not None:
+        device['location'] = {
+            'lat': location['latitude'],
+            'lon': location['longitude']
+        }
+    
+    return device
+
 def generate_sample_devices(count: int = 20) -> List[Dict[str, Any]]:
     """Generate sample device data for testing"""
     sample_ips = [
@@ -1,11 +1,25 @@
 import os
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+import re
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
+from fastapi.responses import StreamingResponse, FileResponse, ORJSONResponse
+from starlette.background import BackgroundTask
+from typing import Any, Dict, List, Optional
 import logging
 from .opensearch import OpenSearchHelper
+from .sqlite_store import SQLiteDeviceStore
 from .ingest import ingest_shodan_sample_safe, ingest_shodan_query_safe
-from .cve_map import match_cves_text
+from .cve_map import get_cve_store, load_cve_store, match_cves_text
+from .admission import AdmissionController, AdmissionMiddleware
+from .compression import CompressionMiddleware
+from .cve_batch import MAX_BATCH_ITEMS, batch_inputs, match_batch, shutdown_pool
+from .dashboard import DASHBOARD_TOP, summarize
+from .events import EventBroker
+from .export import EXPORT_FORMATS, arrow_ipc_stream, write_parquet
+from .resilience import with_budget
+from .roe import ROEStore
+from .spool import SPOOL_DIR, DeviceSpool, SpoolDrainer
+from .suggest import SUGGEST_FIELDS
 from pydantic import BaseModel
 
 # Configure logging
@@ -14,22 +28,81 @@ logger = logging.getLogger(__name__)
 
 OPENSEARCH_URL = os.environ.get("OPENSEARCH_URL", "http://localhost:9200")
 LAB_MODE = os.environ.get("LAB_MODE", "false").lower() == "true"
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "256"))
+EVENT_MAX_SUBSCRIBERS = int(os.environ.get("EVENT_MAX_SUBSCRIBERS", "100"))
+# opensearch, sqlite, or auto (OpenSearch, falling back to SQLite when it is unreachable)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "opensearch").lower()
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "data/avapt.db")
+# Spool OpenSearch ingest to disk first, so it survives the cluster being down
+SPOOL_ENABLED = os.environ.get("SPOOL_ENABLED", "true").lower() == "true"
+# Total OpenSearch time per request; calls share it, so a stalled cluster costs one budget, not one timeout per call
+SEARCH_BUDGET = float(os.environ.get("SEARCH_BUDGET", "3"))
+INGEST_BUDGET = float(os.environ.get("INGEST_BUDGET", "30"))
+HEALTH_BUDGET = float(os.environ.get("HEALTH_BUDGET", "1"))
+FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
 
-# Initialize OpenSearch with error handling
-try:
-    es = OpenSearchHelper(OPENSEARCH_URL)
-    # Test connection and create mappings
-    if es.client.ping():
-        logger.info("Successfully connected to OpenSearch")
-        es.create_index_mappings()
-    else:
+# Live device feed; the bulk indexer publishes committed devices into it
+broker = EventBroker(max_queue=EVENT_QUEUE_SIZE, max_subscribers=EVENT_MAX_SUBSCRIBERS)
+# Separate search/ingest slots so a bulk load can't starve dashboard queries
+admission = AdmissionController()
+
+def _open_opensearch(keep_unreachable: bool = False, max_retries: int = 5):
+    """OpenSearch store, or None if it can't be reached (unless keep_unreachable)"""
+    try:
+        store = OpenSearchHelper(OPENSEARCH_URL, connect_retries=max_retries)
+        store.ingest_gate = admission.yield_to_interactive
+        # Test connection and create mappings
+        if store.ping():
+            logger.info("Successfully connected to OpenSearch")
+            store.create_index_mappings()
+            return store
         logger.error("Failed to connect to OpenSearch")
-        es = None
-except Exception as e:
-    logger.error(f"OpenSearch initialization failed: {e}")
-    es = None
+        if keep_unreachable:
+            logger.warning("Ingest will be spooled until OpenSearch is reachable")
+            return store
+    except Exception as e:
+        logger.error(f"OpenSearch initialization failed: {e}")
+    return None
+
+def _open_sqlite():
+    """Embedded SQLite store, or None if the schema can't be created"""
+    try:
+        store = SQLiteDeviceStore(SQLITE_PATH)
+        if store.create_index_mappings():
+            logger.info(f"Using embedded SQLite store at {SQLITE_PATH}")
+            return store
+    except Exception as e:
+        logger.error(f"SQLite store initialization failed: {e}")
+    return None
+
+# Both stores expose the same search/index/stats methods, so endpoints don't care which one is active
+if STORAGE_BACKEND == "sqlite":
+    es = _open_sqlite()
+elif STORAGE_BACKEND == "auto":
+    # One connection attempt: without a cluster, fall back to SQLite instead of retrying for ~20s
+    es = _open_opensearch(max_retries=1) or _open_sqlite()
+else:
+    es = _open_opensearch(keep_unreachable=SPOOL_ENABLED)
+
+if es:
+    es.add_listener(broker.publish_devices)
+
+# Ingest endpoints write to the spool; the drainer replays it into OpenSearch when the cluster is healthy
+spool = DeviceSpool(SPOOL_DIR) if SPOOL_ENABLED and isinstance(es, OpenSearchHelper) else None
+drainer = SpoolDrainer(spool, es, prepare=es.create_index_mappings) if spool else None
+ingest_writer = spool or es
 
-app = FastAPI(title="CCTV AVAPT Prototype API")
+# Submitted ROEs; their scopes filter device searches and lab targets
+roes = ROEStore()
+
+# Memory-mapped, so each worker opens it instantly and shares its pages
+load_cve_store()
+
+# orjson serializes large device pages several times faster than the stdlib encoder
+app = FastAPI(title="CCTV AVAPT Prototype API", default_response_class=ORJSONResponse)
+
+# Innermost, so 429s still pass through CORS
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
 # CORS middleware
 app.add_middleware(
@@ -39,12 +112,30 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
 class ShodanQuery(BaseModel):
     query: str
 
 class FingerprintRequest(BaseModel):
     target: str
+    # When set, the target must be inside this ROE's scope
+    roe_id: Optional[str] = None
+
+class RiskRecomputeRequest(BaseModel):
+    # cve_id -> fields to refresh on embedded vulnerabilities (cvss_score, description)
+    cve_updates: Optional[Dict[str, Dict[str, Any]]] = None
+
+class CVEBatchMatchRequest(BaseModel):
+    # Either raw banner texts or device records (service/hostname/data are matched)
+    texts: Optional[List[str]] = None
+    devices: Optional[List[Dict[str, Any]]] = None
+    limit: int = 5
+
+class ScopeCheckRequest(BaseModel):
+    # Either IPs or device records (their `ip` is checked)
+    ips: Optional[List[str]] = None
+    devices: Optional[List[Dict[str, Any]]] = None
 
 class ROERequest(BaseModel):
     name: str
@@ -56,28 +147,49 @@ class ROERequest(BaseModel):
     contacts: str
     emergency_procedure: str
 
+@app.on_event("startup")
+def startup():
+    if drainer:
+        drainer.start()
+
+@app.on_event("shutdown")
+def shutdown():
+    shutdown_pool()
+    if drainer:
+        drainer.stop()
+        spool.close()
+
 @app.get("/")
 async def root():
     return {"message": "CCTV AVAPT Prototype API", "status": "running"}
 
 @app.get("/health")
+@with_budget(HEALTH_BUDGET)
 def health():
     """Health check endpoint"""
-    opensearch_status = "connected" if es and es.client.ping() else "disconnected"
+    store_status = "connected" if es and es.ping() else "disconnected"
     return {
         "status": "ok",
-        "opensearch": opensearch_status,
+        "opensearch": store_status,
+        "storage": "sqlite" if isinstance(es, SQLiteDeviceStore) else "opensearch",
+        "admission": admission.snapshot(),
+        "circuit": es.client.breaker.snapshot() if isinstance(es, OpenSearchHelper) and es.client else None,
+        "spool": drainer.snapshot() if drainer else None,
         "lab_mode": LAB_MODE
     }
 
 @app.post("/api/ingest/shodan_sample")
+@with_budget(INGEST_BUDGET)
 def ingest_shodan_sample():
     """Ingest sample Shodan data"""
     if not es:
         raise HTTPException(status_code=500, detail="OpenSearch not available")
     
     try:
-        count = ingest_shodan_sample_safe(es)
+        count = ingest_shodan_sample_safe(ingest_writer)
+        # Spooled devices are only queued; the drainer indexes them once OpenSearch accepts writes
+        if spool is not None:
+            return {"status": "ok", "spooled": count}
         return {"status": "ok", "indexed": count}
     except Exception as e:
         logger.error(f"Error ingesting sample data: {e}")
@@ -93,7 +205,7 @@ def ingest_shodan_query(q: ShodanQuery, background: BackgroundTasks):
     if not api_key:
         raise HTTPException(status_code=400, detail="SHODAN_API_KEY not configured")
     
-    background.add_task(ingest_shodan_query_safe, es, q.query, api_key)
+    background.add_task(ingest_shodan_query_safe, ingest_writer, q.query, api_key)
     return {"status": "started", "query": q.query}
 
 @app.post("/api/ingest/cves")
@@ -107,69 +219,211 @@ def ingest_cves():
         logger.error(f"Error ingesting CVEs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Comma-separated `fields=` projection (dotted paths allowed), or None for whole documents"""
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    invalid = [f for f in names if not FIELD_RE.match(f)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid fields: {', '.join(invalid)}")
+    return names or None
+
+def _roe_scope(roe_id: Optional[str]):
+    """Compiled scope of an ROE (None when no roe_id was given); 404 for unknown ROEs"""
+    if not roe_id:
+        return None
+    scope = roes.scope(roe_id)
+    if scope is None:
+        raise HTTPException(status_code=404, detail=f"ROE not found: {roe_id}")
+    return scope
+
 @app.get("/api/devices")
-def get_devices(q: str = None, size: int = 100):
-    """Get devices with optional search"""
+@with_budget(SEARCH_BUDGET)
+def get_devices(q: str = None, size: int = 100, fields: Optional[str] = None, roe_id: Optional[str] = None):
+    """Get devices with optional search; fields=ip,port,... returns only those fields, roe_id only in-scope devices"""
+    fields = _parse_fields(fields)
+    scope = _roe_scope(roe_id)
     if not es:
         return []
     
     try:
-        res = es.search_devices(q, size)
-        return res
+        # Returned as a response directly, so FastAPI skips jsonable_encoder on every document
+        return ORJSONResponse(es.search_devices(q, size, fields, scope))
     except Exception as e:
         logger.error(f"Error getting devices: {e}")
         return []
 
 @app.get("/api/devices/search")
-def search_devices(q: str = "", size: int = 50):
-    """Search devices (alias for /api/devices)"""
+@with_budget(SEARCH_BUDGET)
+def search_devices(q: str = "", size: int = 50, explain: bool = False, fields: Optional[str] = None,
+                   roe_id: Optional[str] = None):
+    """Search devices (alias for /api/devices); explain=true also returns the query plan"""
+    fields = _parse_fields(fields)
+    scope = _roe_scope(roe_id)
     if not es:
-        return []
+        return {"devices": [], "plan": None} if explain else []
     
     try:
-        res = es.search_devices(q, size)
-        return res
+        res, plan = es.search_devices_planned(q, size, fields, scope)
+        headers = {"X-Query-Plan": plan.header()} if plan else None
+        if explain:
+            return ORJSONResponse({"devices": res, "plan": plan.describe() if plan else {"strategy": "recent"}},
+                                  headers=headers)
+        return ORJSONResponse(res, headers=headers)
     except Exception as e:
         logger.error(f"Error searching devices: {e}")
         return []
 
+@app.get("/api/devices/suggest")
+@with_budget(SEARCH_BUDGET)
+def suggest_devices(prefix: str = "", size: int = 10, fields: Optional[str] = None):
+    """Typeahead suggestions for hostnames, services (vendor/model) and CVE IDs"""
+    size = max(1, min(size, 50))
+    groups = tuple(f for f in (fields or ",".join(SUGGEST_FIELDS)).split(",") if f)
+    unknown = [f for f in groups if f not in SUGGEST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown suggestion fields: {', '.join(unknown)}")
+    if not es:
+        return {"prefix": prefix, "suggestions": {f: [] for f in groups}, "cached": False}
+    return es.suggest(prefix, groups, size)
+
+@app.get("/api/devices/changes")
+@with_budget(SEARCH_BUDGET)
+def get_device_changes(since: Optional[str] = None, size: int = 500):
+    """Devices changed since a cursor returned by a previous call"""
+    size = max(1, min(size, 5000))
+    if not es:
+        return {"devices": [], "cursor": since, "has_more": False}
+    
+    try:
+        return es.get_device_changes(since, size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting device changes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/devices/export")
+def export_devices(format: str = "arrow", batch_size: int = 10000):
+    """Export the full device inventory as an Arrow IPC stream or a Parquet file"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format} (use {', '.join(EXPORT_FORMATS)})")
+    if not es:
+        raise HTTPException(status_code=500, detail="OpenSearch not available")
+    
+    batch_size = max(100, min(batch_size, 10000))
+    pages = es.iter_device_batches(batch_size)
+    if format == "arrow":
+        return StreamingResponse(
+            arrow_ipc_stream(pages),
+            media_type=EXPORT_FORMATS["arrow"],
+            headers={"Content-Disposition": "attachment; filename=devices.arrows"}
+        )
+    
+    try:
+        path = write_parquet(pages)
+    except Exception as e:
+        logger.error(f"Error exporting devices: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(
+        path,
+        media_type=EXPORT_FORMATS["parquet"],
+        filename="devices.parquet",
+        background=BackgroundTask(os.remove, path)
+    )
+
 @app.get("/api/devices/vulnerable")
-def get_vulnerable_devices():
-    """Get vulnerable devices"""
+@with_budget(SEARCH_BUDGET)
+def get_vulnerable_devices(cursor: Optional[str] = None, size: int = 100, min_cvss: Optional[float] = None):
+    """Vulnerable devices sorted by highest CVSS, paged by cursor; the first page includes severity counts"""
+    size = max(1, min(size, 1000))
     if not es:
-        return []
+        return {"devices": [], "cursor": cursor, "has_more": False}
     
     try:
-        # This would query for devices with vulnerabilities
-        # For now, return all devices
-        res = es.search_devices(None, 100)
-        return res
+        return es.get_vulnerable_devices(cursor, size, min_cvss)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting vulnerable devices: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/devices/top-risk")
+@with_budget(SEARCH_BUDGET)
+def get_top_risk_devices(size: int = 20, min_score: Optional[float] = None):
+    """Riskiest devices by precomputed risk_score"""
+    size = max(1, min(size, 1000))
+    if not es:
+        return []
+    
+    try:
+        return es.top_risk_devices(size, min_score)
+    except Exception as e:
+        logger.error(f"Error getting top risk devices: {e}")
         return []
 
+@app.get("/api/devices/geo")
+@with_budget(SEARCH_BUDGET)
+def get_devices_in_bbox(top: float, left: float, bottom: float, right: float, size: int = 1000):
+    """Devices located inside a lat/lon bounding box"""
+    if bottom > top or left > right:
+        raise HTTPException(status_code=400, detail="Expected bottom <= top and left <= right")
+    size = max(1, min(size, 10000))
+    if not es:
+        return []
+    
+    try:
+        return es.devices_in_bbox(top, left, bottom, right, size)
+    except Exception as e:
+        logger.error(f"Error getting devices in bounding box: {e}")
+        return []
+
+@app.post("/api/risk/recompute")
+def recompute_risk(background: BackgroundTasks, req: Optional[RiskRecomputeRequest] = None):
+    """Recompute risk fields in the background, for devices with the given CVEs or for all devices"""
+    if not es:
+        raise HTTPException(status_code=500, detail="OpenSearch not available")
+    
+    cve_updates = req.cve_updates if req and req.cve_updates else None
+    background.add_task(es.recompute_derived_fields, cve_updates)
+    return {"status": "started", "cves": len(cve_updates) if cve_updates else None}
+
+@app.get("/api/events/stream")
+async def events_stream(request: Request, last_event_id: Optional[str] = Header(None)):
+    """Server-Sent Events feed of newly indexed and changed devices"""
+    sub = broker.subscribe(last_event_id)
+    if sub is None:
+        raise HTTPException(status_code=503, detail="Too many event stream subscribers")
+
+    async def frames():
+        try:
+            async for frame in broker.stream(sub):
+                if await request.is_disconnected():
+                    break
+                yield frame
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/cves")
-def get_cves():
-    """Get CVE data"""
+def get_cves(cve_id: Optional[str] = None, offset: int = 0, size: int = 100, min_cvss: Optional[float] = None):
+    """Get CVE data, newest first, or a single CVE by ID"""
+    store = get_cve_store()
+    if cve_id:
+        record = store.get(cve_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Unknown CVE: {cve_id}")
+        return [record]
+    
     try:
-        # Return sample CVE data for now
-        sample_cves = [
-            {
-                "cve_id": "CVE-2024-1234",
-                "description": "Camera firmware buffer overflow vulnerability",
-                "cvss_score": 8.2,
-                "published_date": "2024-01-15",
-                "affected_devices": ["Camera Firmware v2.1.3"]
-            },
-            {
-                "cve_id": "CVE-2024-1235",
-                "description": "Default credentials in web interface",
-                "cvss_score": 7.5,
-                "published_date": "2024-01-10",
-                "affected_devices": ["Multiple CCTV models"]
-            }
-        ]
-        return sample_cves
+        records, _ = store.page(max(0, offset), max(1, min(size, 1000)), min_cvss)
+        return records
     except Exception as e:
         logger.error(f"Error getting CVEs: {e}")
         return []
@@ -179,6 +433,9 @@ def fingerprint_lab(req: FingerprintRequest):
     """Fingerprint lab target"""
     if not LAB_MODE:
         raise HTTPException(status_code=403, detail="Lab mode is disabled. Enable LAB_MODE to run lab fingerprinting.")
+    scope = _roe_scope(req.roe_id)
+    if scope is not None and not scope.contains(req.target):
+        raise HTTPException(status_code=403, detail=f"{req.target} is outside the scope of ROE {req.roe_id}")
     return {"status": "ok", "message": f"Fingerprinting for {req.target} queued (run scripts/fingerprint_lab.py with --lab to perform locally)."}
 
 @app.get("/api/cve/match")
@@ -191,6 +448,18 @@ def cve_match(text: str):
         logger.error(f"Error matching CVEs: {e}")
         return {"matches": []}
 
+@app.post("/api/cve/match/batch")
+def cve_match_batch(req: CVEBatchMatchRequest):
+    """Match CVEs for many texts or devices; streams NDJSON results in input order"""
+    texts, ids = batch_inputs(req.texts, req.devices)
+    if not texts:
+        raise HTTPException(status_code=400, detail="Provide texts or devices")
+    if len(texts) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(texts)} items (max {MAX_BATCH_ITEMS})")
+    
+    limit = max(1, min(req.limit, 50))
+    return StreamingResponse(match_batch(texts, limit, ids), media_type="application/x-ndjson")
+
 @app.get("/api/roes/template")
 def get_roe_template():
     """Get ROE template"""
@@ -221,41 +490,56 @@ def get_roe_template():
 
 @app.post("/api/roes")
 def submit_roe(roe: ROERequest):
-    """Submit ROE data"""
+    """Submit ROE data; the scope is compiled and enforced on scoped searches and lab targets"""
     try:
-        # In a real implementation, you would save this to a database
-        # For now, just return the received data
+        record = roes.add(roe.dict())
         return {
             "status": "success",
             "message": "ROE submitted successfully",
-            "data": roe.dict()
+            "data": record
         }
     except Exception as e:
         logger.error(f"Error submitting ROE: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/roes")
+def list_roes():
+    """Stored ROEs, newest first"""
+    return roes.list()
+
+@app.get("/api/roes/{roe_id}")
+def get_roe(roe_id: str):
+    """One stored ROE"""
+    roe = roes.get(roe_id)
+    if roe is None:
+        raise HTTPException(status_code=404, detail=f"ROE not found: {roe_id}")
+    return roe
+
+@app.post("/api/roes/{roe_id}/check")
+def check_scope(roe_id: str, req: ScopeCheckRequest):
+    """Which of a list of IPs (or device records) are in an ROE's scope, as a mask in input order"""
+    scope = _roe_scope(roe_id)
+    ips = [str(d.get("ip") or "") for d in req.devices] if req.devices else req.ips or []
+    mask = scope.contains_many(ips)
+    return ORJSONResponse({"checked": len(ips), "in_scope_count": int(mask.sum()), "in_scope": mask.tolist()})
+
 @app.get("/api/stats")
+@with_budget(SEARCH_BUDGET)
 def get_stats():
     """Get system statistics"""
     if not es:
         return {
             "total_devices": 0,
             "vulnerable_devices": 0,
-            "total_cves": 0
+            "total_cves": len(get_cve_store())
         }
     
     try:
-        # Get device count
-        devices = es.search_devices(None, 1000)
-        total_devices = len(devices)
-        
-        # Count vulnerable devices (simplified)
-        vulnerable_devices = len([d for d in devices if d.get('vulnerabilities')])
-        
+        counts = es.get_stats()
         return {
-            "total_devices": total_devices,
-            "vulnerable_devices": vulnerable_devices,
-            "total_cves": 2  # Sample CVE count
+            "total_devices": counts["total_devices"],
+            "vulnerable_devices": counts["vulnerable_devices"],
+            "total_cves": len(get_cve_store())
         }
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
@@ -263,4 +547,18 @@ def get_stats():
             "total_devices": 0,
             "vulnerable_devices": 0,
             "total_cves": 0
-        }
\ No newline at end of file
+        }
+
+@app.get("/api/dashboard/summary")
+@with_budget(SEARCH_BUDGET)
+def get_dashboard_summary(top: int = DASHBOARD_TOP):
+    """Command Center KPIs in one call: status counts, online ratio, vulnerable devices by severity,
+    top services and ports, and the last-24h ingest rate; cached for a few seconds"""
+    top = max(1, min(top, 50))
+    if not es:
+        return summarize()
+    try:
+        return es.dashboard_summary(top)
+    except Exception as e:
+        logger.error(f"Error getting dashboard summary: {e}")
+        return summarize()
\ No newline at end of file
@@ -0,0 +1,126 @@
+import datetime
+import gzip
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# NVD marks withdrawn CVEs by prefixing the description
+REJECT_PREFIX = "** REJECT **"
+
+def load_feed(path: str) -> Dict[str, Any]:
+    """Parse an NVD JSON feed file, gzipped or not"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def iter_cpe_matches(nodes: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for node in nodes:
+        yield from node.get("cpe_match", [])
+        yield from iter_cpe_matches(node.get("children", []))
+
+def detect_schema(data: Dict[str, Any]) -> Optional[str]:
+    """"1.1" for legacy CVE_Items feeds, "2.0" for API 2.0 vulnerabilities feeds"""
+    if "CVE_Items" in data:
+        return "1.1"
+    if "vulnerabilities" in data:
+        return "2.0"
+    return None
+
+def parse_feed(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Normalized CVE entries of an NVD 1.1 or 2.0 feed.
+
+    Each entry has cve_id, description, cvss_score (v3 base score or None),
+    cvss_v2, published_date, last_modified, rejected and cpes, a list of
+    {"cpe", "vulnerable"} from every configuration node.
+    """
+    schema = detect_schema(data)
+    if schema == "1.1":
+        return _parse_v1(data)
+    if schema == "2.0":
+        return _parse_v2(data)
+    logger.warning(f"Unrecognized NVD feed layout (keys: {', '.join(list(data)[:5])})")
+    return iter(())
+
+def parse_file(path: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """(schema, entries) of a feed file; a top-level function so process pools can run it"""
+    data = load_feed(path)
+    return detect_schema(data), list(parse_feed(data))
+
+def _parse_v1(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for item in data.get("CVE_Items", []):
+        cve = item.get("cve", {})
+        cve_id = cve.get("CVE_data_meta", {}).get("ID")
+        if not cve_id:
+            continue
+        impact = item.get("impact", {})
+        descriptions = cve.get("description", {}).get("description_data", [])
+        description = descriptions[0].get("value", "") if descriptions else ""
+        yield {
+            "cve_id": cve_id,
+            "description": description,
+            "cvss_score": impact.get("baseMetricV3", {}).get("cvssV3", {}).get("baseScore"),
+            "cvss_v2": impact.get("baseMetricV2", {}).get("cvssV2", {}).get("baseScore"),
+            "published_date": item.get("publishedDate"),
+            "last_modified": item.get("lastModifiedDate"),
+            "rejected": description.startswith(REJECT_PREFIX),
+            "cpes": [
+                {"cpe": m["cpe23Uri"], "vulnerable": m.get("vulnerable", True)}
+                for m in iter_cpe_matches(item.get("configurations", {}).get("nodes", []))
+                if m.get("cpe23Uri")
+            ],
+        }
+
+def _base_score(metrics: List[Dict[str, Any]]) -> Optional[float]:
+    """Base score of the NVD (Primary) metric, else the first one listed"""
+    if not metrics:
+        return None
+    metric = next((m for m in metrics if m.get("type") == "Primary"), metrics[0])
+    return metric.get("cvssData", {}).get("baseScore")
+
+def _parse_v2(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for item in data.get("vulnerabilities", []):
+        cve = item.get("cve", {})
+        cve_id = cve.get("id")
+        if not cve_id:
+            continue
+        descriptions = cve.get("descriptions", [])
+        description = next((d.get("value", "") for d in descriptions if d.get("lang") == "en"),
+                           descriptions[0].get("value", "") if descriptions else "")
+        metrics = cve.get("metrics", {})
+        yield {
+            "cve_id": cve_id,
+            "description": description,
+            "cvss_score": _base_score(metrics.get("cvssMetricV31") or metrics.get("cvssMetricV30")),
+            "cvss_v2": _base_score(metrics.get("cvssMetricV2")),
+            "published_date": cve.get("published"),
+            "last_modified": cve.get("lastModified"),
+            "rejected": cve.get("vulnStatus") == "Rejected" or description.startswith(REJECT_PREFIX),
+            "cpes": [
+                {"cpe": m["criteria"], "vulnerable": m.get("vulnerable", True)}
+                for configuration in cve.get("configurations", [])
+                for node in configuration.get("nodes", [])
+                for m in node.get("cpeMatch", [])
+                if m.get("criteria")
+            ],
+        }
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime.datetime]:
+    """NVD timestamps (2024-01-15T10:15Z in 1.1, 2024-01-15T10:15:08.123 in 2.0) as naive UTC"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.rstrip("Z"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def modified_after(entry: Dict[str, Any], checkpoint: Optional[str]) -> bool:
+    """True if the entry changed at or after a lastModified checkpoint"""
+    since = parse_timestamp(checkpoint)
+    modified = parse_timestamp(entry.get("last_modified"))
+    # Inclusive: a CVE sharing the checkpoint's timestamp may have missed the last sync; re-applying is harmless
+    return since is None or modified is None or modified >= since
@@ -1,24 +1,219 @@
+import contextlib
 import os
+import re
+import threading
 from opensearchpy import OpenSearch, exceptions
 import time
+import json
+import base64
 import logging
-from typing import List, Dict, Any, Optional
+from .dashboard import DASHBOARD_TOP, SummaryCache, build_summary_body, ingest_window, parse_summary_response, summarize
+from .query_planner import QueryPlan, plan_query
+from .resilience import DEFAULT_TIMEOUT, GuardedClient
+from .risk import RISK_FIELDS, compute_risk
+from .scope import ScopeSet
+from .suggest import SUGGEST_FIELDS, PrefixCache, build_suggest_body, parse_suggest_response
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterator, Sequence
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Writes newer than this are held back from change feeds so a cursor never
+# moves past a concurrent bulk request that has not been refreshed yet. Writes
+# from this process are also held back for as long as they are in flight.
+CHANGES_SETTLE_MS = int(os.environ.get("CHANGES_SETTLE_MS", "1000"))
+# Large loads are sent in chunks so interactive searches can get in between them
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "1000"))
+# Scopes too large for one exact filter are matched by a covering superset and
+# the hits filtered here, reading at most this many pages per search
+SCOPE_SCAN_PAGES = int(os.environ.get("SCOPE_SCAN_PAGES", "10"))
+
+# Dated indices behind aliases: writes go to the newest index through the
+# write alias, reads go through the search alias that every index joins
+INDEX_PREFIX = "avapt-devices"
+WRITE_ALIAS = f"{INDEX_PREFIX}-write"
+SEARCH_ALIAS = f"{INDEX_PREFIX}-search"
+INDEX_TEMPLATE = INDEX_PREFIX
+# Date math resolves to e.g. avapt-devices-2024.05-000001; rollover bumps the
+# counter and re-resolves the month
+INDEX_NAME_PATTERN = f"<{INDEX_PREFIX}-{{now/M{{yyyy.MM}}}}-000001>"
+
+ROLLOVER_MAX_AGE = os.environ.get("ROLLOVER_MAX_AGE", "30d")
+ROLLOVER_MAX_SIZE = os.environ.get("ROLLOVER_MAX_SIZE", "5gb")
+ROLLOVER_CHECK_INTERVAL = int(os.environ.get("ROLLOVER_CHECK_INTERVAL", "300"))
+SUGGEST_CACHE_TTL = float(os.environ.get("SUGGEST_CACHE_TTL", "30"))
+
+# Bump whenever DEVICE_INDEX_SETTINGS or DEVICE_MAPPINGS change; existing
+# indices are brought up to date with `scripts/manage_indices.py migrate`
+MAPPING_VERSION = 5
+# First mapping version with the completion (.suggest) sub-fields
+SUGGEST_MAPPING_VERSION = 3
+INDEX_NAME_RE = re.compile(rf"^{INDEX_PREFIX}-(\d{{4}}\.\d{{2}})-(\d+)")
+VERSION_SUFFIX_RE = re.compile(r"-v\d+$")
+
+DEVICE_INDEX_SETTINGS = {
+    "index": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,  # Single node setup
+        # Store documents newest first so timestamp-desc queries can stop early
+        "sort.field": "timestamp",
+        "sort.order": "desc"
+    },
+    "analysis": {
+        "analyzer": {
+            # Whole-value, case-insensitive input for completion fields, so
+            # prefixes like "cve-2024-12" or "cam-0" keep their digits
+            "suggest_keyword": {"type": "custom", "tokenizer": "keyword", "filter": ["lowercase"]}
+        }
+    }
+}
+
+SUGGEST_COMPLETION = {"type": "completion", "analyzer": "suggest_keyword", "max_input_length": 100}
+
+DEVICE_MAPPINGS = {
+    "_meta": {"mapping_version": MAPPING_VERSION},
+    "properties": {
+        "device_id": {"type": "keyword"},
+        "ip": {"type": "ip"},
+        "hostname": {
+            "type": "text",
+            "fields": {
+                "keyword": {"type": "keyword", "ignore_above": 256},
+                "suggest": SUGGEST_COMPLETION
+            }
+        },
+        "service": {"type": "keyword", "fields": {"suggest": SUGGEST_COMPLETION}},
+        "port": {"type": "integer"},
+        "status": {"type": "keyword", "null_value": "unknown"},
+        "location": {"type": "geo_point"},
+        "vulnerabilities": {
+            "type": "nested",
+            "properties": {
+                "cve_id": {"type": "keyword"},
+                "description": {"type": "text"},
+                "cvss_score": {"type": "float"},
+                "type": {"type": "keyword"}
+            }
+        },
+        # Flat copy of vulnerabilities.cve_id (see prepare_device) for completion
+        "cve_ids": {"type": "keyword", "fields": {"suggest": SUGGEST_COMPLETION}},
+        # Denormalized from vulnerabilities/port/status by app.risk at index time
+        "risk_score": {"type": "float"},
+        "max_cvss": {"type": "float"},
+        "vuln_count": {"type": "integer"},
+        "last_seen": {"type": "date"},
+        "timestamp": {"type": "date"},
+        "indexed_at": {"type": "date"},
+        # indexed_at of the first write; kept across re-ingest and updates (ingest-rate chart)
+        "first_seen": {"type": "date"},
+        # Catch-all for raw banners and additional data: kept in _source, never indexed
+        "data": {"type": "object", "enabled": False}
+    }
+}
+
+# CVSS v3 qualitative bands; range "to" bounds are exclusive
+SEVERITY_RANGES = [
+    {"key": "critical", "from": 9.0},
+    {"key": "high", "from": 7.0, "to": 9.0},
+    {"key": "medium", "from": 4.0, "to": 7.0},
+    {"key": "low", "from": 0.1, "to": 4.0},
+    {"key": "none", "to": 0.1},
+]
+
+DERIVED_FIELDS = ("cve_ids",) + RISK_FIELDS
+
+def derive_fields(device: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields computed from a device's own data: flattened CVE IDs and the risk fields"""
+    derived = {
+        'cve_ids': list(dict.fromkeys(
+            v['cve_id'] for v in device.get('vulnerabilities') or [] if v.get('cve_id')
+        ))
+    }
+    derived.update(compute_risk(device))
+    return derived
+
+def prepare_device(device: Dict[str, Any], indexed_at: int) -> Optional[str]:
+    """Stamp indexing metadata and derived fields on a device; returns its document id"""
+    device['indexed_at'] = indexed_at
+    device.update(derive_fields(device))
+    doc_id = device_doc_id(device)
+    if doc_id:
+        device['device_id'] = doc_id
+    return doc_id
+
+def index_sort_key(name: str) -> Tuple[str, int]:
+    """Chronological sort key for device index names; unrecognised names sort oldest"""
+    match = INDEX_NAME_RE.match(name)
+    if not match:
+        return ("", 0)
+    return (match.group(1), int(match.group(2)))
+
+def encode_cursor(sort_values: List[Any]) -> str:
+    """Opaque, URL-safe cursor for search_after sort values"""
+    raw = json.dumps(sort_values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+def device_doc_id(device: Dict[str, Any]) -> Optional[str]:
+    """Deterministic document ID so re-observed devices update in place"""
+    if device.get('device_id'):
+        return str(device['device_id'])
+    if device.get('ip') and device.get('port') is not None:
+        return f"{device['ip']}:{device['port']}"
+    return None
+
+def add_filter(body: Dict[str, Any], clause: Dict[str, Any]):
+    """AND a non-scoring filter into a search body's query"""
+    query = body.get("query") or {"match_all": {}}
+    if "bool" in query:
+        filters = query["bool"].get("filter", [])
+        query["bool"]["filter"] = (filters if isinstance(filters, list) else [filters]) + [clause]
+    else:
+        body["query"] = {"bool": {"must": [query], "filter": [clause]}}
+
 class OpenSearchHelper:
-    def __init__(self, opensearch_url: str = "http://localhost:9200"):
+    def __init__(self, opensearch_url: str = "http://localhost:9200", client: Optional[Any] = None,
+                 connect_retries: int = 5):
         self.url = opensearch_url
-        self.index = "avapt-devices"
-        self.client = None
-        self._connect()
+        # Reads go through the search alias, writes through the write alias
+        self.index = SEARCH_ALIAS
+        self.write_index = WRITE_ALIAS
+        self.legacy_index = INDEX_PREFIX
+        self.client = client
+        self._indices_cache: Tuple[float, List[str]] = (0.0, [])
+        self._suggest_indices_cache: Tuple[float, List[str], bool] = (0.0, [], False)
+        self._last_rollover_check = 0.0
+        self._write_alias_ready = False
+        self.suggest_cache = PrefixCache(ttl=SUGGEST_CACHE_TTL)
+        self.summary_cache = SummaryCache()
+        self.listeners: List[Callable[[List[Tuple[str, Dict[str, Any]]]], None]] = []
+        # [indexed_at, finished_at] of recent writes, for the change-feed watermark
+        self._writes: List[List[Optional[float]]] = []
+        self._writes_lock = threading.Lock()
+        # Called before each bulk chunk; admission control uses it to pause ingest for queued searches
+        self.ingest_gate: Optional[Callable[[], None]] = None
+        # An injected client (e.g. an in-memory stand-in) skips the connect/retry loop
+        if self.client is None:
+            self._connect(max_retries=connect_retries)
+        # Every call gets the endpoint's timeout budget and goes through the circuit breaker
+        if self.client is not None:
+            self.client = GuardedClient(self.client)
 
     def _connect(self, max_retries: int = 5, delay: int = 5):
         """Connect to OpenSearch with retry logic"""
         for attempt in range(max_retries):
             try:
-                self.client = OpenSearch([self.url])
+                self.client = OpenSearch([self.url], timeout=DEFAULT_TIMEOUT)
                 
                 # Test connection
                 if self.client.ping():
@@ -38,52 +233,203 @@ class OpenSearchHelper:
         self.client = None
 
     def create_index_mappings(self):
-        """Create index with mappings if it doesn't exist"""
+        """Install the index template and bootstrap the first dated index behind the aliases"""
         if not self.client:
             logger.error("OpenSearch client not available")
             return False
             
         try:
-            if not self.client.indices.exists(index=self.index):
-                mapping = {
-                    "settings": {
-                        "index": {
-                            "number_of_shards": 1,
-                            "number_of_replicas": 0  # Single node setup
-                        }
-                    },
-                    "mappings": {
-                        "properties": {
-                            "ip": {"type": "ip"},
-                            "hostname": {"type": "text"},
-                            "service": {"type": "keyword"},
-                            "port": {"type": "integer"},
-                            "status": {"type": "keyword", "null_value": "unknown"},
-                            "location": {"type": "geo_point"},
-                            "vulnerabilities": {
-                                "type": "nested",
-                                "properties": {
-                                    "cve_id": {"type": "keyword"},
-                                    "description": {"type": "text"},
-                                    "cvss_score": {"type": "float"},
-                                    "type": {"type": "keyword"}
-                                }
-                            },
-                            "last_seen": {"type": "date"},
-                            "timestamp": {"type": "date"},
-                            "data": {"type": "object", "enabled": True}  # Catch-all for additional data
-                        }
-                    }
+            # Aliases are attached explicitly (bootstrap, rollover, migration swap) rather
+            # than by the template, so a half-built reindex target is never searchable
+            self.client.indices.put_index_template(name=INDEX_TEMPLATE, body={
+                "index_patterns": [f"{INDEX_PREFIX}-*"],
+                "priority": 100,
+                "version": MAPPING_VERSION,
+                "template": {
+                    "settings": DEVICE_INDEX_SETTINGS,
+                    "mappings": DEVICE_MAPPINGS
                 }
-                self.client.indices.create(index=self.index, body=mapping)
-                logger.info(f"Created index: {self.index}")
+            })
+            
+            if not self.client.indices.exists_alias(name=self.write_index):
+                self.client.indices.create(index=INDEX_NAME_PATTERN, body={
+                    "aliases": {
+                        self.write_index: {"is_write_index": True},
+                        self.index: {}
+                    }
+                })
+                logger.info(f"Created first index behind alias: {self.write_index}")
             else:
-                logger.info(f"Index already exists: {self.index}")
+                logger.info(f"Write alias already exists: {self.write_index}")
+            
+            # Keep documents from the pre-rollover single index searchable
+            if self.client.indices.exists(index=self.legacy_index) and \
+                    not self.client.indices.exists_alias(name=self.index, index=self.legacy_index):
+                self.client.indices.put_alias(index=self.legacy_index, name=self.index)
+                logger.info(f"Added legacy index {self.legacy_index} to {self.index}")
+            self._indices_cache = (0.0, [])
+            self._suggest_indices_cache = (0.0, [], False)
             return True
         except Exception as e:
             logger.error(f"Error creating index: {e}")
             return False
 
+    def get_indices(self, max_age: float = 60.0) -> List[str]:
+        """Concrete indices behind the search alias, newest first (cached briefly)"""
+        cached_at, names = self._indices_cache
+        if names and time.time() - cached_at < max_age:
+            return names
+        try:
+            names = sorted(self.client.indices.get_alias(name=self.index).keys(), key=index_sort_key, reverse=True)
+        except exceptions.NotFoundError:
+            names = []
+        self._indices_cache = (time.time(), names)
+        return names
+
+    def rollover(self, max_age: Optional[str] = ROLLOVER_MAX_AGE, max_size: Optional[str] = ROLLOVER_MAX_SIZE,
+                 dry_run: bool = False) -> Dict[str, Any]:
+        """Roll the write alias over to a new dated index if the age or size condition is met.
+
+        With neither condition given the alias rolls over unconditionally.
+        """
+        if not self.client:
+            logger.error("OpenSearch client not available")
+            return {}
+        
+        conditions = {}
+        if max_age:
+            conditions["max_age"] = max_age
+        if max_size:
+            conditions["max_size"] = max_size
+        response = self.client.indices.rollover(
+            alias=self.write_index,
+            body={"conditions": conditions, "aliases": {self.index: {}}},
+            dry_run=dry_run
+        )
+        if response.get("rolled_over"):
+            logger.info(f"Rolled {self.write_index} over from {response.get('old_index')} to {response.get('new_index')}")
+            self._indices_cache = (0.0, [])
+            self._suggest_indices_cache = (0.0, [], False)
+        return response
+
+    def get_mapping_versions(self) -> Dict[str, int]:
+        """Mapping version of every index behind the search alias (1 if unversioned)"""
+        mappings = self.client.indices.get_mapping(index=self.index)
+        return {
+            index: int(body.get("mappings", {}).get("_meta", {}).get("mapping_version", 1))
+            for index, body in mappings.items()
+        }
+
+    def _write_target(self) -> Optional[str]:
+        try:
+            members = self.client.indices.get_alias(name=self.write_index)
+        except exceptions.NotFoundError:
+            return None
+        for index, body in members.items():
+            if body.get("aliases", {}).get(self.write_index, {}).get("is_write_index"):
+                return index
+        return next(iter(members), None)
+
+    def migrate_indices(self, dry_run: bool = False, poll_interval: float = 2.0) -> List[Dict[str, Any]]:
+        """Reindex indices on an older mapping version and swap them in without downtime.
+
+        The write alias is rolled over first, so new writes land in an index
+        created from the current template and the stale ones become read-only.
+        Each stale index is reindexed into `<name>-v<MAPPING_VERSION>`, checked
+        by document count, then swapped into the search alias and dropped in a
+        single atomic alias update.
+        """
+        if not self.client:
+            logger.error("OpenSearch client not available")
+            return []
+        
+        self.create_index_mappings()
+        stale = sorted(
+            (index for index, version in self.get_mapping_versions().items() if version < MAPPING_VERSION),
+            key=index_sort_key
+        )
+        plan = [{"index": index, "target": f"{VERSION_SUFFIX_RE.sub('', index)}-v{MAPPING_VERSION}"} for index in stale]
+        if dry_run or not plan:
+            return plan
+        
+        if self._write_target() in stale:
+            self.rollover(max_age=None, max_size=None)
+        
+        for step in plan:
+            index, target = step["index"], step["target"]
+            if self.client.indices.exists(index=target):
+                # Leftover from an interrupted run; it was never put behind an alias
+                self.client.indices.delete(index=target)
+            self.client.indices.create(index=target, body={
+                "settings": DEVICE_INDEX_SETTINGS,
+                "mappings": DEVICE_MAPPINGS
+            })
+            task = self.client.reindex(
+                body={"source": {"index": index}, "dest": {"index": target}},
+                wait_for_completion=False,
+                refresh=True
+            )
+            while True:
+                status = self.client.tasks.get(task_id=task["task"])
+                if status.get("completed"):
+                    break
+                time.sleep(poll_interval)
+            failures = status.get("response", {}).get("failures") or status.get("error")
+            source_count = self.client.count(index=index)["count"]
+            target_count = self.client.count(index=target)["count"]
+            if failures or source_count != target_count:
+                self.client.indices.delete(index=target)
+                step.update(status="failed", source_docs=source_count, target_docs=target_count)
+                logger.error(f"Reindex of {index} into {target} failed: {failures or 'document count mismatch'}")
+                continue
+            # Fields added since the source index was written (derived fields, device_id,
+            # indexed_at) are filled before it goes live
+            self.recompute_derived_fields(index=target, touch=False)
+            self.client.indices.update_aliases(body={"actions": [
+                {"add": {"index": target, "alias": self.index}},
+                {"remove_index": {"index": index}}
+            ]})
+            step.update(status="migrated", docs=target_count)
+            logger.info(f"Migrated {index} -> {target} ({target_count} docs)")
+        
+        self._indices_cache = (0.0, [])
+        self._suggest_indices_cache = (0.0, [], False)
+        return plan
+
+    def _ensure_write_alias(self) -> bool:
+        """True once the write alias exists, bootstrapping it if nothing holds its name yet.
+
+        False if a concrete index has taken the name (e.g. a write before
+        create_index_mappings auto-created it): writing there would bypass
+        rollover and mapping versions, so writes are refused instead.
+        """
+        if self._write_alias_ready:
+            return True
+        try:
+            if self.client.indices.exists_alias(name=self.write_index):
+                self._write_alias_ready = True
+            elif self.client.indices.exists(index=self.write_index):
+                logger.error(f"{self.write_index} is a concrete index, not an alias; refusing to write to it. "
+                             f"Reindex its documents into a dated index, delete it and run manage_indices.py bootstrap")
+            else:
+                self._write_alias_ready = self.create_index_mappings()
+        except Exception as e:
+            logger.error(f"Error checking write alias: {e}")
+        return self._write_alias_ready
+
+    def maybe_rollover(self):
+        """Check rollover conditions at most every ROLLOVER_CHECK_INTERVAL seconds"""
+        now = time.time()
+        if now - self._last_rollover_check < ROLLOVER_CHECK_INTERVAL:
+            return
+        self._last_rollover_check = now
+        if not self._ensure_write_alias():
+            return
+        try:
+            self.rollover()
+        except Exception as e:
+            logger.error(f"Error checking rollover: {e}")
+
     def index_device(self, device_data: Dict[str, Any]) -> bool:
         """Index a device document"""
         if not self.client:
@@ -94,13 +440,11 @@ class OpenSearchHelper:
             # Ensure required fields
             if 'timestamp' not in device_data:
                 device_data['timestamp'] = time.time() * 1000  # Current time in ms
-                
-            response = self.client.index(
-                index=self.index,
-                body=device_data,
-                refresh=True
-            )
-            success = response.get('result') in ['created', 'updated']
+            if not self._ensure_write_alias():
+                return False
+            # Same path as bulk writes, so a copy left in a rolled-over index is replaced too
+            with self._stamp() as indexed_at:
+                success = self._bulk_index_chunk([device_data], indexed_at, refresh=True)
             if success:
                 logger.debug(f"Indexed device: {device_data.get('ip', 'unknown')}")
             return success
@@ -108,97 +452,506 @@ class OpenSearchHelper:
             logger.error(f"Error indexing device: {e}")
             return False
 
-    def search_devices(self, query: Optional[str] = None, size: int = 100) -> List[Dict[str, Any]]:
-        """Search devices with optional query"""
+    def search_devices(self, query: Optional[str] = None, size: int = 100,
+                       fields: Optional[Sequence[str]] = None, scope: Optional[ScopeSet] = None) -> List[Dict[str, Any]]:
+        """Search devices with optional query; `fields` limits each document to those _source fields,
+        `scope` to devices whose IP is in an ROE scope"""
+        devices, _ = self.search_devices_planned(query, size, fields, scope)
+        return devices
+
+    def search_devices_planned(self, query: Optional[str] = None, size: int = 100,
+                               fields: Optional[Sequence[str]] = None,
+                               scope: Optional[ScopeSet] = None) -> Tuple[List[Dict[str, Any]], Optional[QueryPlan]]:
+        """Search devices and return the query plan that was used (None for the recent-devices listing)"""
         if not self.client:
             logger.warning("OpenSearch client not available, returning empty results")
-            return []
-            
+            return [], None
+        
+        plan = None
         try:
-            if query:
-                search_body = {
-                    "query": {
-                        "multi_match": {
-                            "query": query,
-                            "fields": [
-                                "ip", 
-                                "hostname", 
-                                "service", 
-                                "vulnerabilities.cve_id",
-                                "vulnerabilities.description"
-                            ],
-                            "fuzziness": "AUTO"
-                        }
-                    },
-                    "size": size
-                }
-            else:
-                search_body = {
-                    "query": {"match_all": {}},
-                    "size": size,
-                    "sort": [{"timestamp": {"order": "desc"}}]
-                }
+            if not query or not query.strip():
+                return self._recent_devices(size, fields, scope), None
             
-            response = self.client.search(index=self.index, body=search_body)
-            hits = response['hits']['hits']
-            
-            # Extract _source and add _id if needed
-            devices = []
-            for hit in hits:
-                device = hit['_source']
-                device['_id'] = hit['_id']  # Include OpenSearch ID
-                devices.append(device)
-                
-            logger.debug(f"Found {len(devices)} devices")
-            return devices
+            plan = plan_query(query)
+            body = plan.to_body(size)
+            if fields:
+                body["_source"] = {"includes": list(fields)}
+            devices = self._search_hits(self.index, body, size, scope)
+            logger.debug(f"Found {len(devices)} devices ({plan.header()})")
+            return devices, plan
             
         except exceptions.NotFoundError:
             logger.info("Index not found, returning empty results")
-            return []
+            return [], plan
         except Exception as e:
             logger.error(f"Error searching devices: {e}")
-            return []
+            return [], plan
+
+    def suggest(self, prefix: str, fields: Tuple[str, ...] = tuple(SUGGEST_FIELDS), size: int = 10) -> Dict[str, Any]:
+        """Top completion suggestions per field for a typed prefix, served from the prefix cache when possible"""
+        prefix = prefix.strip().lower()
+        if not prefix or not self.client:
+            return {"prefix": prefix, "suggestions": {field: [] for field in fields}, "cached": False}
+        
+        indices, partial = self._suggest_indices()
+        result = {"prefix": prefix, "suggestions": {field: [] for field in fields}, "cached": False}
+        if partial:
+            # Indices still on an older mapping are skipped until `manage_indices.py migrate` runs
+            result["partial"] = True
+        groups = self.suggest_cache.get(fields, size, prefix)
+        if groups is not None:
+            return {**result, "suggestions": groups, "cached": True}
+        if not indices:
+            return result
+        try:
+            response = self.client.search(index=",".join(indices), body=build_suggest_body(prefix, fields, size))
+            groups = parse_suggest_response(response, fields)
+        except exceptions.NotFoundError:
+            groups = {field: [] for field in fields}
+            self._suggest_indices_cache = (0.0, [], False)
+        except Exception as e:
+            logger.error(f"Error fetching suggestions: {e}")
+            return result
+        self.suggest_cache.put(fields, size, prefix, groups)
+        return {**result, "suggestions": groups}
+
+    def _suggest_indices(self, max_age: float = 60.0) -> Tuple[List[str], bool]:
+        """Indices behind the search alias that have the completion sub-fields, and whether any
+        were left out (cached briefly)"""
+        cached_at, names, partial = self._suggest_indices_cache
+        if cached_at and time.time() - cached_at < max_age:
+            return names, partial
+        try:
+            versions = self.get_mapping_versions()
+        except exceptions.NotFoundError:
+            versions = {}
+        names = sorted(index for index, version in versions.items() if version >= SUGGEST_MAPPING_VERSION)
+        partial = len(names) < len(versions)
+        if partial:
+            stale = sorted(set(versions) - set(names))
+            logger.warning(f"Suggestions skip indices without completion fields: {', '.join(stale)}; run manage_indices.py migrate")
+        self._suggest_indices_cache = (time.time(), names, partial)
+        return names, partial
+
+    def _recent_devices(self, size: int, fields: Optional[Sequence[str]] = None,
+                        scope: Optional[ScopeSet] = None) -> List[Dict[str, Any]]:
+        """Newest devices first, reading only as many of the newest indices as needed"""
+        devices = []
+        for index in self.get_indices():
+            search_body = {
+                "query": {"match_all": {}},
+                "size": size - len(devices),
+                "sort": [{"timestamp": {"order": "desc"}}],
+                # Lets the sorted index terminate early instead of counting every hit
+                "track_total_hits": False
+            }
+            if fields:
+                search_body["_source"] = {"includes": list(fields)}
+            try:
+                devices.extend(self._search_hits(index, search_body, size - len(devices), scope))
+            except exceptions.NotFoundError:
+                # Index removed since the alias list was cached
+                self._indices_cache = (0.0, [])
+                continue
+            if len(devices) >= size:
+                break
+        logger.debug(f"Found {len(devices)} recent devices")
+        return devices
+
+    def _search_hits(self, index: str, body: Dict[str, Any], size: int,
+                     scope: Optional[ScopeSet] = None) -> List[Dict[str, Any]]:
+        """Up to `size` devices matching `body`, limited to `scope`.
+
+        When the scope has too many CIDRs for an exact filter, the query uses its
+        covering superset and pages on with search_after, dropping out-of-scope
+        hits, until `size` devices are found (or SCOPE_SCAN_PAGES pages are read).
+        """
+        if scope is not None:
+            add_filter(body, scope.to_query("ip"))
+        post_filter = scope is not None and not scope.exact_query()
+        strip_ip = False
+        if post_filter:
+            body["size"] = max(size, 100)
+            # search_after needs a total order; _id (on every document, unlike device_id) breaks ties
+            body["sort"] = (body.get("sort") or ["_score"]) + [{"_id": {"order": "asc"}}]
+            includes = body.get("_source", {}).get("includes")
+            if includes and "ip" not in includes:
+                includes.append("ip")
+                strip_ip = True
+        devices = []
+        for _ in range(SCOPE_SCAN_PAGES if post_filter else 1):
+            hits = self.client.search(index=index, body=body)['hits']['hits']
+            page = []
+            for hit in hits:
+                device = hit['_source']
+                device['_id'] = hit['_id']
+                page.append(device)
+            devices.extend(scope.filter_devices(page) if post_filter else page)
+            if not post_filter or len(devices) >= size or len(hits) < body["size"]:
+                break
+            body["search_after"] = hits[-1]["sort"]
+        if strip_ip:
+            for device in devices:
+                device.pop("ip", None)
+        return devices[:size]
+
+    def get_device_changes(self, cursor: Optional[str] = None, size: int = 500) -> Dict[str, Any]:
+        """Devices written since `cursor`, oldest first, with the cursor for the next call.
+
+        Pages with search_after over (indexed_at, _id), so each call only
+        touches documents that changed. Omit the cursor to start from the beginning.
+        """
+        if not self.client:
+            logger.warning("OpenSearch client not available, returning empty results")
+            return {"devices": [], "cursor": cursor, "has_more": False}
+
+        search_body = {
+            "query": {"bool": {
+                "should": [
+                    {"range": {"indexed_at": {"lte": self._changes_watermark()}}},
+                    # Documents indexed before indexed_at existed sort first (missing: 0)
+                    {"bool": {"must_not": {"exists": {"field": "indexed_at"}}}}
+                ],
+                "minimum_should_match": 1
+            }},
+            "size": size,
+            "sort": [
+                {"indexed_at": {"order": "asc", "missing": 0}},
+                # _id, not device_id: it is on every document, legacy ones included, and unique
+                {"_id": {"order": "asc"}}
+            ]
+        }
+        if cursor:
+            search_body["search_after"] = decode_cursor(cursor)
+
+        try:
+            response = self.client.search(index=self.index, body=search_body)
+        except exceptions.NotFoundError:
+            return {"devices": [], "cursor": cursor, "has_more": False}
+
+        hits = response['hits']['hits']
+        devices = []
+        for hit in hits:
+            device = hit['_source']
+            device['_id'] = hit['_id']
+            devices.append(device)
+
+        next_cursor = encode_cursor(hits[-1]['sort']) if hits else cursor
+        return {"devices": devices, "cursor": next_cursor, "has_more": len(hits) == size}
+
+    @contextlib.contextmanager
+    def _stamp(self) -> Iterator[int]:
+        """indexed_at for one write request; change feeds stay behind it until it has settled"""
+        record: List[Optional[float]] = [int(time.time() * 1000), None]
+        with self._writes_lock:
+            self._writes.append(record)
+        try:
+            yield int(record[0])
+        finally:
+            record[1] = time.time() * 1000
+
+    def _changes_watermark(self) -> int:
+        """Newest indexed_at a change feed may return: older than every write still in flight,
+        or finished less than CHANGES_SETTLE_MS ago (not yet refreshed)"""
+        now = time.time() * 1000
+        with self._writes_lock:
+            self._writes = [w for w in self._writes if w[1] is None or now - w[1] < CHANGES_SETTLE_MS]
+            oldest = min((w[0] for w in self._writes), default=None)
+        watermark = int(now) - CHANGES_SETTLE_MS
+        return watermark if oldest is None else min(watermark, int(oldest) - 1)
+
+    def iter_device_batches(self, batch_size: int = 5000, source_excludes: Sequence[str] = ("data",),
+                            scroll: str = "2m", index: Optional[str] = None, query: Optional[Dict[str, Any]] = None,
+                            with_meta: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """Stream every device (or those matching `query`) in `_doc` order, one list per scroll page.
+
+        with_meta also sets `_index`, `_seq_no` and `_primary_term` on each
+        device, for callers that write updates back.
+        """
+        if not self.client:
+            logger.warning("OpenSearch client not available, returning empty results")
+            return
+
+        search_body = {
+            "query": query or {"match_all": {}},
+            "size": batch_size,
+            "sort": ["_doc"],
+            "_source": {"excludes": list(source_excludes)}
+        }
+        if with_meta:
+            search_body["seq_no_primary_term"] = True
+        try:
+            response = self.client.search(index=index or self.index, body=search_body, scroll=scroll)
+        except exceptions.NotFoundError:
+            return
+
+        scroll_id = response.get('_scroll_id')
+        try:
+            while True:
+                hits = response['hits']['hits']
+                if not hits:
+                    break
+                batch = []
+                for hit in hits:
+                    device = hit['_source']
+                    device['_id'] = hit['_id']
+                    if with_meta:
+                        device['_index'] = hit.get('_index')
+                        device['_seq_no'] = hit.get('_seq_no')
+                        device['_primary_term'] = hit.get('_primary_term')
+                    batch.append(device)
+                yield batch
+                response = self.client.scroll(body={"scroll_id": scroll_id, "scroll": scroll})
+                scroll_id = response.get('_scroll_id', scroll_id)
+        finally:
+            if scroll_id:
+                try:
+                    self.client.clear_scroll(body={"scroll_id": [scroll_id]})
+                except Exception as e:
+                    logger.debug(f"Error clearing scroll: {e}")
 
     def get_all_devices(self, size: int = 100) -> List[Dict[str, Any]]:
         """Get all devices (alias for search_devices)"""
         return self.search_devices(None, size)
 
-    def get_vulnerable_devices(self) -> List[Dict[str, Any]]:
-        """Get devices with vulnerabilities"""
+    def get_vulnerable_devices(self, cursor: Optional[str] = None, size: int = 100,
+                               min_cvss: Optional[float] = None) -> Dict[str, Any]:
+        """Devices with at least one vulnerability, highest max CVSS first, with cursor paging.
+
+        The first page (no cursor) also carries the total and per-severity
+        counts: for each CVSS band, how many vulnerabilities fall in it and
+        how many distinct devices have at least one of them.
+        """
+        empty = {"devices": [], "cursor": cursor, "has_more": False}
         if not self.client:
             logger.warning("OpenSearch client not available, returning empty results")
-            return []
-            
-        try:
-            search_body = {
-                "query": {
-                    "nested": {
-                        "path": "vulnerabilities",
-                        "query": {
-                            "exists": {"field": "vulnerabilities"}
+            return empty
+        
+        nested_filter: List[Dict[str, Any]] = [{"exists": {"field": "vulnerabilities.cve_id"}}]
+        if min_cvss is not None:
+            nested_filter.append({"range": {"vulnerabilities.cvss_score": {"gte": min_cvss}}})
+        search_body: Dict[str, Any] = {
+            "query": {
+                "nested": {
+                    "path": "vulnerabilities",
+                    "query": {"bool": {"filter": nested_filter}},
+                    "score_mode": "none"
+                }
+            },
+            "size": size,
+            "sort": [
+                {"vulnerabilities.cvss_score": {
+                    "order": "desc",
+                    "mode": "max",
+                    "nested": {"path": "vulnerabilities"},
+                    "missing": "_last"
+                }},
+                {"device_id": {"order": "asc", "unmapped_type": "keyword"}}
+            ],
+            "_source": {"excludes": ["data"]},
+            "track_total_hits": cursor is None
+        }
+        if cursor:
+            search_body["search_after"] = decode_cursor(cursor)
+        else:
+            search_body["aggs"] = {
+                "vulnerabilities": {
+                    "nested": {"path": "vulnerabilities"},
+                    "aggs": {
+                        # Count only the entries the query matched on (min_cvss), not every entry of those devices
+                        "matching": {
+                            "filter": {"bool": {"filter": nested_filter}},
+                            "aggs": {
+                                "severity": {
+                                    "range": {"field": "vulnerabilities.cvss_score", "keyed": True, "ranges": SEVERITY_RANGES},
+                                    "aggs": {"devices": {"reverse_nested": {}}}
+                                }
+                            }
                         }
                     }
-                },
-                "size": 1000
+                }
             }
-            
+        
+        try:
             response = self.client.search(index=self.index, body=search_body)
-            hits = response['hits']['hits']
-            
-            devices = []
-            for hit in hits:
-                device = hit['_source']
-                device['_id'] = hit['_id']
-                devices.append(device)
-                
-            logger.debug(f"Found {len(devices)} vulnerable devices")
-            return devices
-            
         except exceptions.NotFoundError:
+            return empty
+        
+        hits = response['hits']['hits']
+        devices = []
+        for hit in hits:
+            device = hit['_source']
+            device['_id'] = hit['_id']
+            devices.append(device)
+        
+        result = {
+            "devices": devices,
+            "cursor": encode_cursor(hits[-1]['sort']) if hits else cursor,
+            "has_more": len(hits) == size
+        }
+        if cursor is None:
+            matching = response.get('aggregations', {}).get('vulnerabilities', {}).get('matching', {})
+            buckets = matching.get('severity', {}).get('buckets', {})
+            result["total"] = response['hits']['total']['value']
+            result["severity"] = {
+                band["key"]: {
+                    "vulnerabilities": buckets.get(band["key"], {}).get('doc_count', 0),
+                    "devices": buckets.get(band["key"], {}).get('devices', {}).get('doc_count', 0)
+                }
+                for band in SEVERITY_RANGES
+            }
+        logger.debug(f"Found {len(devices)} vulnerable devices")
+        return result
+
+    def top_risk_devices(self, size: int = 20, min_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Highest risk_score devices first; a plain doc-values sort, no nested work"""
+        if not self.client:
+            logger.warning("OpenSearch client not available, returning empty results")
             return []
-        except Exception as e:
-            logger.error(f"Error getting vulnerable devices: {e}")
+        
+        search_body: Dict[str, Any] = {
+            "query": {"range": {"risk_score": {"gte": min_score}}} if min_score is not None else {"match_all": {}},
+            "size": size,
+            "sort": [
+                {"risk_score": {"order": "desc", "missing": "_last", "unmapped_type": "float"}},
+                {"device_id": {"order": "asc", "unmapped_type": "keyword"}}
+            ],
+            "_source": {"excludes": ["data"]},
+            "track_total_hits": False
+        }
+        try:
+            response = self.client.search(index=self.index, body=search_body)
+        except exceptions.NotFoundError:
             return []
+        
+        devices = []
+        for hit in response['hits']['hits']:
+            device = hit['_source']
+            device['_id'] = hit['_id']
+            devices.append(device)
+        return devices
+
+    def recompute_derived_fields(self, cve_updates: Optional[Dict[str, Dict[str, Any]]] = None,
+                                 index: Optional[str] = None, touch: bool = True,
+                                 batch_size: int = 1000) -> Dict[str, int]:
+        """Recompute cve_ids and the risk fields, writing back only documents that changed.
+
+        With `cve_updates` (cve_id -> {"cvss_score", "description", ...}) only
+        devices carrying one of those CVEs are read; their embedded
+        vulnerability entries are refreshed from it first. Without it every
+        device in `index` (default: the search alias) is checked. Updates go
+        through the bulk update API against each document's concrete index
+        with seq_no/primary_term guards, so a device re-ingested meanwhile is
+        left alone. `touch` bumps indexed_at so change feeds pick the update up.
+        """
+        stats = {"checked": 0, "updated": 0, "conflicts": 0, "errors": 0}
+        if not self.client:
+            logger.error("OpenSearch client not available")
+            return stats
+        
+        query = None
+        if cve_updates:
+            query = {"terms": {"cve_ids": sorted(cve_updates)}}
+        elif cve_updates is not None:
+            return stats
+        
+        for batch in self.iter_device_batches(batch_size, source_excludes=(), index=index, query=query, with_meta=True):
+            with self._stamp() as indexed_at:
+                self._update_batch(batch, cve_updates, touch, indexed_at, stats)
+        
+        if not touch and index:
+            self.client.indices.refresh(index=index)
+        logger.info(f"Recomputed derived fields: {stats}")
+        return stats
+
+    def _update_batch(self, batch: List[Dict[str, Any]], cve_updates: Optional[Dict[str, Dict[str, Any]]],
+                      touch: bool, indexed_at: int, stats: Dict[str, int]):
+        operations = []
+        for device in batch:
+            stats["checked"] += 1
+            meta = {k: device.pop(k, None) for k in ('_id', '_index', '_seq_no', '_primary_term')}
+            doc: Dict[str, Any] = {}
+            vulnerabilities = device.get('vulnerabilities') or []
+            if cve_updates:
+                refreshed = []
+                for vuln in vulnerabilities:
+                    update = cve_updates.get(vuln.get('cve_id'), {})
+                    refreshed.append({**vuln, **{k: update[k] for k in ('cvss_score', 'description') if k in update}})
+                if refreshed != vulnerabilities:
+                    doc['vulnerabilities'] = device['vulnerabilities'] = refreshed
+            doc.update({k: v for k, v in derive_fields(device).items() if device.get(k) != v})
+            # Backfill documents written before the change feed's fields existed; they
+            # keep the place the feed gave them while indexed_at was missing (0)
+            if not device.get('device_id'):
+                doc['device_id'] = meta['_id']
+            if device.get('indexed_at') is None:
+                doc['indexed_at'] = 0
+            if device.get('first_seen') is None:
+                doc['first_seen'] = device.get('indexed_at') or 0
+            if not doc:
+                continue
+            if touch:
+                doc['indexed_at'] = indexed_at
+            action = {"_index": meta['_index'], "_id": meta['_id']}
+            if meta['_seq_no'] is not None and meta['_primary_term'] is not None:
+                action.update(if_seq_no=meta['_seq_no'], if_primary_term=meta['_primary_term'])
+            operations.append({"update": action})
+            operations.append({"doc": doc})
+        if operations:
+            self._bulk_update(operations, stats, refresh=touch)
+
+    def add_device_vulnerabilities(self, matches: Dict[str, List[Dict[str, Any]]],
+                                   batch_size: int = 500) -> Dict[str, int]:
+        """Append vulnerability entries to existing devices (device_id -> entries) via bulk update.
+
+        Only the listed devices are read; entries whose cve_id the device
+        already carries are skipped, and derived/risk fields are recomputed.
+        """
+        stats = {"checked": 0, "updated": 0, "conflicts": 0, "errors": 0}
+        if not self.client or not matches:
+            return stats
+        
+        device_ids = sorted(matches)
+        for start in range(0, len(device_ids), batch_size):
+            chunk = device_ids[start:start + batch_size]
+            # Legacy documents have no device_id field; the token index keys them by _id
+            query = {"bool": {"should": [{"terms": {"device_id": chunk}}, {"ids": {"values": chunk}}],
+                              "minimum_should_match": 1}}
+            for batch in self.iter_device_batches(batch_size, source_excludes=(), query=query, with_meta=True):
+                with self._stamp() as indexed_at:
+                    operations = []
+                    for device in batch:
+                        stats["checked"] += 1
+                        meta = {k: device.pop(k, None) for k in ('_id', '_index', '_seq_no', '_primary_term')}
+                        vulnerabilities = list(device.get('vulnerabilities') or [])
+                        known = {v.get('cve_id') for v in vulnerabilities}
+                        added = [v for v in matches.get(device.get('device_id') or meta['_id'], []) if v['cve_id'] not in known]
+                        if not added:
+                            continue
+                        device['vulnerabilities'] = vulnerabilities + added
+                        doc = {'vulnerabilities': device['vulnerabilities'], 'indexed_at': indexed_at}
+                        doc.update(derive_fields(device))
+                        action = {"_index": meta['_index'], "_id": meta['_id']}
+                        if meta['_seq_no'] is not None and meta['_primary_term'] is not None:
+                            action.update(if_seq_no=meta['_seq_no'], if_primary_term=meta['_primary_term'])
+                        operations.append({"update": action})
+                        operations.append({"doc": doc})
+                    if operations:
+                        self._bulk_update(operations, stats, refresh=True)
+        
+        logger.info(f"Added matched vulnerabilities: {stats}")
+        return stats
+
+    def _bulk_update(self, operations: List[Dict[str, Any]], stats: Dict[str, int], refresh: bool):
+        response = self.client.bulk(body=operations, refresh=refresh)
+        for item in response.get('items', []):
+            result = item.get('update', {})
+            if result.get('status') == 409:
+                stats["conflicts"] += 1
+            elif result.get('error'):
+                stats["errors"] += 1
+            else:
+                stats["updated"] += 1
 
     def bulk_index_devices(self, devices: List[Dict[str, Any]]) -> bool:
         """Bulk index multiple devices"""
@@ -206,37 +959,175 @@ class OpenSearchHelper:
             logger.error("OpenSearch client not available")
             return False
             
+        if not self._ensure_write_alias():
+            return False
+        ok = True
+        for start in range(0, len(devices), BULK_CHUNK_SIZE):
+            if self.ingest_gate and start:
+                self.ingest_gate()
+            chunk = devices[start:start + BULK_CHUNK_SIZE]
+            # Stamped per chunk, so a change feed is only held back by the request in flight
+            with self._stamp() as indexed_at:
+                # Refresh once, with the last chunk, rather than after every one
+                ok = self._bulk_index_chunk(chunk, indexed_at, refresh=start + BULK_CHUNK_SIZE >= len(devices)) and ok
+        if ok:
+            logger.info(f"Bulk indexed {len(devices)} devices")
+            self.maybe_rollover()
+        return ok
+
+    def _bulk_index_chunk(self, devices: List[Dict[str, Any]], indexed_at: int, refresh: bool) -> bool:
         try:
+            doc_ids = [prepare_device(device, indexed_at) for device in devices]
+            stale, first_seen = self._existing_copies([doc_id for doc_id in doc_ids if doc_id])
             operations = []
-            for device in devices:
-                operations.append({"index": {"_index": self.index}})
+            for device, doc_id in zip(devices, doc_ids):
+                device['first_seen'] = first_seen.get(doc_id, indexed_at)
+                # Fails the item, rather than auto-creating an index, if the alias has gone
+                action = {"_index": self.write_index, "require_alias": True}
+                if doc_id:
+                    action['_id'] = doc_id
+                # A device re-observed after a rollover moves to the write index in the same request
+                for index in stale.get(doc_id, []):
+                    operations.append({"delete": {"_index": index, "_id": doc_id}})
+                operations.append({"index": action})
                 operations.append(device)
             
-            response = self.client.bulk(body=operations, refresh=True)
+            response = self.client.bulk(body=operations, refresh=refresh)
+            
+            # Items come back in request order; report what was committed even on partial failure
+            committed = []
+            items = iter(response.get('items', []))
+            for device, doc_id in zip(devices, doc_ids):
+                moved = False
+                for _ in stale.get(doc_id, []):
+                    moved = next(items, {}).get('delete', {}).get('result') == 'deleted' or moved
+                result = next(items, {}).get('index', {})
+                if result.get('result') in ('created', 'updated'):
+                    committed.append(('updated' if moved else result['result'], {**device, '_id': result.get('_id')}))
+            self._notify(committed)
             
             if response.get('errors'):
                 logger.error(f"Bulk indexing errors: {response}")
                 return False
-                
-            logger.info(f"Bulk indexed {len(devices)} devices")
             return True
             
         except Exception as e:
             logger.error(f"Error in bulk indexing: {e}")
             return False
 
+    def _existing_copies(self, doc_ids: List[str]) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
+        """For IDs already stored: the indices other than the write index holding a copy
+        (left behind by a rollover), and the earliest first_seen of each"""
+        if not doc_ids:
+            return {}, {}
+        indices = self.get_indices(max_age=5.0)
+        target = self._write_target() if len(indices) > 1 else None
+        response = self.client.search(index=self.index, body={
+            "query": {"ids": {"values": doc_ids}},
+            # Documents from before first_seen existed were first seen at their indexed_at at the latest
+            "_source": ["first_seen", "indexed_at"],
+            "size": min(len(doc_ids) * max(len(indices), 1), 10000),
+            "track_total_hits": False
+        })
+        copies: Dict[str, List[str]] = {}
+        first_seen: Dict[str, int] = {}
+        for hit in response['hits']['hits']:
+            if target is not None and hit['_index'] != target:
+                copies.setdefault(hit['_id'], []).append(hit['_index'])
+            source = hit.get('_source') or {}
+            seen = source.get('first_seen', source.get('indexed_at')) or 0
+            first_seen[hit['_id']] = min(seen, first_seen.get(hit['_id'], seen))
+        return copies, first_seen
+
+    def ping(self) -> bool:
+        """True if the cluster answers"""
+        try:
+            return bool(self.client and self.client.ping())
+        except Exception:
+            return False
+
+    def get_stats(self) -> Dict[str, int]:
+        """Device and vulnerable-device counts from two count requests"""
+        if not self.client:
+            return {"total_devices": 0, "vulnerable_devices": 0}
+        try:
+            total = self.client.count(index=self.index)["count"]
+            vulnerable = self.client.count(index=self.index, body={"query": {
+                "nested": {"path": "vulnerabilities", "query": {"exists": {"field": "vulnerabilities.cve_id"}}}
+            }})["count"]
+        except exceptions.NotFoundError:
+            return {"total_devices": 0, "vulnerable_devices": 0}
+        return {"total_devices": total, "vulnerable_devices": vulnerable}
+
+    def dashboard_summary(self, top: int = DASHBOARD_TOP) -> Dict[str, Any]:
+        """Command Center figures from one size-0 multi-aggregation search, cached for a few seconds"""
+        if not self.client:
+            return summarize()
+        return self.summary_cache.get_or_compute(top, lambda: self._dashboard_summary(top))
+
+    def _dashboard_summary(self, top: int) -> Dict[str, Any]:
+        since, now = ingest_window()
+        try:
+            response = self.client.search(index=self.index, body=build_summary_body(top, since, now, SEVERITY_RANGES))
+        except exceptions.NotFoundError:
+            return summarize(since=since, now=now)
+        return parse_summary_response(response, since, now)
+
+    def devices_in_bbox(self, top: float, left: float, bottom: float, right: float,
+                        size: int = 1000) -> List[Dict[str, Any]]:
+        """Devices whose location falls inside a lat/lon bounding box, newest first"""
+        if not self.client:
+            return []
+        search_body = {
+            "query": {"bool": {"filter": {"geo_bounding_box": {"location": {
+                "top_left": {"lat": top, "lon": left},
+                "bottom_right": {"lat": bottom, "lon": right}
+            }}}}},
+            "size": size,
+            "sort": [{"timestamp": {"order": "desc"}}],
+            "_source": {"excludes": ["data"]},
+            "track_total_hits": False
+        }
+        try:
+            response = self.client.search(index=self.index, body=search_body)
+        except exceptions.NotFoundError:
+            return []
+        devices = []
+        for hit in response['hits']['hits']:
+            device = hit['_source']
+            device['_id'] = hit['_id']
+            devices.append(device)
+        return devices
+
+    def add_listener(self, listener: Callable[[List[Tuple[str, Dict[str, Any]]]], None]):
+        """Register a callback receiving (result, device) pairs after each committed write"""
+        self.listeners.append(listener)
+
+    def _notify(self, committed: List[Tuple[str, Dict[str, Any]]]):
+        if not committed:
+            return
+        for listener in self.listeners:
+            try:
+                listener(committed)
+            except Exception as e:
+                logger.error(f"Index listener failed: {e}")
+
     def delete_index(self) -> bool:
-        """Delete the index (for testing/cleanup)"""
+        """Delete every device index behind the search alias (for testing/cleanup)"""
         if not self.client:
             logger.error("OpenSearch client not available")
             return False
             
         try:
-            if self.client.indices.exists(index=self.index):
-                self.client.indices.delete(index=self.index)
-                logger.info(f"Deleted index: {self.index}")
+            self._indices_cache = (0.0, [])
+            indices = self.get_indices()
+            if indices:
+                self.client.indices.delete(index=",".join(indices))
+                self._indices_cache = (0.0, [])
+                self._suggest_indices_cache = (0.0, [], False)
+                logger.info(f"Deleted indices: {', '.join(indices)}")
                 return True
             return False
         except Exception as e:
             logger.error(f"Error deleting index: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,213 @@
+import ipaddress
+import logging
+import re
+import shlex
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CVE_RE = re.compile(r"^cve[-_]?(\d{4})[-_]?(\d{4,})$", re.IGNORECASE)
+PORT_RANGE_RE = re.compile(r"^(\d{1,5})?-(\d{1,5})?$")
+# 192.168.1, 192.168. or 10.* -- but not a bare version number like 2.1. Outside an
+# ip: prefix the token must also end in . or * (so firmware "2.1.3" stays free text)
+PARTIAL_IPV4_RE = re.compile(r"^\d{1,3}(\.\d{1,3}){2}\.?\*?$|^\d{1,3}(\.\d{1,3}){0,2}\.\*?$")
+# After an explicit ip: any 1-3 octet prefix, e.g. ip:10 or ip:10.0
+IP_PREFIX_RE = re.compile(r"^\d{1,3}(\.\d{1,3}){0,2}\.?\*?$")
+FIELD_VALUE_RE = re.compile(r"^([a-z_]+):(.+)$", re.IGNORECASE)
+
+# Fields a `field:value` token may name, mapped to the document field
+FIELD_ALIASES = {
+    "ip": "ip",
+    "port": "port",
+    "service": "service",
+    "status": "status",
+    "hostname": "hostname",
+    "host": "hostname",
+    "cve": "vulnerabilities.cve_id",
+    "device_id": "device_id",
+    "id": "device_id",
+}
+
+# Free text never goes near the ip field; fuzziness on an IP is meaningless
+TEXT_FIELDS = ["hostname^2", "service"]
+NESTED_TEXT_FIELDS = ["vulnerabilities.description", "vulnerabilities.cve_id"]
+
+class QueryPlan:
+    """How a search string was classified and the OpenSearch body it maps to"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.filters: List[Tuple[str, Dict[str, Any]]] = []
+        self.clauses: List[Dict[str, str]] = []
+        self.free_text: List[str] = []
+        # Bare numbers in the free text: they also match devices on that port, without filtering
+        self.port_hints: List[int] = []
+
+    @property
+    def strategy(self) -> str:
+        if self.filters and self.free_text:
+            return "mixed"
+        return "exact" if self.filters else "text"
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-friendly summary for the explain output"""
+        return {
+            "strategy": self.strategy,
+            "clauses": self.clauses,
+            "free_text": " ".join(self.free_text) or None,
+            "port_hints": self.port_hints,
+        }
+
+    def header(self) -> str:
+        """Compact form for the X-Query-Plan response header"""
+        kinds = ",".join(clause["kind"] for clause in self.clauses)
+        if self.free_text:
+            kinds = f"{kinds},fuzzy" if kinds else "fuzzy"
+        return f"{self.strategy}; {kinds}"
+
+    def filter_clauses(self) -> List[Dict[str, Any]]:
+        """Filters ANDed across fields; several values for one field are ORed"""
+        by_field: Dict[str, List[Dict[str, Any]]] = {}
+        for field, query in self.filters:
+            by_field.setdefault(field, []).append(query)
+        return [
+            queries[0] if len(queries) == 1 else {"bool": {"should": queries, "minimum_should_match": 1}}
+            for queries in by_field.values()
+        ]
+
+    def to_body(self, size: int) -> Dict[str, Any]:
+        """Search body: exact lookups as non-scoring filters, free text as a fuzzy match"""
+        filters = self.filter_clauses()
+        if not self.free_text:
+            # Nothing to score, so use the index sort order and let it stop early
+            return {
+                "query": {"bool": {"filter": filters}},
+                "size": size,
+                "sort": [{"timestamp": {"order": "desc"}}],
+                "track_total_hits": False
+            }
+        text = " ".join(self.free_text)
+        return {
+            "query": {
+                "bool": {
+                    "filter": filters,
+                    "should": [
+                        {"multi_match": {"query": text, "fields": TEXT_FIELDS, "fuzziness": "AUTO"}},
+                        {"nested": {
+                            "path": "vulnerabilities",
+                            "query": {"multi_match": {"query": text, "fields": NESTED_TEXT_FIELDS, "fuzziness": "AUTO"}}
+                        }}
+                    ] + ([{"terms": {"port": self.port_hints}}] if self.port_hints else []),
+                    "minimum_should_match": 1
+                }
+            },
+            "size": size
+        }
+
+    def add(self, kind: str, field: str, value: str, query: Dict[str, Any]):
+        self.clauses.append({"kind": kind, "field": field, "value": value})
+        self.filters.append((field.split(".keyword")[0], query))
+
+def _nested_cve(query: Dict[str, Any]) -> Dict[str, Any]:
+    return {"nested": {"path": "vulnerabilities", "query": query}}
+
+def _normalize_cve(token: str) -> Optional[str]:
+    match = CVE_RE.match(token)
+    return f"CVE-{match.group(1)}-{match.group(2)}" if match else None
+
+def _ip_query(value: str, explicit: bool = True) -> Optional[Dict[str, Any]]:
+    """Term query for an IP, CIDR or partial dotted IPv4 prefix of 1-3 octets (e.g. 10.0, 192.168.1);
+    unless `explicit` (an ip: token), a partial prefix must end in . or *"""
+    try:
+        if "/" in value:
+            return {"kind": "cidr", "value": str(ipaddress.ip_network(value, strict=False))}
+        return {"kind": "ip", "value": str(ipaddress.ip_address(value))}
+    except ValueError:
+        pass
+    if (explicit and IP_PREFIX_RE.match(value)) or (PARTIAL_IPV4_RE.match(value) and value.endswith((".", "*"))):
+        octets = [int(o) for o in value.rstrip("*").rstrip(".").split(".")]
+        if all(o <= 255 for o in octets):
+            padded = octets + [0] * (4 - len(octets))
+            network = ipaddress.ip_network(f"{'.'.join(map(str, padded))}/{8 * len(octets)}")
+            return {"kind": "cidr", "value": str(network)}
+    return None
+
+def _port_query(value: str) -> Optional[Dict[str, Any]]:
+    if value.isdigit() and 0 < int(value) <= 65535:
+        return {"term": {"port": int(value)}}
+    match = PORT_RANGE_RE.match(value)
+    if match and any(match.groups()):
+        bounds = {}
+        if match.group(1):
+            bounds["gte"] = int(match.group(1))
+        if match.group(2):
+            bounds["lte"] = int(match.group(2))
+        return {"range": {"port": bounds}}
+    return None
+
+def _plan_field(plan: QueryPlan, name: str, value: str) -> bool:
+    """Add a filter for a `field:value` token; False if the value doesn't fit the field"""
+    field = FIELD_ALIASES[name]
+    if field == "ip":
+        ip = _ip_query(value)
+        if ip:
+            plan.add(ip["kind"], "ip", ip["value"], {"term": {"ip": ip["value"]}})
+        return ip is not None
+    if field == "port":
+        query = _port_query(value)
+        if query:
+            plan.add("port" if "term" in query else "port_range", "port", value, query)
+        return query is not None
+    if field == "vulnerabilities.cve_id":
+        cve = _normalize_cve(value)
+        if cve:
+            plan.add("cve", field, cve, _nested_cve({"term": {field: cve}}))
+        else:
+            prefix = value.upper().rstrip("*")
+            plan.add("cve_prefix", field, prefix, _nested_cve({"prefix": {field: prefix}}))
+        return True
+    if field == "hostname":
+        if value.endswith("*"):
+            # Case-insensitive, as on the SQLite backend (hostname COLLATE NOCASE)
+            plan.add("prefix", "hostname.keyword", value[:-1],
+                     {"prefix": {"hostname.keyword": {"value": value[:-1], "case_insensitive": True}}})
+        else:
+            plan.add("match", "hostname", value, {"match": {"hostname": {"query": value, "operator": "and"}}})
+        return True
+    plan.add("term", field, value, {"term": {field: value}})
+    return True
+
+def plan_query(text: str) -> QueryPlan:
+    """Classify each whitespace-separated token of a search string.
+
+    Recognised tokens become exact filters: IPs and CIDRs (term on `ip`),
+    partial IPs ending in . or *, CVE IDs (nested term) and `field:value`
+    pairs. Everything else is collected as free text for a fuzzy match;
+    a bare number there also matches devices on that port (port:N filters).
+    """
+    plan = QueryPlan(text)
+    try:
+        tokens = shlex.split(text)
+    except ValueError:
+        # Unbalanced quotes; fall back to plain splitting
+        tokens = text.split()
+
+    for token in tokens:
+        match = FIELD_VALUE_RE.match(token)
+        if match and match.group(1).lower() in FIELD_ALIASES:
+            if _plan_field(plan, match.group(1).lower(), match.group(2)):
+                continue
+        cve = _normalize_cve(token)
+        if cve:
+            plan.add("cve", "vulnerabilities.cve_id", cve, _nested_cve({"term": {"vulnerabilities.cve_id": cve}}))
+            continue
+        ip = _ip_query(token, explicit=False)
+        if ip:
+            plan.add(ip["kind"], "ip", ip["value"], {"term": {"ip": ip["value"]}})
+            continue
+        if token.isdigit() and 0 < int(token) <= 65535:
+            plan.port_hints.append(int(token))
+        plan.free_text.append(token)
+
+    logger.debug(f"Query plan for {text!r}: {plan.header()}")
+    return plan
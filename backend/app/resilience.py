@@ -0,0 +1,297 @@
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import orjson
+from opensearchpy import exceptions
+
+logger = logging.getLogger(__name__)
+
+# Per-call timeout when no endpoint budget is set (ingest jobs, scripts); the client's own default
+DEFAULT_TIMEOUT = float(os.environ.get("OPENSEARCH_TIMEOUT", "10"))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.environ.get("BREAKER_RESET", "10"))
+STALE_CACHE_SIZE = int(os.environ.get("STALE_CACHE_SIZE", "256"))
+# Serialized size limits: for the whole stale cache, and for one response (bigger ones aren't kept)
+STALE_CACHE_BYTES = int(os.environ.get("STALE_CACHE_BYTES", str(32 * 1024 * 1024)))
+STALE_CACHE_ITEM_BYTES = int(os.environ.get("STALE_CACHE_ITEM_BYTES", str(1024 * 1024)))
+# Hedged reads: a second copy of a slow read is sent after the recent p95 (at least HEDGE_MIN_MS)
+HEDGE_READS = os.environ.get("HEDGE_READS", "false").lower() == "true"
+HEDGE_MIN_MS = float(os.environ.get("HEDGE_MIN_MS", "50"))
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", "16"))
+# A call left with less budget than this is not sent: its timeout would say nothing about the cluster
+MIN_CALL_BUDGET = float(os.environ.get("MIN_CALL_BUDGET_MS", "50")) / 1000
+
+# Idempotent reads: safe to hedge and to answer from the stale cache
+READ_METHODS = frozenset(("search", "count", "get", "mget", "msearch"))
+NAMESPACES = frozenset(("indices", "cluster", "tasks", "nodes", "cat", "snapshot", "ingest"))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("opensearch_deadline", default=None)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OpenSearch while the breaker is open"""
+
+class BudgetExhaustedError(Exception):
+    """Raised instead of calling OpenSearch once the endpoint's time budget is spent"""
+
+@contextlib.contextmanager
+def timeout_budget(seconds: float) -> Iterator[None]:
+    """Every OpenSearch call inside shares `seconds`; nested budgets can only shorten it"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def with_budget(seconds: float) -> Callable:
+    """Endpoint decorator running the handler inside timeout_budget(seconds)"""
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timeout_budget(seconds):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def remaining_budget() -> float:
+    deadline = _deadline.get()
+    return DEFAULT_TIMEOUT if deadline is None else deadline - time.monotonic()
+
+def is_failure(error: Exception) -> bool:
+    """Errors that say the cluster is unhealthy, as opposed to a bad or missing request"""
+    if isinstance(error, exceptions.ConnectionError):
+        return True
+    if isinstance(error, exceptions.TransportError):
+        status = error.status_code
+        return not isinstance(status, int) or status >= 500 or status == 429
+    return False
+
+class CircuitBreaker:
+    """Closed -> open after `failures` consecutive failures -> one half-open probe after `reset` seconds"""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.failures = failures
+        self.reset = reset
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("OpenSearch circuit closed")
+            self.state = "closed"
+            self.consecutive = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                logger.warning(f"OpenSearch circuit opened after {self.consecutive} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """The half-open probe was never sent; let the next call be the probe"""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.consecutive}
+
+class StaleCache:
+    """Last good response per read request, served while OpenSearch is failing.
+
+    Responses are kept as orjson bytes: an immutable snapshot (callers edit the
+    live response in place) whose length bounds the cache by entry count and size.
+    """
+
+    def __init__(self, max_entries: int = STALE_CACHE_SIZE, max_bytes: int = STALE_CACHE_BYTES,
+                 max_item_bytes: int = STALE_CACHE_ITEM_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[Any]:
+        with self._lock:
+            snapshot = self._entries.get(key)
+        return orjson.loads(snapshot) if snapshot is not None else None
+
+    def put(self, key: bytes, response: Any):
+        try:
+            snapshot = orjson.dumps(response, default=str)
+        except TypeError:
+            # e.g. an integer past 64 bits; such a response just isn't cached
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(key) + len(old)
+            if len(key) + len(snapshot) > self.max_item_bytes:
+                return
+            self._entries[key] = snapshot
+            self.bytes += len(key) + len(snapshot)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                evicted, dropped = self._entries.popitem(last=False)
+                self.bytes -= len(evicted) + len(dropped)
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_lock = threading.Lock()
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="opensearch-hedge")
+        return _hedge_pool
+
+class GuardedClient:
+    """OpenSearch client wrapper adding timeout budgets, a circuit breaker,
+    stale-read fallback and optional hedged reads to every call.
+
+    Callers use it exactly like the client it wraps; errors still surface
+    as exceptions, so existing handlers keep working, only sooner.
+    """
+
+    def __init__(self, client: Any, breaker: Optional[CircuitBreaker] = None, hedge: bool = HEDGE_READS):
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.stale = StaleCache()
+        self.hedged = 0
+        self._latencies: deque = deque(maxlen=200)
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.client, name)
+        if name in NAMESPACES:
+            return _GuardedNamespace(self, attr, name)
+        if callable(attr):
+            return functools.partial(self.call, attr, name)
+        return attr
+
+    def call(self, fn: Callable, name: str, /, *args, **kwargs) -> Any:
+        # Positional-only: APIs like put_alias take their own `name=`
+        read = name in READ_METHODS and "scroll" not in kwargs
+        if name == "ping":
+            return self._ping(fn, **kwargs)
+        if not self.breaker.allow():
+            return self._fallback(name, args, kwargs, read, CircuitOpenError("OpenSearch circuit is open"))
+        budget = remaining_budget()
+        if budget < MIN_CALL_BUDGET:
+            # Not the cluster's fault: leave the breaker alone rather than record a timeout
+            self.breaker.release_probe()
+            raise BudgetExhaustedError(f"No time left for OpenSearch {name}")
+        kwargs["request_timeout"] = budget
+        started = time.monotonic()
+        try:
+            if read and self.hedge and self.breaker.state == "closed":
+                response = self._hedged(fn, args, kwargs, budget)
+            else:
+                response = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_failure(e):
+                self.breaker.record_success()
+                raise
+            self.breaker.record_failure()
+            return self._fallback(name, args, kwargs, read, e)
+        self.breaker.record_success()
+        if read:
+            self._latencies.append(time.monotonic() - started)
+            # Only endpoint reads (inside with_budget) are worth a stale copy; scans and jobs are not
+            if _deadline.get() is not None:
+                self.stale.put(self._key(name, args, kwargs), response)
+        return response
+
+    def _ping(self, fn: Callable, **kwargs) -> bool:
+        if not self.breaker.allow():
+            return False
+        kwargs.setdefault("request_timeout", max(0.1, min(remaining_budget(), DEFAULT_TIMEOUT)))
+        alive = bool(fn(**kwargs))
+        if alive:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return alive
+
+    def _key(self, name: str, args: Tuple, kwargs: Dict[str, Any]) -> bytes:
+        params = {k: v for k, v in kwargs.items() if k != "request_timeout"}
+        # Not key-sorted: a request body is always built in the same order by the same code path
+        return orjson.dumps([name, args, params], default=str)
+
+    def _fallback(self, name: str, args: Tuple, kwargs: Dict[str, Any], read: bool, error: Exception) -> Any:
+        if read and _deadline.get() is not None:
+            response = self.stale.get(self._key(name, args, kwargs))
+            if response is not None:
+                logger.warning(f"Serving cached OpenSearch {name} result: {error}")
+                return response
+        raise error
+
+    def _hedge_delay(self) -> float:
+        floor = HEDGE_MIN_MS / 1000
+        if len(self._latencies) < 20:
+            return max(floor, 0.25)
+        ordered = sorted(self._latencies)
+        return max(floor, ordered[int(len(ordered) * 0.95) - 1])
+
+    def _hedged(self, fn: Callable, args: Tuple, kwargs: Dict[str, Any], budget: float) -> Any:
+        """Send the read, and a second copy if the first is slower than usual; first success wins"""
+        pool = _get_hedge_pool()
+        futures = [pool.submit(fn, *args, **kwargs)]
+        delay = self._hedge_delay()
+        done, _ = wait(futures, timeout=delay)
+        if not done and budget - delay > delay:
+            self.hedged += 1
+            futures.append(pool.submit(fn, *args, **{**kwargs, "request_timeout": budget - delay}))
+        error: Optional[BaseException] = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+class _GuardedNamespace:
+    """`client.indices` and friends, with their calls going through the same guard"""
+
+    def __init__(self, guard: GuardedClient, namespace: Any, name: str):
+        self._guard = guard
+        self._namespace = namespace
+        self._name = name
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._namespace, name)
+        if callable(attr):
+            return functools.partial(self._guard.call, attr, f"{self._name}.{name}")
+        return attr
@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Words too common in camera/NVR product strings to identify a product on
+# their own; they still count when nothing more specific is available
+GENERIC_TOKENS = {
+    "ip", "camera", "cameras", "cam", "web", "webs", "server", "firmware", "network", "video",
+    "digital", "recorder", "dvr", "nvr", "http", "https", "rtsp", "the", "and", "for", "with",
+    "security", "system", "device", "devices", "series", "model", "pro", "plus", "hd", "ptz",
+}
+
+# CPE vendor names that differ from what banners and product strings say
+VENDOR_ALIASES = {
+    "dahuasecurity": "dahua",
+    "zhejiang_uniview_technologies": "uniview",
+    "hangzhou_hikvision_digital_technology": "hikvision",
+    "axis_communications": "axis",
+}
+
+# Device fields whose text identifies vendor/product/firmware
+DEVICE_TEXT_FIELDS = ("service", "hostname", "data")
+# Saved between CVE ingests with the change-feed cursor it is current to
+TOKEN_INDEX_PATH = os.environ.get("DEVICE_TOKEN_INDEX_PATH", "data/device_tokens.json")
+
+def tokenize(text: Any) -> Set[str]:
+    """Lowercase alphanumeric tokens, dropping single characters and bare numbers"""
+    if not text:
+        return set()
+    return {t for t in TOKEN_RE.findall(str(text).lower()) if len(t) > 1 and not t.isdigit()}
+
+def parse_cpe(cpe: str) -> Optional[Tuple[str, str, str]]:
+    """(vendor, product, version) from a CPE 2.3 URI, or None if it isn't one"""
+    parts = cpe.split(":")
+    if len(parts) < 6 or parts[0] != "cpe":
+        return None
+    return parts[3], parts[4], parts[5]
+
+class DeviceTokenIndex:
+    """In-memory inverted index: product/firmware token -> device ids.
+
+    Kept on disk between CVE batches and brought up to date from the device
+    change feed, so only devices written since the last batch are re-read.
+    Each CVE is then only compared with devices that share all of its
+    vendor tokens.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Set[str]] = {}
+        self.device_tokens: Dict[str, Set[str]] = {}
+        self.device_cves: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.device_tokens)
+
+    def add(self, device_id: str, device: Dict[str, Any]):
+        """Index a device, replacing what was indexed for it before"""
+        tokens: Set[str] = set()
+        for field in DEVICE_TEXT_FIELDS:
+            tokens |= tokenize(device.get(field))
+        for token in self.device_tokens.get(device_id, set()) - tokens:
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.discard(device_id)
+                if not posting:
+                    del self.postings[token]
+        self.device_tokens[device_id] = tokens
+        self.device_cves[device_id] = {v.get('cve_id') for v in device.get('vulnerabilities') or []}
+        for token in tokens:
+            self.postings.setdefault(token, set()).add(device_id)
+
+    def add_batch(self, devices: List[Dict[str, Any]]):
+        for device in devices:
+            device_id = device.get('device_id') or device.get('_id')
+            if device_id:
+                self.add(device_id, device)
+
+    @classmethod
+    def build(cls, devices: Iterable[List[Dict[str, Any]]]) -> "DeviceTokenIndex":
+        """Index device pages, e.g. OpenSearchHelper.iter_device_batches()"""
+        index = cls()
+        for batch in devices:
+            index.add_batch(batch)
+        logger.info(f"Built device token index: {len(index)} devices, {len(index.postings)} tokens")
+        return index
+
+    @classmethod
+    def load(cls, path: str = TOKEN_INDEX_PATH) -> Tuple["DeviceTokenIndex", Optional[str]]:
+        """A saved index and the change-feed cursor it is current to; empty with no cursor if unreadable"""
+        index = cls()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return index, None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Rebuilding device token index, could not read {path}: {e}")
+            return index, None
+        for device_id, (tokens, cves) in saved.get("devices", {}).items():
+            index.device_tokens[device_id] = set(tokens)
+            index.device_cves[device_id] = set(cves)
+            for token in tokens:
+                index.postings.setdefault(token, set()).add(device_id)
+        return index, saved.get("cursor")
+
+    def save(self, cursor: Optional[str], path: str = TOKEN_INDEX_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        devices = {
+            device_id: [sorted(tokens), sorted(c for c in self.device_cves.get(device_id, ()) if c)]
+            for device_id, tokens in self.device_tokens.items()
+        }
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"cursor": cursor, "devices": devices}, f)
+        os.replace(tmp, path)
+
+    def candidates(self, vendor: str) -> Set[str]:
+        """Devices containing every token of a CPE vendor"""
+        tokens = tokenize(VENDOR_ALIASES.get(vendor, vendor).replace("_", " "))
+        if not tokens:
+            return set()
+        postings = sorted((self.postings.get(t, set()) for t in tokens), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+        return result
+
+    def match_cpe(self, cpe: str) -> Set[str]:
+        """Devices whose text names the CPE's vendor and at least one product token"""
+        parsed = parse_cpe(cpe)
+        if not parsed:
+            return set()
+        vendor, product, _ = parsed
+        candidates = self.candidates(vendor)
+        if not candidates or product in ("*", "-"):
+            return set()
+        vendor_tokens = tokenize(vendor.replace("_", " ")) | tokenize(VENDOR_ALIASES.get(vendor, ""))
+        product_tokens = tokenize(product.replace("_", " ")) - vendor_tokens
+        specific = product_tokens - GENERIC_TOKENS
+        wanted = specific or product_tokens
+        if not wanted:
+            return set()
+        return {d for d in candidates if self.device_tokens[d] & wanted}
+
+    def match(self, cves: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """device_id -> new vulnerability entries for a batch of CVE records.
+
+        Each record has cve_id, cvss_score, description and `cpes` (vulnerable
+        CPE 2.3 URIs). CVEs a device already carries are skipped.
+        """
+        matches: Dict[str, List[Dict[str, Any]]] = {}
+        for cve in cves:
+            cve_id = cve.get('cve_id')
+            devices: Set[str] = set()
+            for cpe in cve.get('cpes') or []:
+                devices |= self.match_cpe(cpe)
+            for device_id in devices:
+                if cve_id in self.device_cves[device_id]:
+                    continue
+                self.device_cves[device_id].add(cve_id)
+                matches.setdefault(device_id, []).append({
+                    'cve_id': cve_id,
+                    'description': cve.get('description', ''),
+                    'cvss_score': cve.get('cvss_score', 0.0),
+                    'type': 'product_match'
+                })
+        return matches
@@ -0,0 +1,63 @@
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Weight of the service a port usually exposes on cameras/NVRs: cleartext
+# admin and stream protocols rank above TLS. Unlisted ports get the default.
+PORT_EXPOSURE = {
+    23: 20,     # telnet
+    21: 15,     # ftp
+    554: 15,    # rtsp
+    37777: 15,  # dahua dvr
+    34567: 15,  # xmeye dvr
+    80: 12,
+    8000: 12,
+    8080: 12,
+    8081: 12,
+    443: 6,
+    8443: 6,
+}
+DEFAULT_PORT_EXPOSURE = 10
+
+STATUS_FACTOR = {
+    "online": 1.0,
+    "unknown": 0.8,
+    "offline": 0.5,
+}
+
+# Score budget out of 100: worst CVSS up to 65, extra vulnerabilities up to
+# 15, port exposure up to 20; then scaled by how reachable the device is
+CVSS_WEIGHT = 6.5
+EXTRA_VULN_WEIGHT = 3
+MAX_EXTRA_VULNS = 5
+
+RISK_FIELDS = ("risk_score", "max_cvss", "vuln_count")
+
+def compute_risk(device: Dict[str, Any]) -> Dict[str, Any]:
+    """Risk fields for a device document: risk_score (0-100), max_cvss and vuln_count"""
+    vulns: List[Dict[str, Any]] = [v for v in device.get('vulnerabilities') or [] if v.get('cve_id')]
+    scores = []
+    for vuln in vulns:
+        try:
+            scores.append(float(vuln.get('cvss_score') or 0.0))
+        except (TypeError, ValueError):
+            scores.append(0.0)
+    max_cvss = max(scores) if scores else 0.0
+
+    try:
+        port = int(device.get('port'))
+    except (TypeError, ValueError):
+        port = None
+    exposure = PORT_EXPOSURE.get(port, DEFAULT_PORT_EXPOSURE)
+
+    score = max_cvss * CVSS_WEIGHT
+    score += min(max(len(vulns) - 1, 0), MAX_EXTRA_VULNS) * EXTRA_VULN_WEIGHT
+    score += exposure
+    score *= STATUS_FACTOR.get(device.get('status') or "unknown", STATUS_FACTOR["unknown"])
+
+    return {
+        "risk_score": round(min(score, 100.0), 1),
+        "max_cvss": max_cvss,
+        "vuln_count": len(vulns),
+    }
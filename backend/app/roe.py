@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from .scope import ScopeSet
+
+logger = logging.getLogger(__name__)
+
+ROE_STORE_PATH = os.environ.get("ROE_STORE_PATH", "data/roes.json")
+
+class ROEStore:
+    """Submitted ROE documents in one JSON file, with their scopes compiled on demand.
+
+    The file is rewritten atomically on every change; ROEs are few and
+    small, and are read far more often (on every scoped search) than
+    written.
+    """
+
+    def __init__(self, path: str = ROE_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._roes: Dict[str, Dict[str, Any]] = self._load()
+        self._scopes: Dict[str, ScopeSet] = {}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return {roe["id"]: roe for roe in json.load(f)}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error loading ROEs from {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(self._roes.values()), f, indent=2)
+        os.replace(tmp, self.path)
+
+    def add(self, roe: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist an ROE and return it with its id, timestamp and scope summary"""
+        scope = ScopeSet.from_text(roe.get("scope", ""))
+        record = {
+            **roe,
+            "id": uuid.uuid4().hex,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "scope_summary": scope.summary(),
+        }
+        with self._lock:
+            self._roes[record["id"]] = record
+            self._scopes[record["id"]] = scope
+            self._save()
+        logger.info(f"Stored ROE {record['id']} ({record.get('name')}): {scope.summary()['ipv4_ranges']} IPv4 ranges")
+        return record
+
+    def get(self, roe_id: str) -> Optional[Dict[str, Any]]:
+        return self._roes.get(roe_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return sorted(self._roes.values(), key=lambda roe: roe.get("created_at", ""), reverse=True)
+
+    def scope(self, roe_id: str) -> Optional[ScopeSet]:
+        """Compiled scope of an ROE, or None if there is no such ROE"""
+        scope = self._scopes.get(roe_id)
+        if scope is None:
+            roe = self._roes.get(roe_id)
+            if roe is None:
+                return None
+            scope = ScopeSet.from_text(roe.get("scope", ""))
+            self._scopes[roe_id] = scope
+        return scope
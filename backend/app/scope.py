@@ -0,0 +1,237 @@
+import bisect
+import ipaddress
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Past this many merged intervals the OpenSearch filter uses CIDR terms, not one range clause each
+MAX_RANGE_CLAUSES = 512
+# OpenSearch rejects queries past indices.query.bool.max_clause_count (1024 by default)
+MAX_QUERY_CLAUSES = 1000
+SCOPE_SPLIT_RE = re.compile(r"[\s,;]+")
+SHORT_RANGE_RE = re.compile(r"^(\d{1,3}\.\d{1,3}\.\d{1,3}\.)(\d{1,3})-(\d{1,3})$")
+
+Interval = Tuple[int, int]
+
+def parse_token(token: str) -> Optional[Tuple[int, Interval]]:
+    """(IP version, inclusive interval) of an IP, CIDR, a-b range or a.b.c.x-y shorthand, else None"""
+    try:
+        short = SHORT_RANGE_RE.match(token)
+        if short:
+            prefix, low, high = short.groups()
+            start, end = ipaddress.ip_address(prefix + low), ipaddress.ip_address(prefix + high)
+        elif "-" in token:
+            low, high = token.split("-", 1)
+            start, end = ipaddress.ip_address(low), ipaddress.ip_address(high)
+        elif "/" in token:
+            network = ipaddress.ip_network(token, strict=False)
+            start, end = network.network_address, network.broadcast_address
+        else:
+            start = end = ipaddress.ip_address(token)
+    except ValueError:
+        return None
+    if start.version != end.version or int(start) > int(end):
+        return None
+    return start.version, (int(start), int(end))
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sorted, with overlapping and adjacent intervals joined"""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtract_intervals(intervals: List[Interval], excluded: List[Interval]) -> List[Interval]:
+    """Merged intervals minus merged exclusions"""
+    result: List[Interval] = []
+    i = 0
+    for start, end in intervals:
+        while i < len(excluded) and excluded[i][1] < start:
+            i += 1
+        j = i
+        while j < len(excluded) and excluded[j][0] <= end:
+            if excluded[j][0] > start:
+                result.append((start, excluded[j][0] - 1))
+            start = max(start, excluded[j][1] + 1)
+            j += 1
+        if start <= end:
+            result.append((start, end))
+    return result
+
+def _ip_string(version: int, value: int) -> str:
+    return str(ipaddress.IPv4Address(value) if version == 4 else ipaddress.IPv6Address(value))
+
+class ScopeSet:
+    """A compiled ROE scope: sorted, merged IPv4 and IPv6 intervals.
+
+    Membership is a binary search: numpy searchsorted over the IPv4
+    starts/ends for bulk checks, bisect over Python ints for IPv6 (which
+    doesn't fit numpy integers). Tokens prefixed with "!" are excluded.
+    """
+
+    def __init__(self, v4: List[Interval], v6: List[Interval], unparsed: Optional[List[str]] = None):
+        self.v4_starts = np.array([s for s, _ in v4], dtype=np.int64)
+        self.v4_ends = np.array([e for _, e in v4], dtype=np.int64)
+        self.v6_starts = [s for s, _ in v6]
+        self.v6_ends = [e for _, e in v6]
+        self.unparsed = unparsed or []
+        self._cidrs: Optional[List[str]] = None
+
+    @classmethod
+    def from_text(cls, text: str) -> "ScopeSet":
+        """Compile free-form scope text: IPs, CIDRs and ranges separated by commas, spaces or lines"""
+        included: Dict[int, List[Interval]] = {4: [], 6: []}
+        excluded: Dict[int, List[Interval]] = {4: [], 6: []}
+        unparsed = []
+        for raw in SCOPE_SPLIT_RE.split(text or ""):
+            token = raw.strip("()[]{}.'\"")
+            if not token:
+                continue
+            target = excluded if token.startswith("!") else included
+            parsed = parse_token(token.lstrip("!"))
+            if parsed is None:
+                unparsed.append(raw)
+                continue
+            version, interval = parsed
+            target[version].append(interval)
+        v4 = subtract_intervals(merge_intervals(included[4]), merge_intervals(excluded[4]))
+        v6 = subtract_intervals(merge_intervals(included[6]), merge_intervals(excluded[6]))
+        return cls(v4, v6, unparsed)
+
+    def __len__(self) -> int:
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    def contains(self, ip: Any) -> bool:
+        try:
+            address = ipaddress.ip_address(str(ip).strip())
+        except ValueError:
+            return False
+        value = int(address)
+        if address.version == 4:
+            i = int(np.searchsorted(self.v4_starts, value, side="right")) - 1
+            return i >= 0 and value <= int(self.v4_ends[i])
+        i = bisect.bisect_right(self.v6_starts, value) - 1
+        return i >= 0 and value <= self.v6_ends[i]
+
+    def contains_many(self, ips: Sequence[Any]) -> np.ndarray:
+        """Boolean mask of which IPs are in scope; unparseable IPs are out of scope"""
+        if not len(ips):
+            return np.zeros(0, dtype=bool)
+        values = self._parse_ipv4(ips)
+        if values is None:
+            return np.fromiter((self.contains(ip) for ip in ips), dtype=bool, count=len(ips))
+        return self._contains_v4(values)
+
+    def _parse_ipv4(self, ips: Sequence[Any]) -> Optional[np.ndarray]:
+        """IPv4 strings as integers in one vectorized pass, or None if any entry isn't a plain IPv4"""
+        try:
+            joined = "\n".join(ips).encode()
+        except (TypeError, UnicodeEncodeError):
+            return None
+        if joined.translate(None, b"0123456789.\n"):
+            return None
+        # Every line must be digits '.' digits '.' digits '.' digits '\n', each octet 1-3 digits
+        buf = np.frombuffer(joined + b"\n", dtype=np.uint8)
+        seps = np.flatnonzero((buf == ord(".")) | (buf == ord("\n")))
+        if len(seps) != 4 * len(ips):
+            return None
+        kinds = buf[seps].reshape(-1, 4)
+        if (kinds[:, :3] != ord(".")).any() or (kinds[:, 3] != ord("\n")).any():
+            return None
+        lengths = np.diff(seps, prepend=-1) - 1
+        if (lengths < 1).any() or (lengths > 3).any():
+            return None
+        # int16 arithmetic: octets are at most 999 before the range check
+        octets = (buf[seps - 1] - ord("0")).astype(np.int16)
+        for back, scale in ((2, 10), (3, 100)):
+            longer = lengths >= back
+            octets[longer] += (buf[seps[longer] - back] - ord("0")).astype(np.int16) * scale
+        if (octets > 255).any():
+            return None
+        octets = octets.reshape(-1, 4).astype(np.int64)
+        return (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+
+    def _contains_v4(self, values: np.ndarray) -> np.ndarray:
+        if not len(self.v4_starts):
+            return np.zeros(len(values), dtype=bool)
+        i = np.searchsorted(self.v4_starts, values, side="right") - 1
+        return (i >= 0) & (values <= self.v4_ends[np.maximum(i, 0)])
+
+    def filter_devices(self, devices: List[Dict[str, Any]], field: str = "ip") -> List[Dict[str, Any]]:
+        """The devices whose `field` is in scope"""
+        mask = self.contains_many([str(d.get(field) or "") for d in devices])
+        return [device for device, inside in zip(devices, mask) if inside]
+
+    def intervals(self) -> Iterable[Tuple[int, Interval]]:
+        for start, end in zip(self.v4_starts.tolist(), self.v4_ends.tolist()):
+            yield 4, (start, end)
+        for start, end in zip(self.v6_starts, self.v6_ends):
+            yield 6, (start, end)
+
+    def covering_intervals(self, limit: int) -> List[Tuple[int, Interval]]:
+        """At most `limit` intervals covering the scope, closing the smallest gaps between neighbours first"""
+        intervals = list(self.intervals())
+        if len(intervals) <= limit:
+            return intervals
+        gaps = sorted(
+            range(len(intervals) - 1),
+            key=lambda i: intervals[i + 1][1][0] - intervals[i][1][1]
+            if intervals[i][0] == intervals[i + 1][0] else float("inf")
+        )
+        closed = set(gaps[:len(intervals) - max(limit, 2)])
+        covering: List[Tuple[int, Interval]] = []
+        for i, (version, (start, end)) in enumerate(intervals):
+            if i - 1 in closed:
+                covering[-1] = (version, (covering[-1][1][0], end))
+            else:
+                covering.append((version, (start, end)))
+        return covering
+
+    def cidrs(self) -> List[str]:
+        if self._cidrs is None:
+            self._cidrs = []
+            for version, (start, end) in self.intervals():
+                first, last = (ipaddress.IPv4Address(start), ipaddress.IPv4Address(end)) if version == 4 else \
+                    (ipaddress.IPv6Address(start), ipaddress.IPv6Address(end))
+                self._cidrs.extend(str(network) for network in ipaddress.summarize_address_range(first, last))
+        return self._cidrs
+
+    def exact_query(self) -> bool:
+        """Whether to_query() matches the scope exactly; if not it matches a superset, so hits need filter_devices()"""
+        if len(self) <= MAX_RANGE_CLAUSES:
+            return True
+        return len(self) <= MAX_QUERY_CLAUSES and len(self.cidrs()) <= MAX_QUERY_CLAUSES
+
+    def to_query(self, field: str = "ip") -> Dict[str, Any]:
+        """OpenSearch filter matching in-scope IPs: one range clause per interval, CIDR terms when
+        there are too many intervals for a bool query, and past MAX_QUERY_CLAUSES CIDRs ranges
+        over the covering_intervals() (a superset of the scope)"""
+        if not len(self):
+            return {"bool": {"must_not": {"match_all": {}}}}
+        if len(self) <= MAX_RANGE_CLAUSES:
+            intervals = list(self.intervals())
+        elif self.exact_query():
+            return {"terms": {field: self.cidrs()}}
+        else:
+            intervals = self.covering_intervals(MAX_QUERY_CLAUSES)
+        ranges = [
+            {"range": {field: {"gte": _ip_string(version, start), "lte": _ip_string(version, end)}}}
+            for version, (start, end) in intervals
+        ]
+        return ranges[0] if len(ranges) == 1 else {"bool": {"should": ranges, "minimum_should_match": 1}}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "ipv4_ranges": len(self.v4_starts),
+            "ipv4_addresses": int((self.v4_ends - self.v4_starts + 1).sum()) if len(self.v4_starts) else 0,
+            "ipv6_ranges": len(self.v6_starts),
+            "unparsed": self.unparsed,
+        }
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = os.environ.get("SPOOL_DIR", "data/spool")
+SPOOL_SEGMENT_BYTES = int(os.environ.get("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+# Replay pacing: devices per second and per bulk request
+SPOOL_DRAIN_RATE = float(os.environ.get("SPOOL_DRAIN_RATE", "5000"))
+SPOOL_DRAIN_BATCH = int(os.environ.get("SPOOL_DRAIN_BATCH", "1000"))
+# Failed replays of one batch (with the cluster up) before it is set aside as a dead letter
+SPOOL_MAX_ATTEMPTS = int(os.environ.get("SPOOL_MAX_ATTEMPTS", "5"))
+SPOOL_MAX_BACKOFF = float(os.environ.get("SPOOL_MAX_BACKOFF", "30"))
+
+SEGMENT_RE = re.compile(r"^(\d{12})\.ndjson$")
+CHECKPOINT_FILE = "drain.json"
+DEAD_LETTER_FILE = "dead-letter.ndjson"
+
+class DeviceSpool:
+    """Append-only on-disk queue of device writes, in numbered NDJSON segments.
+
+    bulk_index_devices() returns once the devices are fsynced, so callers
+    can treat it like the store's method. Concurrent appenders share fsyncs
+    (group commit): whoever syncs first covers every line written before it.
+    A new segment is started on open and whenever the current one fills up;
+    only sealed segments are drained.
+    """
+
+    def __init__(self, directory: str = SPOOL_DIR, segment_bytes: int = SPOOL_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        segments = self.segments()
+        self._segment = (segments[-1] + 1) if segments else 1
+        self._file = open(self._path(self._segment), "ab")
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}.ndjson")
+
+    def segments(self) -> List[int]:
+        return sorted(int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(self.directory)) if m)
+
+    def sealed_segments(self) -> List[int]:
+        with self._lock:
+            current = self._segment
+        return [s for s in self.segments() if s < current]
+
+    def bulk_index_devices(self, devices: List[Dict[str, Any]]) -> bool:
+        """Durably queue devices for indexing"""
+        if not devices:
+            return True
+        data = "".join(json.dumps(device, default=str) + "\n" for device in devices).encode()
+        try:
+            with self._lock:
+                self._file.write(data)
+                self._written += 1
+                ticket = self._written
+            self._commit(ticket)
+            with self._sync_lock, self._lock:
+                if self._file.tell() >= self.segment_bytes:
+                    self._roll()
+        except OSError as e:
+            logger.error(f"Error spooling devices: {e}")
+            return False
+        return True
+
+    def _commit(self, ticket: int):
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return
+            with self._lock:
+                target = self._written
+                self._file.flush()
+                fileno = self._file.fileno()
+            # Appenders keep writing meanwhile; the next commit covers them all at once
+            os.fsync(fileno)
+            self._synced = target
+
+    def _roll(self):
+        # Caller holds _sync_lock and _lock, so no commit is syncing the file being closed
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._synced = self._written
+        self._segment += 1
+        self._file = open(self._path(self._segment), "ab")
+
+    def has_pending(self) -> bool:
+        with self._lock:
+            if self._file.tell() > 0:
+                return True
+        return bool(self.sealed_segments())
+
+    def roll(self) -> bool:
+        """Seal the current segment if it has data, so the drainer can pick it up"""
+        with self._sync_lock, self._lock:
+            if self._file.tell() == 0:
+                return False
+            self._roll()
+            return True
+
+    def pending_bytes(self) -> int:
+        checkpoint_segment, offset = self.load_checkpoint()
+        total = 0
+        for segment in self.segments():
+            size = os.path.getsize(self._path(segment))
+            total += size - offset if segment == checkpoint_segment else size
+        return total
+
+    def load_checkpoint(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as f:
+                checkpoint = json.load(f)
+            return int(checkpoint["segment"]), int(checkpoint["offset"])
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    def save_checkpoint(self, segment: int, offset: int):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def read_batch(self, segment: int, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Up to `limit` devices from a segment starting at byte `offset`, and the offset after them"""
+        devices = []
+        with open(self._path(segment), "rb") as f:
+            f.seek(offset)
+            while len(devices) < limit:
+                line = f.readline()
+                if not line:
+                    break
+                offset += len(line)
+                if not line.endswith(b"\n"):
+                    logger.warning(f"Skipping torn record at the end of spool segment {segment}")
+                    continue
+                try:
+                    devices.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping unreadable record in spool segment {segment}")
+        return devices, offset
+
+    def remove(self, segment: int):
+        os.remove(self._path(segment))
+
+    def dead_letter(self, devices: List[Dict[str, Any]]):
+        with open(os.path.join(self.directory, DEAD_LETTER_FILE), "a") as f:
+            for device in devices:
+                f.write(json.dumps(device, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class SpoolDrainer:
+    """Background thread replaying sealed spool segments into a store at a capped rate.
+
+    Replays only while the store answers pings, backs off exponentially on
+    failures, and checkpoints after every committed batch, so a restart
+    resumes where it stopped. Device IDs are deterministic, so the one batch
+    that can be replayed twice after a crash just overwrites itself.
+    """
+
+    def __init__(self, spool: DeviceSpool, store: Any, rate: float = SPOOL_DRAIN_RATE,
+                 batch_size: int = SPOOL_DRAIN_BATCH, idle_interval: float = 1.0,
+                 prepare: Optional[Callable[[], bool]] = None):
+        self.spool = spool
+        self.store = store
+        # Run once the store first answers (e.g. creating indices the API couldn't at startup)
+        self.prepare = prepare
+        self.rate = rate
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.drained = 0
+        self.dead_letters = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        backoff = self.idle_interval
+        while not self._stop.is_set():
+            try:
+                drained = self.drain_once()
+                backoff = self.idle_interval
+            except ConnectionError:
+                drained = False
+                backoff = min(backoff * 2, SPOOL_MAX_BACKOFF)
+                logger.warning(f"Store unavailable, spool replay paused for {backoff:.0f}s")
+            except Exception as e:
+                logger.error(f"Error draining spool: {e}")
+                drained = False
+            if not drained:
+                self._stop.wait(backoff)
+
+    def drain_once(self) -> bool:
+        """Replay the sealed segments; False if there was nothing to do.
+        Raises ConnectionError when the store is unavailable."""
+        if not self.spool.has_pending():
+            return False
+        if not self.store.ping():
+            raise ConnectionError("store unavailable")
+        if self.prepare:
+            if not self.prepare():
+                raise ConnectionError("store not ready")
+            self.prepare = None
+        if not self.spool.sealed_segments():
+            self.spool.roll()
+        checkpoint_segment, offset = self.spool.load_checkpoint()
+        for segment in self.spool.sealed_segments():
+            if segment < checkpoint_segment:
+                # Drained before a crash, but not yet removed
+                self.spool.remove(segment)
+                continue
+            position = offset if segment == checkpoint_segment else 0
+            while not self._stop.is_set():
+                devices, next_position = self.spool.read_batch(segment, position, self.batch_size)
+                if not devices and next_position == position:
+                    break
+                started = time.monotonic()
+                if devices:
+                    self._replay(devices)
+                position = next_position
+                self.spool.save_checkpoint(segment, position)
+                pause = len(devices) / self.rate - (time.monotonic() - started) if self.rate > 0 else 0
+                if pause > 0:
+                    self._stop.wait(pause)
+            if self._stop.is_set():
+                return True
+            self.spool.remove(segment)
+            self.spool.save_checkpoint(segment + 1, 0)
+            logger.info(f"Drained spool segment {segment}")
+        return True
+
+    def _replay(self, devices: List[Dict[str, Any]]):
+        gate = getattr(self.store, "ingest_gate", None)
+        for attempt in range(SPOOL_MAX_ATTEMPTS):
+            if gate:
+                gate()
+            # The indexer adds bookkeeping fields in place; keep the spooled copy clean for retries
+            if self.store.bulk_index_devices([dict(device) for device in devices]):
+                self.drained += len(devices)
+                return
+            if not self.store.ping():
+                raise ConnectionError("store unavailable")
+            time.sleep(min(2 ** attempt * 0.1, SPOOL_MAX_BACKOFF))
+        # The cluster is up but keeps refusing this batch: set it aside rather than block the spool
+        logger.error(f"Moving {len(devices)} devices to the spool dead-letter file after {SPOOL_MAX_ATTEMPTS} attempts")
+        self.spool.dead_letter(devices)
+        self.dead_letters += len(devices)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pending_bytes": self.spool.pending_bytes(),
+            "segments": len(self.spool.segments()),
+            "drained": self.drained,
+            "dead_letters": self.dead_letters,
+        }
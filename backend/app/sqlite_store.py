@@ -0,0 +1,635 @@
+import ipaddress
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .opensearch import (
+    CHANGES_SETTLE_MS, SEVERITY_RANGES, SUGGEST_CACHE_TTL, decode_cursor, derive_fields, encode_cursor, prepare_device
+)
+from .dashboard import DASHBOARD_TOP, HOUR_MS, SummaryCache, ingest_window, summarize
+from .query_planner import PORT_RANGE_RE, QueryPlan, plan_query
+from .scope import ScopeSet
+from .suggest import SUGGEST_FIELDS, PrefixCache
+
+logger = logging.getLogger(__name__)
+
+# Columns are the fields queries filter or sort on; the full device document
+# is kept as JSON in `doc`. FTS5 covers free text, the R-tree covers geo
+# boxes, and plain B-tree indexes cover timestamp/risk/cursor ordering.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    device_id TEXT PRIMARY KEY,
+    ip TEXT,
+    ip_num INTEGER,
+    port INTEGER,
+    hostname TEXT COLLATE NOCASE,
+    service TEXT COLLATE NOCASE,
+    status TEXT,
+    timestamp REAL,
+    indexed_at INTEGER,
+    first_seen INTEGER,
+    risk_score REAL,
+    max_cvss REAL,
+    vuln_count INTEGER,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_devices_timestamp ON devices(timestamp DESC);
+CREATE INDEX IF NOT EXISTS ix_devices_indexed_at ON devices(indexed_at, device_id);
+CREATE INDEX IF NOT EXISTS ix_devices_ip_num ON devices(ip_num);
+CREATE INDEX IF NOT EXISTS ix_devices_port ON devices(port);
+CREATE INDEX IF NOT EXISTS ix_devices_hostname ON devices(hostname);
+CREATE INDEX IF NOT EXISTS ix_devices_service ON devices(service);
+CREATE INDEX IF NOT EXISTS ix_devices_risk ON devices(risk_score DESC, device_id);
+CREATE INDEX IF NOT EXISTS ix_devices_max_cvss ON devices(max_cvss DESC, device_id) WHERE vuln_count > 0;
+CREATE TABLE IF NOT EXISTS device_cves (
+    cve_id TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    cvss_score REAL,
+    PRIMARY KEY (cve_id, device_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_device_cves_device ON device_cves(device_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS devices_fts USING fts5(hostname, service, descriptions, tokenize = 'unicode61');
+CREATE VIRTUAL TABLE IF NOT EXISTS devices_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+"""
+
+COLUMN_FIELDS = {"service": "service", "status": "status", "device_id": "device_id"}
+
+def _ip_num(ip: Any) -> Optional[int]:
+    try:
+        address = ipaddress.ip_address(str(ip))
+    except ValueError:
+        return None
+    # IPv6 doesn't fit SQLite's 64-bit integers; those rows match exact IPs only
+    return int(address) if address.version == 4 else None
+
+def _fts_phrase(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+def _glob_escape(value: str) -> str:
+    return "".join(f"[{c}]" if c in "*?[" else c for c in value)
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _project(doc: Any, fields: Sequence[str]) -> Any:
+    """Keep only the given (dotted) fields, as _source includes do; lists are projected per item"""
+    if isinstance(doc, list):
+        return [_project(item, fields) for item in doc]
+    if not isinstance(doc, dict):
+        return doc
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        key, _, rest = field.partition(".")
+        if key not in doc:
+            continue
+        if not rest:
+            projected[key] = doc[key]
+        elif isinstance(doc[key], (dict, list)):
+            inner = _project(doc[key], [rest])
+            if isinstance(inner, dict) and isinstance(projected.get(key), dict):
+                projected[key].update(inner)
+            elif isinstance(inner, list) and isinstance(projected.get(key), list):
+                for merged, item in zip(projected[key], inner):
+                    if isinstance(merged, dict) and isinstance(item, dict):
+                        merged.update(item)
+            elif key not in projected:
+                projected[key] = inner
+    return projected
+
+class SQLiteDeviceStore:
+    """Embedded single-file device store with the OpenSearchHelper interface used by the API.
+
+    Meant for single-node installs that should not run an OpenSearch JVM.
+    Query plans from query_planner run as indexed SQL filters; free text
+    uses FTS5 prefix matching (ranked by bm25) instead of fuzzy matching.
+    Each thread gets its own connection; writes are serialized.
+    """
+
+    def __init__(self, path: str = "avapt.db"):
+        self.path = path
+        # ":memory:" would give every thread its own empty database
+        self._uri = path == ":memory:"
+        if self._uri:
+            self.path = f"file:avapt-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.suggest_cache = PrefixCache(ttl=SUGGEST_CACHE_TTL)
+        self.summary_cache = SummaryCache()
+        self.listeners: List[Callable[[List[Tuple[str, Dict[str, Any]]]], None]] = []
+        # Keeps a shared in-memory database alive between requests
+        self._keepalive = self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, uri=self._uri, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            if not self._uri:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def ping(self) -> bool:
+        try:
+            self._conn().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def create_index_mappings(self) -> bool:
+        """Create tables and indexes if missing"""
+        if not self._uri and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            with self._write_lock:
+                conn = self._conn()
+                conn.executescript(SCHEMA)
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(devices)")}
+                if "first_seen" not in columns:
+                    # Databases from before first_seen: the best known first write is the last one
+                    conn.executescript(
+                        "ALTER TABLE devices ADD COLUMN first_seen INTEGER;"
+                        "UPDATE devices SET first_seen = indexed_at;"
+                    )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_devices_first_seen ON devices(first_seen)")
+            return True
+        except sqlite3.OperationalError as e:
+            # FTS5 and R-tree ship with the python.org and Debian SQLite builds
+            logger.error(f"Error creating SQLite schema (needs FTS5 and R-tree): {e}")
+            return False
+
+    # Writes
+
+    def index_device(self, device_data: Dict[str, Any]) -> bool:
+        """Index a device document"""
+        return self.bulk_index_devices([device_data])
+
+    def bulk_index_devices(self, devices: List[Dict[str, Any]]) -> bool:
+        """Upsert devices in one transaction"""
+        committed = []
+        try:
+            with self._write_lock:
+                # Stamped under the lock, so stamps follow commit order and a change-feed
+                # cursor never passes a write that has yet to commit
+                indexed_at = int(time.time() * 1000)
+                conn = self._conn()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for device in devices:
+                        if 'timestamp' not in device:
+                            device['timestamp'] = time.time() * 1000
+                        doc_id = prepare_device(device, indexed_at) or uuid.uuid4().hex
+                        result = self._upsert(conn, doc_id, device)
+                        committed.append((result, {**device, '_id': doc_id}))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            logger.error(f"Error bulk indexing devices: {e}")
+            return False
+        self.suggest_cache.clear()
+        self._notify(committed)
+        logger.info(f"Bulk indexed {len(committed)} devices")
+        return True
+
+    def _upsert(self, conn: sqlite3.Connection, doc_id: str, device: Dict[str, Any]) -> str:
+        row = conn.execute("SELECT rowid, first_seen FROM devices WHERE device_id = ?", (doc_id,)).fetchone()
+        # Set by the first write only; re-ingest and updates keep it
+        if row and row["first_seen"] is not None:
+            device['first_seen'] = row["first_seen"]
+        elif device.get('first_seen') is None:
+            device['first_seen'] = device.get('indexed_at')
+        values = (
+            device.get('ip'), _ip_num(device.get('ip')), device.get('port'), device.get('hostname'),
+            device.get('service'), device.get('status'), device.get('timestamp'), device.get('indexed_at'),
+            device.get('first_seen'), device.get('risk_score'), device.get('max_cvss'), device.get('vuln_count'),
+            json.dumps(device, default=str)
+        )
+        if row:
+            rowid = row["rowid"]
+            conn.execute(
+                "UPDATE devices SET ip = ?, ip_num = ?, port = ?, hostname = ?, service = ?, status = ?, timestamp = ?, "
+                "indexed_at = ?, first_seen = ?, risk_score = ?, max_cvss = ?, vuln_count = ?, doc = ? WHERE rowid = ?",
+                values + (rowid,)
+            )
+            conn.execute("DELETE FROM devices_fts WHERE rowid = ?", (rowid,))
+            conn.execute("DELETE FROM devices_geo WHERE id = ?", (rowid,))
+            conn.execute("DELETE FROM device_cves WHERE device_id = ?", (doc_id,))
+        else:
+            rowid = conn.execute(
+                "INSERT INTO devices (ip, ip_num, port, hostname, service, status, timestamp, indexed_at, first_seen, "
+                "risk_score, max_cvss, vuln_count, doc, device_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                values + (doc_id,)
+            ).lastrowid
+
+        vulns = [v for v in device.get('vulnerabilities') or [] if v.get('cve_id')]
+        conn.execute(
+            "INSERT INTO devices_fts (rowid, hostname, service, descriptions) VALUES (?, ?, ?, ?)",
+            (rowid, device.get('hostname') or "", device.get('service') or "",
+             " ".join(f"{v['cve_id']} {v.get('description') or ''}" for v in vulns))
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO device_cves (cve_id, device_id, cvss_score) VALUES (?, ?, ?)",
+            [(v['cve_id'], doc_id, v.get('cvss_score')) for v in vulns]
+        )
+        location = device.get('location')
+        if isinstance(location, dict) and location.get('lat') is not None and location.get('lon') is not None:
+            lat, lon = float(location['lat']), float(location['lon'])
+            conn.execute("INSERT INTO devices_geo (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+                         (rowid, lat, lat, lon, lon))
+        return "updated" if row else "created"
+
+    def recompute_derived_fields(self, cve_updates: Optional[Dict[str, Dict[str, Any]]] = None,
+                                 index: Optional[str] = None, touch: bool = True,
+                                 batch_size: int = 1000) -> Dict[str, int]:
+        """Same contract as OpenSearchHelper.recompute_derived_fields; `index` is ignored"""
+        stats = {"checked": 0, "updated": 0, "conflicts": 0, "errors": 0}
+        if cve_updates is not None and not cve_updates:
+            return stats
+        if cve_updates:
+            placeholders = ",".join("?" * len(cve_updates))
+            sql = f"SELECT doc FROM devices WHERE device_id IN (SELECT device_id FROM device_cves WHERE cve_id IN ({placeholders}))"
+            params: Sequence[Any] = list(cve_updates)
+        else:
+            sql, params = "SELECT doc FROM devices", ()
+
+        changed = []
+        for row in self._conn().execute(sql, params).fetchall():
+            stats["checked"] += 1
+            device = json.loads(row["doc"])
+            before = json.dumps(device, sort_keys=True, default=str)
+            if cve_updates:
+                device['vulnerabilities'] = [
+                    {**v, **{k: cve_updates.get(v.get('cve_id'), {})[k]
+                             for k in ('cvss_score', 'description') if k in cve_updates.get(v.get('cve_id'), {})}}
+                    for v in device.get('vulnerabilities') or []
+                ]
+            device.update(derive_fields(device))
+            if json.dumps(device, sort_keys=True, default=str) != before:
+                changed.append(device)
+        if changed:
+            self._rewrite(changed, touch)
+        stats["updated"] = len(changed)
+        logger.info(f"Recomputed derived fields: {stats}")
+        return stats
+
+    def add_device_vulnerabilities(self, matches: Dict[str, List[Dict[str, Any]]],
+                                   batch_size: int = 500) -> Dict[str, int]:
+        """Same contract as OpenSearchHelper.add_device_vulnerabilities"""
+        stats = {"checked": 0, "updated": 0, "conflicts": 0, "errors": 0}
+        changed = []
+        for device_id, entries in matches.items():
+            row = self._conn().execute("SELECT doc FROM devices WHERE device_id = ?", (device_id,)).fetchone()
+            if not row:
+                continue
+            stats["checked"] += 1
+            device = json.loads(row["doc"])
+            known = {v.get('cve_id') for v in device.get('vulnerabilities') or []}
+            added = [v for v in entries if v['cve_id'] not in known]
+            if added:
+                device['vulnerabilities'] = list(device.get('vulnerabilities') or []) + added
+                device.update(derive_fields(device))
+                changed.append(device)
+        if changed:
+            self._rewrite(changed, touch=True)
+        stats["updated"] = len(changed)
+        return stats
+
+    def _rewrite(self, devices: List[Dict[str, Any]], touch: bool):
+        with self._write_lock:
+            indexed_at = int(time.time() * 1000)
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for device in devices:
+                    if touch:
+                        device['indexed_at'] = indexed_at
+                    self._upsert(conn, device['device_id'], device)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self.suggest_cache.clear()
+
+    def delete_index(self) -> bool:
+        """Delete every device (for testing/cleanup)"""
+        with self._write_lock:
+            self._conn().executescript(
+                "DELETE FROM devices; DELETE FROM device_cves; DELETE FROM devices_fts; DELETE FROM devices_geo;"
+            )
+        return True
+
+    # Reads
+
+    def _devices(self, sql: str, params: Sequence[Any] = (), fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        devices = []
+        for row in self._conn().execute(sql, params):
+            device = json.loads(row["doc"])
+            if fields:
+                device = _project(device, fields)
+            device['_id'] = row["device_id"]
+            devices.append(device)
+        return devices
+
+    def search_devices(self, query: Optional[str] = None, size: int = 100,
+                       fields: Optional[Sequence[str]] = None, scope: Optional[ScopeSet] = None) -> List[Dict[str, Any]]:
+        """Search devices with optional query; `fields` limits each document to those fields,
+        `scope` to devices whose IP is in an ROE scope"""
+        devices, _ = self.search_devices_planned(query, size, fields, scope)
+        return devices
+
+    def search_devices_planned(self, query: Optional[str] = None, size: int = 100,
+                               fields: Optional[Sequence[str]] = None,
+                               scope: Optional[ScopeSet] = None) -> Tuple[List[Dict[str, Any]], Optional[QueryPlan]]:
+        """Search devices and return the query plan that was used (None for the recent-devices listing)"""
+        in_scope = "1"
+        if scope is not None:
+            # Per-thread connection, so the function is this query's scope
+            self._conn().create_function("in_scope", 1, scope.contains, deterministic=True)
+            in_scope = "in_scope(ip)"
+        if not query or not query.strip():
+            sql = f"SELECT device_id, doc FROM devices WHERE {in_scope} ORDER BY timestamp DESC LIMIT ?"
+            return self._devices(sql, (size,), fields), None
+
+        plan = plan_query(query)
+        where, params = self._plan_sql(plan)
+        if scope is not None:
+            where = f"{where} AND in_scope(d.ip)"
+        try:
+            if plan.free_text:
+                match = " OR ".join(_fts_phrase(t) + "*" for t in plan.free_text)
+                if plan.port_hints:
+                    # Text matches first by rank, then devices that only match a bare number's port
+                    marks = ", ".join("?" * len(plan.port_hints))
+                    sql = (f"SELECT d.device_id, d.doc FROM devices d LEFT JOIN "
+                           f"(SELECT rowid, bm25(devices_fts) AS rank FROM devices_fts WHERE devices_fts MATCH ?) f "
+                           f"ON f.rowid = d.rowid WHERE (f.rowid IS NOT NULL OR d.port IN ({marks})) AND {where} "
+                           f"ORDER BY f.rank IS NULL, f.rank, d.timestamp DESC LIMIT ?")
+                    return self._devices(sql, [match] + plan.port_hints + params + [size], fields), plan
+                sql = (f"SELECT d.device_id, d.doc FROM devices_fts f JOIN devices d ON d.rowid = f.rowid "
+                       f"WHERE devices_fts MATCH ? AND {where} ORDER BY bm25(devices_fts) LIMIT ?")
+                return self._devices(sql, [match] + params + [size], fields), plan
+            sql = f"SELECT d.device_id, d.doc FROM devices d WHERE {where} ORDER BY d.timestamp DESC LIMIT ?"
+            return self._devices(sql, params + [size], fields), plan
+        except sqlite3.Error as e:
+            logger.error(f"Error searching devices: {e}")
+            return [], plan
+
+    def _plan_sql(self, plan: QueryPlan) -> Tuple[str, List[Any]]:
+        """WHERE clause for a plan's exact filters: ANDed across fields, ORed within one"""
+        groups: Dict[str, List[Tuple[str, List[Any]]]] = {}
+        for clause in plan.clauses:
+            kind, value = clause["kind"], clause["value"]
+            field = clause["field"].split(".keyword")[0]
+            if kind == "ip":
+                sql, params = "d.ip = ?", [value]
+            elif kind == "cidr":
+                network = ipaddress.ip_network(value, strict=False)
+                if network.version == 4:
+                    sql, params = "d.ip_num BETWEEN ? AND ?", [int(network.network_address), int(network.broadcast_address)]
+                else:
+                    sql, params = "0", []
+            elif kind == "port":
+                sql, params = "d.port = ?", [int(value)]
+            elif kind == "port_range":
+                low, high = PORT_RANGE_RE.match(value).groups()
+                sql, params = "d.port BETWEEN ? AND ?", [int(low or 0), int(high or 65535)]
+            elif kind == "cve":
+                sql, params = "d.device_id IN (SELECT device_id FROM device_cves WHERE cve_id = ?)", [value]
+            elif kind == "cve_prefix":
+                sql, params = "d.device_id IN (SELECT device_id FROM device_cves WHERE cve_id GLOB ?)", [_glob_escape(value) + "*"]
+            elif kind == "prefix":
+                sql, params = "d.hostname LIKE ? ESCAPE '\\'", [_like_escape(value) + "%"]
+            elif kind == "match":
+                tokens = " AND ".join(_fts_phrase(t) for t in value.split())
+                sql, params = "d.rowid IN (SELECT rowid FROM devices_fts WHERE devices_fts MATCH ?)", [f"hostname : ({tokens})"]
+            elif field in COLUMN_FIELDS:
+                sql, params = f"d.{COLUMN_FIELDS[field]} = ?", [value]
+            else:
+                continue
+            groups.setdefault(field, []).append((sql, params))
+
+        clauses, params = [], []
+        for items in groups.values():
+            clauses.append("(" + " OR ".join(sql for sql, _ in items) + ")")
+            for _, item_params in items:
+                params.extend(item_params)
+        return (" AND ".join(clauses) or "1"), params
+
+    def suggest(self, prefix: str, fields: Tuple[str, ...] = tuple(SUGGEST_FIELDS), size: int = 10) -> Dict[str, Any]:
+        """Typeahead suggestions from the hostname/service indexes and the CVE table"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return {"prefix": prefix, "suggestions": {field: [] for field in fields}, "cached": False}
+        groups = self.suggest_cache.get(fields, size, prefix)
+        if groups is not None:
+            return {"prefix": prefix, "suggestions": groups, "cached": True}
+
+        conn = self._conn()
+        like = _like_escape(prefix) + "%"
+        groups = {}
+        for field in fields:
+            if field == "cve":
+                rows = conn.execute("SELECT DISTINCT cve_id FROM device_cves WHERE cve_id GLOB ? ORDER BY cve_id LIMIT ?",
+                                    (_glob_escape(prefix.upper()) + "*", size))
+            else:
+                rows = conn.execute(f"SELECT DISTINCT {field} FROM devices WHERE {field} LIKE ? ESCAPE '\\' "
+                                    f"ORDER BY {field} LIMIT ?", (like, size))
+            groups[field] = [row[0] for row in rows]
+        self.suggest_cache.put(fields, size, prefix, groups)
+        return {"prefix": prefix, "suggestions": groups, "cached": False}
+
+    def get_device_changes(self, cursor: Optional[str] = None, size: int = 500) -> Dict[str, Any]:
+        """Devices written since `cursor`, oldest first, with the cursor for the next call"""
+        sql = "SELECT device_id, doc, indexed_at FROM devices WHERE indexed_at <= ?"
+        params: List[Any] = [int(time.time() * 1000) - CHANGES_SETTLE_MS]
+        if cursor:
+            indexed_at, device_id = decode_cursor(cursor)
+            sql += " AND (indexed_at > ? OR (indexed_at = ? AND device_id > ?))"
+            params += [indexed_at, indexed_at, device_id]
+        sql += " ORDER BY indexed_at, device_id LIMIT ?"
+        rows = self._conn().execute(sql, params + [size]).fetchall()
+        devices = []
+        for row in rows:
+            device = json.loads(row["doc"])
+            device['_id'] = row["device_id"]
+            devices.append(device)
+        next_cursor = encode_cursor([rows[-1]["indexed_at"], rows[-1]["device_id"]]) if rows else cursor
+        return {"devices": devices, "cursor": next_cursor, "has_more": len(rows) == size}
+
+    def iter_device_batches(self, batch_size: int = 5000, source_excludes: Sequence[str] = ("data",),
+                            **kwargs) -> Iterator[List[Dict[str, Any]]]:
+        """Stream every device in rowid order, one list per batch"""
+        last = 0
+        while True:
+            rows = self._conn().execute(
+                "SELECT rowid, device_id, doc FROM devices WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            batch = []
+            for row in rows:
+                device = json.loads(row["doc"])
+                for field in source_excludes:
+                    device.pop(field, None)
+                device['_id'] = row["device_id"]
+                batch.append(device)
+            last = rows[-1]["rowid"]
+            yield batch
+
+    def get_vulnerable_devices(self, cursor: Optional[str] = None, size: int = 100,
+                               min_cvss: Optional[float] = None) -> Dict[str, Any]:
+        """Same contract as OpenSearchHelper.get_vulnerable_devices"""
+        where = "d.vuln_count > 0"
+        params: List[Any] = []
+        if min_cvss is not None:
+            where += " AND d.device_id IN (SELECT device_id FROM device_cves WHERE cvss_score >= ?)"
+            params.append(min_cvss)
+        page_where, page_params = where, list(params)
+        if cursor:
+            max_cvss, device_id = decode_cursor(cursor)
+            page_where += " AND (d.max_cvss < ? OR (d.max_cvss = ? AND d.device_id > ?))"
+            page_params += [max_cvss, max_cvss, device_id]
+
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT d.device_id, d.doc, d.max_cvss FROM devices d WHERE {page_where} "
+            f"ORDER BY d.max_cvss DESC, d.device_id LIMIT ?", page_params + [size]
+        ).fetchall()
+        devices = []
+        for row in rows:
+            device = json.loads(row["doc"])
+            device.pop('data', None)
+            device['_id'] = row["device_id"]
+            devices.append(device)
+        result = {
+            "devices": devices,
+            "cursor": encode_cursor([rows[-1]["max_cvss"], rows[-1]["device_id"]]) if rows else cursor,
+            "has_more": len(rows) == size
+        }
+        if cursor is None:
+            result["total"] = conn.execute(f"SELECT COUNT(*) FROM devices d WHERE {where}", params).fetchone()[0]
+            bands = " ".join(
+                f"WHEN c.cvss_score >= {band.get('from', float('-inf'))} AND c.cvss_score < {band.get('to', 1e9)} "
+                f"THEN '{band['key']}'"
+                for band in SEVERITY_RANGES if "from" in band or "to" in band
+            ).replace("-inf", "-1e9")
+            # Count only the entries the query matched on (min_cvss), not every entry of those devices
+            band_where, band_params = where, list(params)
+            if min_cvss is not None:
+                band_where += " AND c.cvss_score >= ?"
+                band_params.append(min_cvss)
+            counts = conn.execute(
+                f"SELECT CASE {bands} END AS band, COUNT(*), COUNT(DISTINCT c.device_id) FROM device_cves c "
+                f"JOIN devices d ON d.device_id = c.device_id WHERE {band_where} GROUP BY band", band_params
+            ).fetchall()
+            found = {row[0]: (row[1], row[2]) for row in counts}
+            result["severity"] = {
+                band["key"]: {"vulnerabilities": found.get(band["key"], (0, 0))[0],
+                              "devices": found.get(band["key"], (0, 0))[1]}
+                for band in SEVERITY_RANGES
+            }
+        return result
+
+    def top_risk_devices(self, size: int = 20, min_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Highest risk_score devices first"""
+        sql = "SELECT device_id, doc FROM devices"
+        params: List[Any] = []
+        if min_score is not None:
+            sql += " WHERE risk_score >= ?"
+            params.append(min_score)
+        devices = self._devices(sql + " ORDER BY risk_score DESC, device_id LIMIT ?", params + [size])
+        for device in devices:
+            device.pop('data', None)
+        return devices
+
+    def devices_in_bbox(self, top: float, left: float, bottom: float, right: float,
+                        size: int = 1000) -> List[Dict[str, Any]]:
+        """Devices whose location falls inside a lat/lon bounding box, via the R-tree"""
+        devices = self._devices(
+            "SELECT d.device_id, d.doc FROM devices_geo g JOIN devices d ON d.rowid = g.id "
+            "WHERE g.min_lat >= ? AND g.max_lat <= ? AND g.min_lon >= ? AND g.max_lon <= ? "
+            "ORDER BY d.timestamp DESC LIMIT ?",
+            (bottom, top, left, right, size)
+        )
+        for device in devices:
+            device.pop('data', None)
+        return devices
+
+    def get_stats(self) -> Dict[str, int]:
+        total, vulnerable = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(vuln_count > 0), 0) FROM devices"
+        ).fetchone()
+        return {"total_devices": total, "vulnerable_devices": vulnerable}
+
+    def dashboard_summary(self, top: int = DASHBOARD_TOP) -> Dict[str, Any]:
+        """Command Center figures, the same document as the OpenSearch aggregation, cached for a few seconds"""
+        return self.summary_cache.get_or_compute(top, lambda: self._dashboard_summary(top))
+
+    def _dashboard_summary(self, top: int) -> Dict[str, Any]:
+        since, now = ingest_window()
+        # Same bands as the OpenSearch range aggregation: from inclusive, to exclusive
+        bands = []
+        for band in SEVERITY_RANGES:
+            conditions = []
+            if "from" in band:
+                conditions.append(f"max_cvss >= {band['from']}")
+            if "to" in band:
+                conditions.append(f"max_cvss < {band['to']}")
+            bands.append(" AND ".join(conditions))
+        conn = self._conn()
+        # One read transaction, so every figure comes from the same snapshot
+        conn.execute("BEGIN")
+        try:
+            status = dict(conn.execute("SELECT COALESCE(status, 'unknown'), COUNT(*) FROM devices GROUP BY 1"))
+            row = conn.execute(
+                "SELECT COUNT(*), " + ", ".join(f"COALESCE(SUM({band}), 0)" for band in bands) +
+                " FROM devices WHERE vuln_count > 0"
+            ).fetchone()
+            services = conn.execute(
+                "SELECT service, COUNT(*) AS n FROM devices WHERE service IS NOT NULL "
+                "GROUP BY service ORDER BY n DESC, service LIMIT ?", (top,)
+            ).fetchall()
+            ports = conn.execute(
+                "SELECT port, COUNT(*) AS n FROM devices WHERE port IS NOT NULL "
+                "GROUP BY port ORDER BY n DESC, port LIMIT ?", (top,)
+            ).fetchall()
+            hourly = dict(conn.execute(
+                "SELECT first_seen / ? * ?, COUNT(*) FROM devices WHERE first_seen BETWEEN ? AND ? GROUP BY 1",
+                (HOUR_MS, HOUR_MS, since, now)
+            ))
+        finally:
+            conn.execute("COMMIT")
+        return summarize(
+            total=sum(status.values()),
+            status=status,
+            vulnerable=row[0],
+            severity={band["key"]: count for band, count in zip(SEVERITY_RANGES, row[1:])},
+            services=[tuple(r) for r in services],
+            ports=[tuple(r) for r in ports],
+            hourly=hourly,
+            since=since,
+            now=now
+        )
+
+    # Listeners
+
+    def add_listener(self, listener: Callable[[List[Tuple[str, Dict[str, Any]]]], None]):
+        """Register a callback receiving (result, device) pairs after each committed write"""
+        self.listeners.append(listener)
+
+    def _notify(self, committed: List[Tuple[str, Dict[str, Any]]]):
+        if not committed:
+            return
+        for listener in self.listeners:
+            try:
+                listener(committed)
+            except Exception as e:
+                logger.error(f"Index listener failed: {e}")
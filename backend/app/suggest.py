@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Suggestion group -> completion subfield. Shodan's `product` (vendor/model
+# string) is stored as `service`, so that group covers vendor and model too.
+SUGGEST_FIELDS = {
+    "hostname": "hostname.suggest",
+    "service": "service.suggest",
+    "cve": "cve_ids.suggest",
+}
+
+class PrefixCache:
+    """Small thread-safe LRU of suggestion results keyed by (fields, size, prefix).
+
+    An entry that came back with fewer than `size` options per group is
+    exhaustive, so it also answers any longer prefix by filtering, without
+    another round trip.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, int, str], Tuple[float, Dict[str, List[str]], bool]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fields: Tuple[str, ...], size: int, prefix: str) -> Optional[Dict[str, List[str]]]:
+        now = time.time()
+        key_fields = ",".join(fields)
+        with self._lock:
+            for length in range(len(prefix), 0, -1):
+                key = (key_fields, size, prefix[:length])
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                stored_at, groups, exhaustive = entry
+                if now - stored_at > self.ttl:
+                    del self._entries[key]
+                    continue
+                if length < len(prefix) and not exhaustive:
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if length == len(prefix):
+                    return groups
+                return {
+                    group: [text for text in options if text.lower().startswith(prefix)]
+                    for group, options in groups.items()
+                }
+            self.misses += 1
+        return None
+
+    def put(self, fields: Tuple[str, ...], size: int, prefix: str, groups: Dict[str, List[str]]):
+        exhaustive = all(len(options) < size for options in groups.values())
+        with self._lock:
+            self._entries[(",".join(fields), size, prefix)] = (time.time(), groups, exhaustive)
+            self._entries.move_to_end((",".join(fields), size, prefix))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def build_suggest_body(prefix: str, fields: Tuple[str, ...], size: int) -> Dict[str, Any]:
+    """Completion-suggester-only search body; no hits, no _source"""
+    return {
+        "size": 0,
+        "_source": False,
+        "suggest": {
+            group: {
+                "prefix": prefix,
+                "completion": {"field": SUGGEST_FIELDS[group], "size": size, "skip_duplicates": True}
+            }
+            for group in fields
+        }
+    }
+
+def parse_suggest_response(response: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, List[str]]:
+    suggest = response.get("suggest", {})
+    groups = {}
+    for group in fields:
+        options = []
+        for entry in suggest.get(group, []):
+            for option in entry.get("options", []):
+                if option.get("text") not in options:
+                    options.append(option.get("text"))
+        groups[group] = options
+    return groups
@@ -0,0 +1,187 @@
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Vendor mix of internet-facing cameras/recorders: share of the fleet,
+# Shodan-style product string, models, firmware versions (oldest first,
+# the field skews old), ports with weights, and the CVEs affecting them.
+VENDORS = [
+    {
+        "name": "Hikvision", "share": 0.34, "product": "Hikvision IP Camera",
+        "models": ["DS-2CD2042WD", "DS-2CD2143G0", "DS-2CD2385FWD", "DS-7608NI"],
+        "firmware": ["V5.2.0", "V5.4.5", "V5.5.0", "V5.6.3", "V5.7.3"],
+        "ports": {80: 0.5, 554: 0.25, 8000: 0.15, 443: 0.1},
+        "banner": "HTTP/1.1 200 OK\r\nServer: Hikvision-Webs\r\nX-Model: {model}\r\nX-Firmware: {firmware}",
+        "cves": ["CVE-2017-7921", "CVE-2021-36260", "CVE-2022-28171"],
+    },
+    {
+        "name": "Dahua", "share": 0.24, "product": "Dahua DVR",
+        "models": ["DH-IPC-HDW1230S", "DH-XVR5104HS", "DH-NVR4104HS"],
+        "firmware": ["2.400.0000", "2.600.0000", "2.800.0000"],
+        "ports": {80: 0.35, 554: 0.25, 37777: 0.3, 443: 0.1},
+        "banner": "Dahua Rtsp Server\r\nModel: {model}\r\nFirmware: {firmware}",
+        "cves": ["CVE-2021-33044", "CVE-2021-33045", "CVE-2022-30563"],
+    },
+    {
+        "name": "Axis", "share": 0.1, "product": "AXIS Network Camera",
+        "models": ["M3045-V", "P1435-LE", "Q6055-E"],
+        "firmware": ["6.50.1", "8.40.1", "9.80.1", "10.12.0"],
+        "ports": {80: 0.6, 443: 0.3, 554: 0.1},
+        "banner": "HTTP/1.1 401 Unauthorized\r\nServer: Boa\r\nAXIS {model} Network Camera {firmware}",
+        "cves": ["CVE-2018-10660", "CVE-2018-10661", "CVE-2018-10662"],
+    },
+    {
+        "name": "Uniview", "share": 0.08, "product": "Uniview IPC",
+        "models": ["IPC322LR3", "NVR301-04"],
+        "firmware": ["GIPC-B6202.1", "GIPC-B6202.7"],
+        "ports": {80: 0.6, 554: 0.4},
+        "banner": "Server: Uniview {model} firmware {firmware}",
+        "cves": ["CVE-2021-45039"],
+    },
+    {
+        "name": "XMeye", "share": 0.14, "product": "XMeye DVR",
+        "models": ["NBD80X16S", "AHB7008T"],
+        "firmware": ["V4.02.R11", "V4.03.R11"],
+        "ports": {34567: 0.5, 80: 0.3, 23: 0.2},
+        "banner": "NetSurveillance WEB {model} {firmware}",
+        "cves": ["CVE-2018-17915", "CVE-2017-16725"],
+    },
+    {
+        "name": "GenericCam", "share": 0.1, "product": "RTSP Camera",
+        "models": ["GC-100", "GC-200"],
+        "firmware": ["1.2.3", "1.4.0"],
+        "ports": {554: 0.6, 80: 0.3, 21: 0.1},
+        "banner": "RTSP/1.0 200 OK\r\nServer: GenericCam {model} firmware: v{firmware}",
+        "cves": ["CVE-2021-0001"],
+    },
+]
+
+# Base scores and short descriptions for the CVEs above
+CVE_DETAILS = {
+    "CVE-2017-7921": (10.0, "Improper authentication allows privilege escalation and information disclosure"),
+    "CVE-2021-36260": (9.8, "Command injection in the web server via crafted messages"),
+    "CVE-2022-28171": (9.8, "Command injection in the web module"),
+    "CVE-2021-33044": (9.8, "Identity authentication bypass by constructing malicious data packets"),
+    "CVE-2021-33045": (9.8, "Identity authentication bypass during the login process"),
+    "CVE-2022-30563": (7.4, "Login packet sniffing allows session hijacking"),
+    "CVE-2018-10660": (9.8, "Shell command injection in the web interface"),
+    "CVE-2018-10661": (9.8, "Access control bypass in the web server"),
+    "CVE-2018-10662": (9.8, "Unrestricted dbus access through an exposed interface"),
+    "CVE-2021-45039": (9.8, "Buffer overflow in the RTSP service"),
+    "CVE-2018-17915": (9.8, "Default credentials on the telnet and web services"),
+    "CVE-2017-16725": (9.8, "Stack-based buffer overflow in the NetSurveillance web server"),
+    "CVE-2021-0001": (7.5, "Camera firmware buffer overflow vulnerability"),
+}
+
+# Population centres points are scattered around: lat, lon, share, spread (degrees)
+CITIES = [
+    (37.77, -122.42, 0.07, 0.6), (40.71, -74.01, 0.09, 0.5), (41.88, -87.63, 0.05, 0.5),
+    (51.51, -0.13, 0.08, 0.5), (48.86, 2.35, 0.05, 0.5), (52.52, 13.40, 0.05, 0.5),
+    (55.76, 37.62, 0.06, 0.7), (35.68, 139.65, 0.07, 0.4), (37.57, 126.98, 0.07, 0.3),
+    (31.23, 121.47, 0.12, 0.8), (22.54, 114.06, 0.08, 0.5), (28.61, 77.21, 0.06, 0.8),
+    (-23.55, -46.63, 0.06, 0.7), (19.43, -99.13, 0.05, 0.6), (30.04, 31.24, 0.04, 0.5),
+]
+
+STATUSES = np.array(["online", "offline", "unknown"])
+STATUS_SHARES = [0.85, 0.1, 0.05]
+HOSTNAME_SHARE = 0.4
+SEEN_WINDOW_MS = 30 * 24 * 3600 * 1000
+
+class SyntheticDeviceGenerator:
+    """Seeded, reproducible device records generated in NumPy batches.
+
+    IPs are unique across the whole run: the i-th device gets an odd-
+    multiplier affine permutation of i over the 32-bit space. Each batch
+    draws from its own generator seeded by (seed, batch number), so a given
+    seed, batch size and now_ms always yield the same records.
+    """
+
+    def __init__(self, seed: int = 0, cve_rate: float = 0.3, batch_size: int = 100_000,
+                 now_ms: Optional[float] = None):
+        self.seed = seed
+        self.cve_rate = cve_rate
+        self.batch_size = batch_size
+        self.now_ms = now_ms if now_ms is not None else time.time() * 1000
+        rng = np.random.default_rng(seed)
+        self._ip_mult = int(rng.integers(1 << 20, 1 << 31)) * 2 + 1
+        self._ip_offset = int(rng.integers(0, 1 << 32))
+        self._vendor_shares = np.array([v["share"] for v in VENDORS]) / sum(v["share"] for v in VENDORS)
+        self._city_shares = np.array([c[2] for c in CITIES]) / sum(c[2] for c in CITIES)
+        self._port_cdfs = [np.cumsum(list(v["ports"].values())) / sum(v["ports"].values()) for v in VENDORS]
+        # Old firmware dominates: version k of n is weighted n - k
+        self._firmware_cdfs = [np.cumsum(np.arange(len(v["firmware"]), 0, -1)) / sum(range(len(v["firmware"]) + 1))
+                               for v in VENDORS]
+
+    def batches(self, count: int) -> Iterator[List[Dict[str, Any]]]:
+        """Device documents in lists of up to batch_size"""
+        for number, start in enumerate(range(0, count, self.batch_size)):
+            yield self.batch(number, start, min(self.batch_size, count - start))
+
+    def batch(self, number: int, start: int, size: int) -> List[Dict[str, Any]]:
+        rng = np.random.default_rng([self.seed, number])
+        index = np.arange(start, start + size, dtype=np.uint64)
+        ips = (index * np.uint64(self._ip_mult) + np.uint64(self._ip_offset)) & np.uint64(0xFFFFFFFF)
+        octets = [((ips >> np.uint64(shift)) & np.uint64(0xFF)).tolist() for shift in (24, 16, 8, 0)]
+
+        vendors = rng.choice(len(VENDORS), size=size, p=self._vendor_shares)
+        cities = rng.choice(len(CITIES), size=size, p=self._city_shares)
+        spread = np.array([c[3] for c in CITIES])[cities]
+        lats = np.clip(np.array([c[0] for c in CITIES])[cities] + rng.normal(0, 1, size) * spread, -89.9, 89.9)
+        lons = (np.array([c[1] for c in CITIES])[cities] + rng.normal(0, 1, size) * spread + 180) % 360 - 180
+        statuses = STATUSES[rng.choice(len(STATUSES), size=size, p=STATUS_SHARES)]
+        seen = self.now_ms - rng.random(size) * SEEN_WINDOW_MS
+        last_seen = np.datetime_as_string(seen.astype("datetime64[ms]"), unit="s").tolist()
+        has_hostname = rng.random(size) < HOSTNAME_SHARE
+        vulnerable = rng.random(size) < self.cve_rate
+        extra_cves = np.minimum(rng.poisson(0.5, size), 3)
+        cve_pick = rng.random((size, 4))
+
+        ports = np.zeros(size, dtype=np.int64)
+        models = np.zeros(size, dtype=np.int64)
+        firmware = np.zeros(size, dtype=np.int64)
+        port_pick, model_pick, firmware_pick = rng.random(size), rng.random(size), rng.random(size)
+        for v, vendor in enumerate(VENDORS):
+            mask = vendors == v
+            port_idx = np.minimum(np.searchsorted(self._port_cdfs[v], port_pick[mask], side="right"), len(vendor["ports"]) - 1)
+            ports[mask] = np.array(list(vendor["ports"]))[port_idx]
+            models[mask] = (model_pick[mask] * len(vendor["models"])).astype(np.int64)
+            firmware[mask] = np.minimum(np.searchsorted(self._firmware_cdfs[v], firmware_pick[mask], side="right"),
+                                        len(vendor["firmware"]) - 1)
+
+        vendors, ports, models, firmware = vendors.tolist(), ports.tolist(), models.tolist(), firmware.tolist()
+        lats, lons, seen = np.round(lats, 5).tolist(), np.round(lons, 5).tolist(), seen.tolist()
+        devices = []
+        for i in range(size):
+            vendor = VENDORS[vendors[i]]
+            ip = f"{octets[0][i]}.{octets[1][i]}.{octets[2][i]}.{octets[3][i]}"
+            model = vendor["models"][models[i]]
+            device = {
+                'ip': ip,
+                'port': ports[i],
+                'hostname': f"{ip.replace('.', '-')}.{vendor['name'].lower()}.example.net" if has_hostname[i] else '',
+                'service': vendor["product"],
+                'status': str(statuses[i]),
+                'data': vendor["banner"].format(model=model, firmware=vendor["firmware"][firmware[i]]),
+                'location': {'lat': lats[i], 'lon': lons[i]},
+                'last_seen': last_seen[i] + "Z",
+                'timestamp': seen[i],
+                'vulnerabilities': []
+            }
+            if vulnerable[i]:
+                candidates = vendor["cves"]
+                picks = {candidates[int(p * len(candidates))] for p in cve_pick[i][:1 + extra_cves[i]]}
+                device['vulnerabilities'] = [
+                    {
+                        'cve_id': cve_id,
+                        'description': CVE_DETAILS[cve_id][1],
+                        'cvss_score': CVE_DETAILS[cve_id][0],
+                        'type': 'product_match'
+                    }
+                    for cve_id in sorted(picks)
+                ]
+            devices.append(device)
+        return devices
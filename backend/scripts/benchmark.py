@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+# Micro-benchmarks for the backend CPU hot paths.
+#
+#   python scripts/benchmark.py --out bench.json
+#   python scripts/benchmark.py --out new.json --compare bench.json
+#
+# Results are plain JSON so runs from different commits can be diffed; with
+# --compare the script exits non-zero when any benchmark's median regressed
+# past --threshold.
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import cve_map  # noqa: E402
+from app.cve_store import CVEStore  # noqa: E402
+from app.ingest import generate_sample_devices, parse_shodan_banner  # noqa: E402
+from app.opensearch import OpenSearchHelper  # noqa: E402
+from fake_opensearch import FakeOpenSearch  # noqa: E402
+
+SAMPLE_BANNERS = [
+    "HTTP/1.1 401 Unauthorized\r\nServer: Hikvision-Webs\r\nWWW-Authenticate: Digest realm=\"DS-2CD2042WD\"",
+    "RTSP/1.0 200 OK\r\nCSeq: 1\r\nServer: Dahua Rtsp Server/2.0\r\nPublic: OPTIONS, DESCRIBE, PLAY",
+    "HTTP/1.0 200 OK\r\nServer: GoAhead-Webs\r\nContent-Type: text/html\r\n\r\nIP Camera firmware V2.1.3 login admin",
+    "HTTP/1.1 200 OK\r\nServer: lighttpd/1.4.35\r\n\r\n<title>NVR Web Interface</title> default password",
+    "Axis M3045-V Network Camera 9.80.1 RTSP stream authentication required",
+]
+
+KEYWORD_VOCABULARY = [
+    "camera", "firmware", "buffer", "overflow", "cctv", "default", "credentials", "web",
+    "interface", "admin", "password", "rtsp", "stream", "authentication", "bypass", "dvr",
+    "nvr", "onvif", "telnet", "injection", "command", "traversal", "upload", "xss", "csrf",
+    "hikvision", "dahua", "axis", "goahead", "lighttpd", "rce", "denial", "service",
+]
+
+
+def make_cves(count: int, seed: int = 1) -> List[Dict[str, Any]]:
+    """Build a synthetic CVE list shaped like cve_map.SAMPLE_CVES"""
+    rng = random.Random(seed)
+    cves = []
+    for i in range(count):
+        keywords = rng.sample(KEYWORD_VOCABULARY, rng.randint(3, 6))
+        cves.append({
+            "cve_id": f"CVE-{2015 + i % 10}-{10000 + i}",
+            "description": " ".join(keywords).capitalize() + " vulnerability",
+            "cvss_score": round(rng.uniform(2.0, 10.0), 1),
+            "keywords": keywords,
+        })
+    return cves
+
+
+def make_shodan_results(count: int, seed: int = 1) -> List[Dict[str, Any]]:
+    """Build raw Shodan search matches for the banner parser"""
+    rng = random.Random(seed)
+    results = []
+    for i in range(count):
+        result = {
+            "ip_str": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            "port": rng.choice([80, 443, 554, 8080]),
+            "hostnames": [f"cam-{i}.example.net"] if rng.random() < 0.5 else [],
+            "product": rng.choice(["Hikvision IP Camera", "Dahua DVR", "GoAhead-Webs", "Axis"]),
+            "data": rng.choice(SAMPLE_BANNERS),
+        }
+        if rng.random() < 0.8:
+            result["location"] = {"latitude": rng.uniform(-60, 60), "longitude": rng.uniform(-180, 180)}
+        results.append(result)
+    return results
+
+
+def measure(fn: Callable[[], Any], repeat: int, number: int) -> Dict[str, Any]:
+    """Time fn() `number` times per round over `repeat` rounds"""
+    fn()  # warm-up
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started) / number)
+    median = statistics.median(rounds)
+    return {
+        "repeat": repeat,
+        "number": number,
+        "min_s": min(rounds),
+        "median_s": median,
+        "mean_s": statistics.fmean(rounds),
+        "stdev_s": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        "ops_per_s": (1.0 / median) if median else None,
+    }
+
+
+def bench_match_cves(cve_count: int, repeat: int) -> Dict[str, Any]:
+    # match_cves_text reads the loaded store, not SAMPLE_CVES, so swap the store itself
+    records = cve_map.SAMPLE_CVES if cve_count <= len(cve_map.SAMPLE_CVES) else make_cves(cve_count)
+    original = cve_map._store
+    cve_map._store = CVEStore.from_records(records)
+    try:
+        def run():
+            for banner in SAMPLE_BANNERS:
+                cve_map.match_cves_text(banner)
+        number = max(1, 3000 // max(cve_count, 1))
+        result = measure(run, repeat, number)
+    finally:
+        cve_map._store = original
+    result["items"] = len(SAMPLE_BANNERS)
+    return result
+
+
+def bench_generate_devices(count: int, repeat: int) -> Dict[str, Any]:
+    random.seed(0)
+    result = measure(lambda: generate_sample_devices(count), repeat, 1)
+    result["items"] = count
+    return result
+
+
+def bench_parse_banners(count: int, repeat: int) -> Dict[str, Any]:
+    results = make_shodan_results(count)
+    result = measure(lambda: [parse_shodan_banner(r) for r in results], repeat, 1)
+    result["items"] = count
+    return result
+
+
+def bench_bulk_index(count: int, repeat: int) -> Dict[str, Any]:
+    random.seed(0)
+    devices = generate_sample_devices(count)
+
+    # One bootstrapped store per round (plus the warm-up), set up outside the timed part;
+    # writing without the aliases would only auto-create a stray avapt-devices-write index
+    helpers = []
+    for _ in range(repeat + 1):
+        helper = OpenSearchHelper(client=FakeOpenSearch())
+        helper.create_index_mappings()
+        helpers.append(helper)
+
+    def run():
+        helpers.pop().bulk_index_devices(devices)
+
+    result = measure(run, repeat, 1)
+    result["items"] = count
+    return result
+
+
+def run_all(repeat: int, scale: int) -> Dict[str, Dict[str, Any]]:
+    benchmarks = {
+        "match_cves_text[3]": lambda: bench_match_cves(3, repeat),
+        "match_cves_text[1k]": lambda: bench_match_cves(1_000, repeat),
+        "match_cves_text[100k]": lambda: bench_match_cves(100_000, max(3, repeat // 2)),
+        f"generate_sample_devices[{scale}]": lambda: bench_generate_devices(scale, repeat),
+        f"parse_shodan_banner[{scale}]": lambda: bench_parse_banners(scale, repeat),
+        f"bulk_index_devices[{scale}]": lambda: bench_bulk_index(scale, repeat),
+    }
+    results = {}
+    for name, bench in benchmarks.items():
+        results[name] = bench()
+        print(f"{name:40s} median {results[name]['median_s'] * 1000:10.3f} ms")
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        return proc.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> bool:
+    """Print median ratios against a baseline run; return True if anything regressed"""
+    regressed = False
+    print(f"\nComparing against {baseline.get('meta', {}).get('commit')} (threshold {threshold:.2f}x)")
+    for name, result in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            print(f"{name:40s} (new)")
+            continue
+        ratio = result["median_s"] / old["median_s"] if old["median_s"] else float("inf")
+        flag = "REGRESSION" if ratio > threshold else ""
+        regressed = regressed or ratio > threshold
+        print(f"{name:40s} {old['median_s'] * 1000:10.3f} -> {result['median_s'] * 1000:10.3f} ms  {ratio:5.2f}x {flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend hot paths")
+    parser.add_argument("--out", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Baseline JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Median slowdown ratio counted as a regression")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--scale", type=int, default=10_000, help="Record count for the generator/parser/bulk benchmarks")
+    args = parser.parse_args()
+
+    current = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": run_all(args.repeat, args.scale),
+    }
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved results to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
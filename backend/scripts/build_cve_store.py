@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Compile NVD JSON feeds into the memory-mapped CVE store the API reads.
+# The output is replaced atomically, so running workers keep serving their
+# current mapping until they restart.
+#
+#   python scripts/build_cve_store.py nvdcve-1.1-2023.json.gz nvdcve-1.1-2024.json.gz --out data/cves.bin
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.cve_map import CVE_STORE_PATH  # noqa: E402
+from app.cve_store import CVEStore, build_cve_store  # noqa: E402
+from app.nvd import load_feed, parse_feed  # noqa: E402
+
+
+def nvd_records(data):
+    """Store records from a parsed NVD feed; rejected CVEs are left out"""
+    for entry in parse_feed(data):
+        if entry["rejected"]:
+            continue
+        products = []
+        for match in entry["cpes"]:
+            parts = match["cpe"].split(":")
+            if match["vulnerable"] and len(parts) > 5:
+                product = " ".join(p for p in (parts[3], parts[4], parts[5]) if p not in ("*", "-"))
+                if product not in products:
+                    products.append(product)
+        yield {
+            "cve_id": entry["cve_id"],
+            "description": entry["description"],
+            "cvss_score": entry["cvss_score"] if entry["cvss_score"] is not None else entry["cvss_v2"],
+            "published_date": entry["published_date"],
+            "affected_devices": products,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the binary CVE store from NVD JSON feeds")
+    parser.add_argument("feeds", nargs="+", help="NVD 1.1 or 2.0 JSON feed files (.json or .json.gz)")
+    parser.add_argument("--out", default=CVE_STORE_PATH)
+    args = parser.parse_args()
+
+    start = time.time()
+    records = []
+    for path in args.feeds:
+        feed = list(nvd_records(load_feed(path)))
+        print(f"{path}: {len(feed)} CVEs")
+        records.extend(feed)
+
+    if os.path.dirname(args.out):
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    tmp = f"{args.out}.tmp"
+    with open(tmp, "wb") as f:
+        count = build_cve_store(records, f)
+    # Reopen before swapping in so a bad build never replaces a good store
+    store = CVEStore.open(tmp)
+    assert len(store) == count
+    os.replace(tmp, args.out)
+    print(f"Wrote {count} CVEs ({os.path.getsize(args.out) / 1e6:.1f} MB) to {args.out} in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
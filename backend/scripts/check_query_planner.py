@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Checks how the query planner classifies search tokens, and that the
+# OpenSearch (in-memory stand-in) and SQLite backends agree on the results.
+#
+#   python scripts/check_query_planner.py
+#
+# Exits non-zero on the first classification or backend mismatch.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.opensearch import OpenSearchHelper  # noqa: E402
+from app.query_planner import plan_query  # noqa: E402
+from app.sqlite_store import SQLiteDeviceStore  # noqa: E402
+from fake_opensearch import FakeOpenSearch  # noqa: E402
+
+# query -> (kind, value) of each exact filter; free-text queries expect none
+CLASSIFICATION = {
+    "10.0.0.1": [("ip", "10.0.0.1")],
+    "ip:10": [("cidr", "10.0.0.0/8")],
+    "ip:10.0": [("cidr", "10.0.0.0/16")],
+    "ip:10.0.*": [("cidr", "10.0.0.0/16")],
+    "ip:192.168.1": [("cidr", "192.168.1.0/24")],
+    "192.168.": [("cidr", "192.168.0.0/16")],
+    "10.0": [],
+    "2.1.3": [],
+    "ip:300.1": [],
+    "host:Cam*": [("prefix", "Cam")],
+    "port:554": [("port", "554")],
+}
+
+DEVICES = [
+    {"ip": "10.0.1.5", "port": 80, "hostname": "Cam-Lobby", "service": "http"},
+    {"ip": "10.1.2.3", "port": 554, "hostname": "cam-yard", "service": "rtsp"},
+    {"ip": "192.168.1.20", "port": 8000, "hostname": "NVR-01", "service": "http"},
+]
+
+SEARCHES = ["ip:10", "ip:10.0", "ip:192.168.1", "host:cam*", "host:CAM*", "host:nvr*"]
+
+
+def main() -> int:
+    ok = True
+    for query, expected in CLASSIFICATION.items():
+        got = [(clause["kind"], clause["value"]) for clause in plan_query(query).clauses]
+        if got != expected:
+            print(f"{query!r}: expected {expected}, got {got}")
+            ok = False
+
+    stores = {"opensearch": OpenSearchHelper(client=FakeOpenSearch()), "sqlite": SQLiteDeviceStore(":memory:")}
+    for store in stores.values():
+        store.create_index_mappings()
+        store.bulk_index_devices([dict(device) for device in DEVICES])
+    for query in SEARCHES:
+        results = {name: sorted(d["ip"] for d in store.search_devices(query, 10)) for name, store in stores.items()}
+        same = len({tuple(ips) for ips in results.values()}) == 1
+        print(f"{query}: {results['opensearch']}" + ("" if same else f" - FAILED: sqlite {results['sqlite']}"))
+        ok &= same
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Checks ROE-scoped searches against the in-memory OpenSearch stand-in with a
+# scope too large for one exact filter (more CIDRs than max_clause_count).
+#
+#   python scripts/check_scope_search.py --cidrs 2000
+#
+# Exits non-zero if a scoped search errors, returns an out-of-scope device,
+# or misses in-scope devices that a brute-force scan finds.
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.opensearch import OpenSearchHelper  # noqa: E402
+from app.scope import ScopeSet  # noqa: E402
+from fake_opensearch import MAX_CLAUSE_COUNT, FakeOpenSearch, _clause_count  # noqa: E402
+
+
+def make_scope(cidrs: int) -> ScopeSet:
+    """`cidrs` disjoint /28s, every other one across 10.0.0.0/8"""
+    return ScopeSet.from_text("\n".join(f"10.{i // 8 // 256}.{i // 8 % 256}.{i % 8 * 32}/28" for i in range(cidrs)))
+
+
+def make_devices(count: int, cidrs: int, seed: int = 1):
+    rng = random.Random(seed)
+    devices = []
+    for i in range(count):
+        block = rng.randrange(cidrs)
+        # Half land in the scoped /28 of a block, half in the gap after it
+        offset = block % 8 * 32 + rng.randrange(32)
+        ip = f"10.{block // 8 // 256}.{block // 8 % 256}.{offset}"
+        devices.append({
+            "ip": ip,
+            "port": rng.choice([80, 554, 8000]),
+            "service": "http",
+            "timestamp": f"2024-01-{1 + i % 28:02d}T00:00:{i % 60:02d}Z",
+        })
+    return devices
+
+
+def check(name: str, found, expected, size: int) -> bool:
+    found_ids = [d["_id"] for d in found]
+    problems = []
+    if len(found_ids) != len(set(found_ids)):
+        problems.append("duplicate hits")
+    outside = set(found_ids) - expected
+    if outside:
+        problems.append(f"{len(outside)} out-of-scope devices")
+    if len(found_ids) < min(size, len(expected)):
+        problems.append(f"{len(found_ids)} of {min(size, len(expected))} in-scope devices")
+    print(f"{name}: {len(found_ids)} devices" + (f" - FAILED: {', '.join(problems)}" if problems else ""))
+    return not problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cidrs", type=int, default=2000)
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--size", type=int, default=50)
+    args = parser.parse_args()
+
+    scope = make_scope(args.cidrs)
+    helper = OpenSearchHelper(client=FakeOpenSearch())
+    helper.create_index_mappings()
+    helper.bulk_index_devices(make_devices(args.devices, args.cidrs))
+
+    clauses = _clause_count(scope.to_query("ip"))
+    print(f"Scope: {len(scope.cidrs())} CIDRs, filter of {clauses} clauses "
+          f"({'exact' if scope.exact_query() else 'covering superset, post-filtered'})")
+    ok = clauses <= MAX_CLAUSE_COUNT
+
+    everything = [d for batch in helper.iter_device_batches() for d in batch]
+    in_scope = {d["_id"] for d in scope.filter_devices(everything)}
+    by_port = {d["_id"] for d in everything if d.get("port") == 554} & in_scope
+    print(f"{len(in_scope)} of {len(everything)} devices in scope")
+
+    ok &= check("recent devices", helper.search_devices(None, args.size, scope=scope), in_scope, args.size)
+    ok &= check("port:554", helper.search_devices("port:554", args.size, scope=scope), by_port, args.size)
+    ok &= check("port:554, ip field not requested",
+                helper.search_devices("port:554", args.size, fields=["port"], scope=scope), by_port, args.size)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,291 @@
 #!/usr/bin/env python3
 
+# Load NVD feeds into the cve_map index (one document per CVE+CPE pair),
+# refresh scores on devices that already carry the CVEs, and attach new
+# CVEs to devices running an affected product.
+#
+#   python scripts/cve_ingest.py --local nvdcve-1.1-2024.json.gz
+#   python scripts/cve_ingest.py --sync nvdcve-1.1-modified.json.gz
+#   python scripts/cve_ingest.py --dir nvd-archive/ --workers 8
+#
+# --sync is the daily refresh: it only applies entries modified after the
+# checkpoint left by the previous sync, removes CPE pairs an entry no longer
+# lists, and deletes rejected CVEs. --dir loads every feed in a directory
+# (1.1 and 2.0 schemas can be mixed), parsing files in parallel processes
+# that all feed one bulk writer.
+
 import argparse
+import datetime
+import glob
 import json
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from opensearchpy import OpenSearch
 
-def ingest_local(nvd_file, es_url="http://localhost:9200"):
-    with open(nvd_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.nvd import load_feed, modified_after, parse_feed, parse_file, parse_timestamp  # noqa: E402
+from app.opensearch import OpenSearchHelper  # noqa: E402
+from app.reverse_match import TOKEN_INDEX_PATH, DeviceTokenIndex  # noqa: E402
+
+CVE_MAP_INDEX = "cve_map"
+CVE_MAP_MAPPINGS = {"properties": {"product": {"type": "keyword"}, "cve": {"type": "keyword"}, "cvss": {"type": "float"}}}
+CHECKPOINT_PATH = os.environ.get("NVD_CHECKPOINT", "data/nvd_checkpoint.json")
+
+def cve_map_doc_id(cve_id, cpe):
+    """Deterministic ID so re-loading a feed overwrites instead of duplicating"""
+    return f"{cve_id}|{cpe}"
+
+class CVEMapWriter:
+    """Buffered bulk upserts and deletes against cve_map"""
+
+    def __init__(self, client, batch_size=2000):
+        self.client = client
+        self.batch_size = batch_size
+        self.operations = []
+        self.indexed = 0
+        self.deleted = 0
+        self.errors = 0
+
+    def upsert(self, cve_id, cpe, cvss):
+        self.operations.append({"index": {"_index": CVE_MAP_INDEX, "_id": cve_map_doc_id(cve_id, cpe)}})
+        self.operations.append({"product": cpe, "cve": cve_id, "cvss": cvss})
+        if len(self.operations) >= 2 * self.batch_size:
+            self.flush()
+
+    def delete(self, doc_id):
+        self.operations.append({"delete": {"_index": CVE_MAP_INDEX, "_id": doc_id}})
+        if len(self.operations) >= 2 * self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.operations:
+            return
+        response = self.client.bulk(body=self.operations)
+        self.operations = []
+        for item in response.get("items", []):
+            op, result = next(iter(item.items()))
+            if op == "delete" and result.get("status") in (200, 404):
+                self.deleted += result.get("status") == 200
+            elif result.get("error"):
+                self.errors += 1
+            else:
+                self.indexed += 1
+
+def existing_doc_ids(client, cve_ids, batch=500):
+    """cve_map document IDs currently stored for each CVE"""
+    found = {}
+    cve_ids = list(cve_ids)
+    for start in range(0, len(cve_ids), batch):
+        response = client.search(index=CVE_MAP_INDEX, scroll="2m", body={
+            "query": {"terms": {"cve": cve_ids[start:start + batch]}},
+            "_source": ["cve"],
+            "size": 5000
+        })
+        scroll_id = response.get("_scroll_id")
+        try:
+            while response["hits"]["hits"]:
+                for hit in response["hits"]["hits"]:
+                    found.setdefault(hit["_source"]["cve"], set()).add(hit["_id"])
+                response = client.scroll(body={"scroll_id": scroll_id, "scroll": "2m"})
+                scroll_id = response.get("_scroll_id", scroll_id)
+        finally:
+            if scroll_id:
+                client.clear_scroll(body={"scroll_id": [scroll_id]})
+    return found
+
+def apply_entries(writer, entries, scores, records):
+    """Upsert the CPE pairs of parsed NVD entries; returns {cve_id: wanted doc IDs}, rejected ones empty"""
+    wanted = {}
+    for entry in entries:
+        cve_id = entry["cve_id"]
+        wanted[cve_id] = set()
+        if entry["rejected"]:
+            continue
+        cvss = entry["cvss_score"] or 0.0
+        # Only v3 scores refresh devices; a missing score must not zero a known one
+        if entry["cvss_score"] is not None:
+            scores[cve_id] = {"cvss_score": cvss}
+        record = {"cve_id": cve_id, "cvss_score": cvss, "description": entry["description"], "cpes": []}
+        for match in entry["cpes"]:
+            writer.upsert(cve_id, match["cpe"], cvss)
+            wanted[cve_id].add(cve_map_doc_id(cve_id, match["cpe"]))
+            if match["vulnerable"]:
+                record["cpes"].append(match["cpe"])
+        if record["cpes"]:
+            records.append(record)
+    return wanted
+
+def remove_stale(client, writer, wanted):
+    """Delete cve_map pairs the updated entries no longer list, and every pair of a rejected CVE"""
+    for cve_id, doc_ids in existing_doc_ids(client, wanted).items():
+        for doc_id in doc_ids - wanted[cve_id]:
+            writer.delete(doc_id)
+
+def load_token_index(helper, path=TOKEN_INDEX_PATH, page_size=5000):
+    """The saved device token index, updated with every device written since it was saved"""
+    token_index, cursor = DeviceTokenIndex.load(path)
+    changed = 0
+    while True:
+        page = helper.get_device_changes(cursor, size=page_size)
+        token_index.add_batch(page["devices"])
+        changed += len(page["devices"])
+        cursor = page["cursor"]
+        if not page["has_more"]:
+            break
+    print(f"Device token index: {len(token_index)} devices ({changed} read from the change feed)")
+    return token_index, cursor
+
+def match_devices(helper, records, token_index_path=TOKEN_INDEX_PATH):
+    """Attach newly loaded CVEs to the devices whose product tokens they name"""
+    token_index, cursor = load_token_index(helper, token_index_path)
+    matches = token_index.match(records)
+    stats = helper.add_device_vulnerabilities(matches)
+    # Devices updated just now come back through the change feed on the next run
+    token_index.save(cursor, token_index_path)
+    print(f"Matched {sum(len(v) for v in matches.values())} new CVE entries to {len(matches)} devices "
+          f"({stats['updated']} updated, {stats['conflicts']} conflicts)")
+
+def update_devices(client, es_url, scores, records, match=True):
+    helper = OpenSearchHelper(es_url, client=client)
+    # Devices already carrying these CVEs get their scores and risk refreshed
+    if scores:
+        stats = helper.recompute_derived_fields(scores)
+        print(f"Recomputed risk for {stats['updated']} of {stats['checked']} affected devices")
+    # Devices that don't carry them yet but run an affected product get them added
+    if match and records:
+        match_devices(helper, records)
+
+def connect(es_url):
     client = OpenSearch([es_url])
-    index = "cve_map"
-    if not client.indices.exists(index):
-        client.indices.create(index, body={"mappings":{"properties":{"product":{"type":"keyword"},"cve":{"type":"keyword"},"cvss":{"type":"float"}}}})
-    count = 0
-    # NVD feed structure varies; we look for cve.items[*].configurations.nodes[*].cpeMatch[*].cpe23Uri
-    for item in data.get("CVE_Items", []):
-        cve_id = item.get("cve", {}).get("CVE_data_meta", {}).get("ID")
-        # try CVSS v3.1 score
-        metrics = item.get("impact", {}).get("baseMetricV3", {})
-        cvss = metrics.get("cvssV3", {}).get("baseScore", 0.0) if metrics else 0.0
-        configs = item.get("configurations", {}).get("nodes", [])
-        for node in configs:
-            for match in node.get("cpe_match", []):
-                cpe = match.get("cpe23Uri", "")
-                if cpe:
-                    doc = {"product": cpe, "cve": cve_id, "cvss": cvss}
-                    client.index(index, body=doc)
-                    count += 1
-    print(f"Indexed {count} cpe->CVE entries into {index}")
+    if not client.indices.exists(CVE_MAP_INDEX):
+        client.indices.create(CVE_MAP_INDEX, body={"mappings": CVE_MAP_MAPPINGS})
+    return client
+
+def ingest_local(nvd_file, es_url="http://localhost:9200", match=True):
+    client = connect(es_url)
+    writer = CVEMapWriter(client)
+    scores, records = {}, []
+    entries = list(parse_feed(load_feed(nvd_file)))
+    wanted = apply_entries(writer, entries, scores, records)
+    # Rejected CVEs (and ones that list no CPEs) keep no pairs; drop what earlier loads stored for them
+    rejected = {cve_id for cve_id, doc_ids in wanted.items() if not doc_ids}
+    if rejected:
+        remove_stale(client, writer, {cve_id: set() for cve_id in rejected})
+    writer.flush()
+    print(f"Indexed {writer.indexed} cpe->CVE entries into {CVE_MAP_INDEX} ({writer.deleted} deleted, {writer.errors} errors)")
+    update_devices(client, es_url, scores, records, match)
+
+def ingest_directory(directory, es_url="http://localhost:9200", workers=None, match=True):
+    """Load every *.json / *.json.gz feed in a directory, parsing files in parallel"""
+    paths = sorted(glob.glob(os.path.join(directory, "*.json")) + glob.glob(os.path.join(directory, "*.json.gz")))
+    if not paths:
+        print(f"No NVD feeds found in {directory}")
+        return
+    client = connect(es_url)
+    writer = CVEMapWriter(client)
+    # Feeds overlap (e.g. a yearly file and a later one rejecting one of its
+    # CVEs) and finish in any order, so keep each CVE's newest revision and
+    # apply it once after every file is parsed, as sync does
+    latest = {}
+    start = time.time()
+    # Workers do the JSON decoding and normalizing; this process only merges their entries
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(parse_file, path): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                schema, entries = future.result()
+            except Exception as e:
+                print(f"{path}: failed to parse ({e})")
+                writer.errors += 1
+                continue
+            for entry in entries:
+                known = latest.get(entry["cve_id"])
+                if known is None or _modified(entry) >= _modified(known):
+                    latest[entry["cve_id"]] = entry
+            print(f"{os.path.basename(path)}: schema {schema or 'unknown'}, {len(entries)} CVEs")
+    scores, records = {}, []
+    wanted = apply_entries(writer, latest.values(), scores, records)
+    # Rejected CVEs (and ones that list no CPEs) keep no pairs; drop what earlier loads stored for them
+    bare = {cve_id for cve_id, doc_ids in wanted.items() if not doc_ids}
+    if bare:
+        remove_stale(client, writer, {cve_id: set() for cve_id in bare})
+    writer.flush()
+    print(f"Indexed {writer.indexed} cpe->CVE entries from {len(paths)} files in {time.time() - start:.1f}s "
+          f"({writer.deleted} deleted, {writer.errors} errors)")
+    update_devices(client, es_url, scores, records, match)
+
+def _modified(entry):
+    return parse_timestamp(entry["last_modified"]) or datetime.datetime.min
+
+def load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("last_modified")
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(path, last_modified):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"last_modified": last_modified, "synced_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}, f)
+    os.replace(tmp, path)
+
+def sync(feeds, es_url="http://localhost:9200", checkpoint_path=CHECKPOINT_PATH, match=True):
+    """Apply entries modified since the last sync from one or more (modified/recent) feeds"""
+    checkpoint = load_checkpoint(checkpoint_path)
+    latest = {}
+    for path in feeds:
+        for entry in parse_feed(load_feed(path)):
+            if not modified_after(entry, checkpoint):
+                continue
+            # The same CVE can appear in several feeds; keep its newest revision
+            known = latest.get(entry["cve_id"])
+            if known is None or _modified(entry) >= _modified(known):
+                latest[entry["cve_id"]] = entry
+    print(f"{len(latest)} CVEs modified since {checkpoint or 'the beginning'}")
+    if not latest:
+        return
+
+    client = connect(es_url)
+    writer = CVEMapWriter(client)
+    scores, records = {}, []
+    wanted = apply_entries(writer, latest.values(), scores, records)
+    remove_stale(client, writer, wanted)
+    writer.flush()
+    rejected = sum(1 for entry in latest.values() if entry["rejected"])
+    print(f"Upserted {writer.indexed} and deleted {writer.deleted} cve_map entries "
+          f"({rejected} rejected CVEs, {writer.errors} errors)")
+    if writer.errors:
+        print("Errors during sync; checkpoint not advanced")
+        sys.exit(1)
+
+    # Advance only once devices are updated too, so a failure there re-runs on the next sync
+    update_devices(client, es_url, scores, records, match)
+    newest = max(latest.values(), key=_modified)["last_modified"] or checkpoint
+    save_checkpoint(checkpoint_path, newest)
+    print(f"Checkpoint advanced to {newest}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--local", help="Path to local NVD JSON file")
+    parser.add_argument("--sync", nargs="+", metavar="FEED", help="Incrementally apply NVD modified/recent feeds")
+    parser.add_argument("--dir", help="Load every NVD feed (1.1 or 2.0 schema) in a directory")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes for --dir (default: all cores)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="lastModified checkpoint file for --sync")
     parser.add_argument("--es", default="http://localhost:9200")
+    parser.add_argument("--no-match", action="store_true", help="Skip matching the new CVEs against indexed devices")
     args = parser.parse_args()
-    if not args.local:
-        print("Provide --local <nvd-json-file>")
+    if args.sync:
+        sync(args.sync, args.es, args.checkpoint, match=not args.no_match)
+    elif args.dir:
+        ingest_directory(args.dir, args.es, args.workers, match=not args.no_match)
+    elif args.local:
+        ingest_local(args.local, args.es, match=not args.no_match)
     else:
-        ingest_local(args.local, args.es)
+        print("Provide --local <nvd-json-file>, --dir <feed-directory> or --sync <modified-feed> [...]")
@@ -0,0 +1,866 @@
+#!/usr/bin/env python3
+
+# In-memory OpenSearch stand-in used by the benchmark and load-test scripts.
+# It implements just enough of the opensearch-py client surface (and of the
+# query DSL) for OpenSearchHelper to run against it without a cluster.
+# `serve()` exposes the same store over HTTP so the real opensearch-py
+# client (and therefore the FastAPI app) can talk to it:
+#
+#   python scripts/fake_opensearch.py --port 9200 --latency-ms 5
+
+import argparse
+import copy
+import functools
+import ipaddress
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from opensearchpy.exceptions import NotFoundError, RequestError
+
+# indices.query.bool.max_clause_count default; bigger queries are rejected like a real cluster does
+MAX_CLAUSE_COUNT = 1024
+
+
+class FakeIndices:
+    def __init__(self, owner: "FakeOpenSearch"):
+        self.owner = owner
+
+    def exists(self, index: str, **kwargs) -> bool:
+        self.owner._delay()
+        return bool(self.owner._resolve(index))
+
+    def create(self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        body = body or {}
+        index = _resolve_date_math(index)
+        with self.owner.lock:
+            aliases, mappings = {}, {}
+            for template in sorted(self.owner.templates.values(), key=lambda t: t.get("priority", 0)):
+                if any(_wildcard(pattern, index) or pattern == index for pattern in template.get("index_patterns", [])):
+                    aliases.update(template.get("template", {}).get("aliases", {}))
+                    mappings.update(copy.deepcopy(template.get("template", {}).get("mappings", {})))
+            aliases.update(body.get("aliases", {}))
+            mappings.update(copy.deepcopy(body.get("mappings", {})))
+            self.owner.indices_data.setdefault(index, {})
+            self.owner.index_bodies[index] = dict(copy.deepcopy(body), mappings=mappings)
+            self.owner.created_at[index] = time.time()
+            for alias, spec in aliases.items():
+                self.owner.aliases.setdefault(alias, {})[index] = dict(spec or {})
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index: str, **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        with self.owner.lock:
+            for name in self.owner._resolve(index):
+                self.owner.indices_data.pop(name, None)
+                self.owner.index_bodies.pop(name, None)
+                for members in self.owner.aliases.values():
+                    members.pop(name, None)
+        return {"acknowledged": True}
+
+    def refresh(self, index: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        return {"_shards": {"failed": 0}}
+
+    def put_index_template(self, name: str, body: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        self.owner.templates[name] = copy.deepcopy(body)
+        return {"acknowledged": True}
+
+    def get_mapping(self, index: str, **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        with self.owner.lock:
+            names = self.owner._resolve(index)
+            if not names:
+                raise NotFoundError(404, "index_not_found_exception", {"error": f"no such index [{index}]"})
+            return {name: {"mappings": copy.deepcopy(self.owner.index_bodies.get(name, {}).get("mappings", {}))}
+                    for name in names}
+
+    def exists_alias(self, name: str, index: Optional[str] = None, **kwargs) -> bool:
+        self.owner._delay()
+        members = self.owner.aliases.get(name) or {}
+        return bool(members) if index is None else index in members
+
+    def get_alias(self, name: Optional[str] = None, index: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        with self.owner.lock:
+            result: Dict[str, Any] = {}
+            for alias, members in self.owner.aliases.items():
+                if name and alias != name:
+                    continue
+                for member, spec in members.items():
+                    result.setdefault(member, {"aliases": {}})["aliases"][alias] = spec
+        if name and not result:
+            raise NotFoundError(404, "alias_missing_exception", {"error": f"alias [{name}] missing"})
+        return result
+
+    def put_alias(self, index: str, name: str, body: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        with self.owner.lock:
+            for member in self.owner._resolve(index):
+                self.owner.aliases.setdefault(name, {})[member] = dict(body or {})
+        return {"acknowledged": True}
+
+    def update_aliases(self, body: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        with self.owner.lock:
+            for action in body.get("actions", []):
+                op, spec = next(iter(action.items()))
+                if op == "add":
+                    extra = {k: v for k, v in spec.items() if k not in ("index", "alias")}
+                    self.owner.aliases.setdefault(spec["alias"], {})[spec["index"]] = extra
+                elif op == "remove":
+                    self.owner.aliases.get(spec["alias"], {}).pop(spec["index"], None)
+                elif op == "remove_index":
+                    self.owner.indices_data.pop(spec["index"], None)
+                    self.owner.index_bodies.pop(spec["index"], None)
+                    for members in self.owner.aliases.values():
+                        members.pop(spec["index"], None)
+        return {"acknowledged": True}
+
+    def rollover(self, alias: str, body: Optional[Dict[str, Any]] = None, new_index: Optional[str] = None,
+                 dry_run: Any = False, **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        conditions = (body or {}).get("conditions", {})
+        with self.owner.lock:
+            old_index = self.owner._write_target(alias)
+            docs = self.owner.indices_data.get(old_index, {})
+            age = time.time() - self.owner.created_at.get(old_index, time.time())
+            met = {
+                "max_docs": "max_docs" in conditions and len(docs) >= int(conditions["max_docs"]),
+                "max_age": "max_age" in conditions and age >= _parse_age(conditions["max_age"]),
+                "max_size": "max_size" in conditions and len(json.dumps(docs)) >= _parse_size(conditions["max_size"]),
+            }
+            met = {f"[{k}: {conditions[k]}]": v for k, v in met.items() if k in conditions}
+            prefix, _, counter = old_index.rpartition("-")
+            new_index = new_index or f"{prefix}-{int(counter) + 1:06d}"
+            # Like the real API, a rollover without conditions always happens
+            rolled = (not met or any(met.values())) and str(dry_run).lower() != "true"
+            if rolled:
+                aliases = dict((body or {}).get("aliases", {}), **{alias: {"is_write_index": True}})
+                self.create(new_index, body={"aliases": aliases})
+                self.owner.aliases[alias][old_index] = {"is_write_index": False}
+        return {"acknowledged": rolled, "old_index": old_index, "new_index": new_index,
+                "rolled_over": rolled, "dry_run": str(dry_run).lower() == "true", "conditions": met}
+
+class FakeTasks:
+    def __init__(self, owner: "FakeOpenSearch"):
+        self.owner = owner
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, task_id: str, **kwargs) -> Dict[str, Any]:
+        self.owner._delay()
+        if task_id not in self.results:
+            raise NotFoundError(404, "resource_not_found_exception", {"error": f"task [{task_id}] isn't running"})
+        return {"completed": True, "task": {"id": task_id}, "response": self.results[task_id]}
+
+
+class FakeOpenSearch:
+    """Thread-safe in-memory OpenSearch client with optional per-call latency"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.indices_data: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.index_bodies: Dict[str, Dict[str, Any]] = {}
+        self.aliases: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.templates: Dict[str, Dict[str, Any]] = {}
+        self.created_at: Dict[str, float] = {}
+        self.indices = FakeIndices(self)
+        self.tasks = FakeTasks(self)
+        self.calls = 0
+        self.scrolls: Dict[str, Any] = {}
+
+    def _delay(self):
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    # Client API
+
+    def ping(self, **kwargs) -> bool:
+        self._delay()
+        return True
+
+    def info(self, **kwargs) -> Dict[str, Any]:
+        self._delay()
+        return {"version": {"number": "2.11.0", "distribution": "opensearch"}}
+
+    def index(self, index: str, body: Dict[str, Any], id: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self._delay()
+        with self.lock:
+            return self._put(index, id, body)
+
+    def bulk(self, body: Iterable[Any], index: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self._delay()
+        started = time.perf_counter()
+        lines = list(body)
+        items = []
+        with self.lock:
+            i = 0
+            while i < len(lines):
+                action = lines[i]
+                op, meta = next(iter(action.items()))
+                target = meta.get("_index", index)
+                target = self._write_target(target)
+                if op == "delete":
+                    existed = self.indices_data.get(target, {}).pop(meta.get("_id"), None) is not None
+                    items.append({op: {"_index": target, "_id": meta.get("_id"),
+                                       "result": "deleted" if existed else "not_found",
+                                       "status": 200 if existed else 404}})
+                    i += 1
+                    continue
+                source = lines[i + 1]
+                i += 2
+                if meta.get("require_alias") and not self.aliases.get(meta.get("_index", index)):
+                    items.append({op: {"_index": meta.get("_index", index), "_id": meta.get("_id"), "status": 404,
+                                       "error": {"type": "index_not_found_exception",
+                                                 "reason": "[require_alias] request flag is [true] and "
+                                                           f"[{meta.get('_index', index)}] is not an alias"}}})
+                    continue
+                if op == "update":
+                    docs = self.indices_data.setdefault(target, {})
+                    current = docs.get(meta.get("_id"))
+                    if current is None and "upsert" not in source and not source.get("doc_as_upsert"):
+                        items.append({op: {"_index": target, "_id": meta.get("_id"),
+                                           "status": 404, "error": {"type": "document_missing_exception"}}})
+                        continue
+                    merged = dict(current if current is not None else source.get("upsert", {}))
+                    merged.update(source.get("doc", {}))
+                    docs[meta.get("_id")] = merged
+                    items.append({op: {"_index": target, "_id": meta.get("_id"),
+                                       "result": "updated" if current is not None else "created",
+                                       "status": 200 if current is not None else 201}})
+                    continue
+                result = self._put(target, meta.get("_id"), source, create_only=(op == "create"))
+                items.append({op: result})
+        took = int((time.perf_counter() - started) * 1000)
+        return {"took": took, "errors": any("error" in next(iter(item.values())) for item in items), "items": items}
+
+    def count(self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        self._delay()
+        query = (body or {}).get("query", {"match_all": {}})
+        _check_clauses(query)
+        with self.lock:
+            docs = self._docs(index)
+        return {"count": sum(1 for _id, doc in docs if _matches(doc, query, _id))}
+
+    def search(self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        self._delay()
+        started = time.perf_counter()
+        body = body or {}
+        query = body.get("query", {"match_all": {}})
+        _check_clauses(query)
+        with self.lock:
+            docs = self._docs(index)
+        hits = [(_id, doc) for _id, doc in docs if _matches(doc, query, _id)]
+
+        sort = _normalize_sort(body.get("sort"))
+        if sort:
+            for field, order, mode, missing in reversed(sort):
+                hits.sort(key=lambda hit: _sort_key(hit, field, order, mode, missing), reverse=(order == "desc"))
+
+        search_after = body.get("search_after")
+        if search_after and sort:
+            hits = [hit for hit in hits if _after(hit, sort, search_after)]
+
+        start = body.get("from", 0)
+        size = body.get("size", 10)
+        response = self._page(index, hits[start:start + size], len(hits), sort, body.get("_source"), started)
+        aggs = body.get("aggs") or body.get("aggregations")
+        if aggs:
+            response["aggregations"] = _aggregate([(_id, doc, doc) for _id, doc in hits], aggs)
+        if body.get("suggest"):
+            response["suggest"] = {name: _complete(docs, spec) for name, spec in body["suggest"].items()}
+        if kwargs.get("scroll"):
+            scroll_id = uuid.uuid4().hex
+            self.scrolls[scroll_id] = (index, hits[start + size:], size, sort, body.get("_source"))
+            response["_scroll_id"] = scroll_id
+        return response
+
+    def reindex(self, body: Dict[str, Any], wait_for_completion: Any = True, **kwargs) -> Dict[str, Any]:
+        self._delay()
+        started = time.perf_counter()
+        with self.lock:
+            source = self._resolve(body["source"]["index"])
+            if not source:
+                raise NotFoundError(404, "index_not_found_exception", {"error": f"no such index [{body['source']['index']}]"})
+            dest = body["dest"]["index"]
+            if dest not in self.indices_data:
+                self.indices.create(dest)
+            # A reindex "script" is not executed; documents are copied as-is
+            copied = 0
+            for name in source:
+                for _id, doc in self.indices_data[name].items():
+                    self.indices_data[dest][_id] = copy.deepcopy(doc)
+                    copied += 1
+        response = {"took": int((time.perf_counter() - started) * 1000), "total": copied,
+                    "created": copied, "updated": 0, "failures": []}
+        if str(wait_for_completion).lower() == "false":
+            task_id = f"fake:{uuid.uuid4().int & 0xffffff}"
+            self.tasks.results[task_id] = response
+            return {"task": task_id}
+        return response
+
+    def scroll(self, body: Optional[Dict[str, Any]] = None, scroll_id: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self._delay()
+        started = time.perf_counter()
+        scroll_id = scroll_id or (body or {}).get("scroll_id")
+        index, remaining, size, sort, source = self.scrolls[scroll_id]
+        self.scrolls[scroll_id] = (index, remaining[size:], size, sort, source)
+        response = self._page(index, remaining[:size], len(remaining), sort, source, started)
+        response["_scroll_id"] = scroll_id
+        return response
+
+    def clear_scroll(self, body: Optional[Dict[str, Any]] = None, scroll_id: Any = None, **kwargs) -> Dict[str, Any]:
+        ids = scroll_id or (body or {}).get("scroll_id") or []
+        for _id in [ids] if isinstance(ids, str) else ids:
+            self.scrolls.pop(_id, None)
+        return {"succeeded": True}
+
+    # Internals
+
+    def _page(self, index: str, page: List[Any], total: int, sort: List[Any], source: Any, started: float) -> Dict[str, Any]:
+        return {
+            "took": int((time.perf_counter() - started) * 1000),
+            "timed_out": False,
+            "hits": {
+                "total": {"value": total, "relation": "eq"},
+                "hits": [
+                    {
+                        "_index": self._locate(index, _id, doc),
+                        "_id": _id,
+                        "_source": _project(doc, source),
+                        "sort": [_sort_value((_id, doc), field, mode, missing) for field, _, mode, missing in sort] if sort else None,
+                    }
+                    for _id, doc in page
+                ],
+            },
+        }
+
+    def _resolve(self, name: str) -> List[str]:
+        """Concrete index names for an index, alias, wildcard or comma-separated list"""
+        names: List[str] = []
+        for part in name.split(","):
+            if part in self.indices_data:
+                names.append(part)
+            elif self.aliases.get(part):
+                names.extend(self.aliases[part])
+            else:
+                names.extend(n for n in self.indices_data if _wildcard(part, n))
+        return list(dict.fromkeys(names))
+
+    def _write_target(self, name: str) -> str:
+        members = self.aliases.get(name)
+        if not members:
+            return name
+        for member, spec in members.items():
+            if spec.get("is_write_index"):
+                return member
+        return next(iter(members))
+
+    def _put(self, index: str, _id: Optional[str], body: Dict[str, Any], create_only: bool = False) -> Dict[str, Any]:
+        index = self._write_target(index)
+        docs = self.indices_data.setdefault(index, {})
+        _id = _id or uuid.uuid4().hex
+        existed = _id in docs
+        if existed and create_only:
+            return {"_index": index, "_id": _id, "status": 409,
+                    "error": {"type": "version_conflict_engine_exception"}}
+        docs[_id] = copy.deepcopy(body)
+        return {"_index": index, "_id": _id, "result": "updated" if existed else "created",
+                "status": 200 if existed else 201}
+
+    def _locate(self, index: str, _id: str, doc: Dict[str, Any]) -> str:
+        # Concrete index holding this exact document object
+        for name in self._resolve(index):
+            if self.indices_data.get(name, {}).get(_id) is doc:
+                return name
+        return index
+
+    def _docs(self, index: str) -> List[Any]:
+        names = self._resolve(index)
+        if not names:
+            raise NotFoundError(404, "index_not_found_exception", {"error": f"no such index [{index}]"})
+        return list(itertools.chain.from_iterable(self.indices_data[name].items() for name in names))
+
+
+def _resolve_date_math(name: str) -> str:
+    # Only the <prefix-{now/M{yyyy.MM}}-000001> form used by OpenSearchHelper
+    match = re.fullmatch(r"<(.*)\{now/[a-zA-Z]\{([^}]*)\}\}(.*)>", name)
+    if not match:
+        return name
+    fmt = match.group(2).replace("yyyy", "%Y").replace("MM", "%m").replace("dd", "%d")
+    return match.group(1) + time.strftime(fmt, time.gmtime()) + match.group(3)
+
+def _parse_age(value: str) -> float:
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return float(value[:-1]) * units[value[-1]]
+
+def _parse_interval(value: str) -> int:
+    units = {"ms": 1, "s": 1000, "m": 60000, "h": 3600000, "d": 86400000}
+    unit = "ms" if value.endswith("ms") else value[-1]
+    return int(float(value[:-len(unit)]) * units[unit])
+
+def _parse_size(value: str) -> float:
+    units = {"b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3, "tb": 1024 ** 4}
+    number = re.match(r"[\d.]+", value).group(0)
+    return float(number) * units[value[len(number):].lower()]
+
+def _wildcard(pattern: str, name: str) -> bool:
+    return pattern.endswith("*") and name.startswith(pattern[:-1])
+
+
+def _field(doc: Dict[str, Any], path: str, _id: Optional[str] = None) -> Any:
+    if path == "_id":
+        return _id
+    value: Any = doc
+    for part in path.split("."):
+        if isinstance(value, list):
+            value = [v.get(part) for v in value if isinstance(v, dict)]
+        elif isinstance(value, dict):
+            value = value.get(part)
+        else:
+            return None
+    return value
+
+
+def _values(doc: Dict[str, Any], path: str) -> List[Any]:
+    # A keyword sub-field indexes its parent's value ("hostname.keyword" -> "hostname")
+    value = _field(doc, path[:-len(".keyword")] if path.endswith(".keyword") else path)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _complete(docs: List[Any], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Completion suggester over the multi-field's parent values ("x.suggest" -> "x")
+    completion = spec["completion"]
+    prefix = spec.get("prefix", "").lower()
+    field = completion["field"].rsplit(".", 1)[0]
+    options, seen = [], set()
+    for _id, doc in docs:
+        for value in _values(doc, field):
+            text = str(value)
+            if not text.lower().startswith(prefix):
+                continue
+            if completion.get("skip_duplicates") and text in seen:
+                continue
+            seen.add(text)
+            options.append({"text": text, "_id": _id, "_score": 1.0})
+    options.sort(key=lambda option: option["text"])
+    return [{"text": spec.get("prefix", ""), "offset": 0, "length": len(prefix),
+             "options": options[:completion.get("size", 5)]}]
+
+
+def _normalize_sort(sort: Any) -> List[Any]:
+    """(field, order, mode, missing) tuples; multi-valued fields sort by max descending, min ascending.
+    `missing` is the value documents without the field sort as (None: last)."""
+    result = []
+    for item in sort or []:
+        if isinstance(item, str):
+            result.append((item, "asc", "min", None))
+        else:
+            field, spec = next(iter(item.items()))
+            order = spec.get("order", "asc") if isinstance(spec, dict) else spec
+            mode = spec.get("mode") if isinstance(spec, dict) else None
+            missing = spec.get("missing") if isinstance(spec, dict) else None
+            missing = None if isinstance(missing, str) else missing
+            result.append((field, order, mode or ("max" if order == "desc" else "min"), missing))
+    return result
+
+
+def _sort_value(hit: Any, field: str, mode: str, missing: Any = None) -> Any:
+    value = _field(hit[1], field, hit[0])
+    if value is None or value == []:
+        return missing
+    if isinstance(value, list):
+        value = [v for v in value if v is not None]
+        if not value:
+            return None
+        if mode == "avg":
+            return sum(value) / len(value)
+        if mode == "sum":
+            return sum(value)
+        return max(value) if mode == "max" else min(value)
+    return value
+
+
+def _sort_key(hit: Any, field: str, order: str, mode: str, missing: Any = None) -> Any:
+    value = _sort_value(hit, field, mode, missing)
+    # Missing values sort last in either direction
+    missing = value is None
+    if order == "desc":
+        return (not missing, value if not missing else 0)
+    return (missing, value if not missing else 0)
+
+
+def _after(hit: Any, sort: List[Any], after: List[Any]) -> bool:
+    for (field, order, mode, missing), bound in zip(sort, after):
+        value = _sort_value(hit, field, mode, missing)
+        if value == bound:
+            continue
+        if value is None:
+            return True
+        if bound is None:
+            return False
+        return value > bound if order == "asc" else value < bound
+    return False
+
+
+def _aggregate(items: List[Any], aggs: Dict[str, Any]) -> Dict[str, Any]:
+    """Evaluate aggregations over (root_id, root_doc, doc) items.
+
+    `doc` is the root document, or a {path: child} wrapper inside a nested
+    aggregation so that full field paths keep resolving.
+    """
+    result: Dict[str, Any] = {}
+    for name, spec in aggs.items():
+        sub = spec.get("aggs") or spec.get("aggregations") or {}
+        kind = next(k for k in spec if k not in ("aggs", "aggregations", "meta"))
+        body = spec[kind]
+        if kind == "nested":
+            path = body["path"]
+            inner = [(rid, root, {path: child}) for rid, root, _ in items for child in (root.get(path) or [])]
+            result[name] = {"doc_count": len(inner), **_aggregate(inner, sub)}
+        elif kind == "reverse_nested":
+            roots = list({rid: (rid, root, root) for rid, root, _ in items}.values())
+            result[name] = {"doc_count": len(roots), **_aggregate(roots, sub)}
+        elif kind == "filter":
+            inner = [item for item in items if _matches(item[2], body)]
+            result[name] = {"doc_count": len(inner), **_aggregate(inner, sub)}
+        elif kind == "terms":
+            groups: Dict[Any, List[Any]] = {}
+            for item in items:
+                values = _values(item[2], body["field"])
+                if not values and "missing" in body:
+                    values = [body["missing"]]
+                for value in dict.fromkeys(v for v in values if v is not None):
+                    groups.setdefault(value, []).append(item)
+            ordered = sorted(groups.items(), key=lambda kv: (-len(kv[1]), str(kv[0])))
+            size = body.get("size", 10)
+            result[name] = {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": sum(len(v) for _, v in ordered[size:]),
+                "buckets": [{"key": k, "doc_count": len(v), **_aggregate(v, sub)} for k, v in ordered[:size]],
+            }
+        elif kind == "range":
+            buckets = []
+            for spec_range in body["ranges"]:
+                low, high = spec_range.get("from"), spec_range.get("to")
+                inside = [
+                    item for item in items
+                    if any(isinstance(v, (int, float)) and (low is None or v >= low) and (high is None or v < high)
+                           for v in _values(item[2], body["field"]))
+                ]
+                key = spec_range.get("key") or f"{'*' if low is None else low}-{'*' if high is None else high}"
+                bucket = {"key": key, "doc_count": len(inside), **_aggregate(inside, sub)}
+                bucket.update({k: v for k, v in (("from", low), ("to", high)) if v is not None})
+                buckets.append(bucket)
+            result[name] = {"buckets": {b["key"]: b for b in buckets} if body.get("keyed") else buckets}
+        elif kind == "date_histogram":
+            interval = _parse_interval(body.get("fixed_interval") or body.get("interval") or "1h")
+            groups = {}
+            for item in items:
+                for v in _values(item[2], body["field"]):
+                    if isinstance(v, (int, float)):
+                        groups.setdefault(int(v // interval * interval), []).append(item)
+            result[name] = {"buckets": [
+                {"key": key, "doc_count": len(groups[key]), **_aggregate(groups[key], sub)}
+                for key in sorted(groups) if len(groups[key]) >= body.get("min_doc_count", 0)
+            ]}
+        elif kind in ("max", "min", "avg", "sum", "value_count", "cardinality"):
+            values = [v for item in items for v in _values(item[2], body["field"]) if v is not None]
+            numbers = [v for v in values if isinstance(v, (int, float))]
+            if kind == "value_count":
+                value: Any = len(values)
+            elif kind == "cardinality":
+                value = len(set(map(str, values)))
+            elif kind == "sum":
+                value = float(sum(numbers))
+            elif not numbers:
+                value = None
+            else:
+                value = {"max": max, "min": min}.get(kind, lambda n: sum(n) / len(n))(numbers)
+            result[name] = {"value": value}
+        else:
+            raise ValueError(f"Unsupported aggregation in fake OpenSearch: {kind}")
+    return result
+
+
+def _project(doc: Dict[str, Any], source: Any) -> Dict[str, Any]:
+    if source is None or source is True:
+        return copy.deepcopy(doc)
+    if source is False:
+        return {}
+    if isinstance(source, list):
+        source = {"includes": source}
+    includes = source.get("includes") or []
+    excludes = set(source.get("excludes") or [])
+    result = {k: v for k, v in doc.items() if (not includes or k in includes) and k not in excludes}
+    return copy.deepcopy(result)
+
+
+@functools.lru_cache(maxsize=65536)
+def _ip(value: str) -> Any:
+    return ipaddress.ip_address(value)
+
+
+def _compare(value: Any, spec: Dict[str, Any]) -> bool:
+    try:
+        if isinstance(value, str) and "." in value and ":" not in value and value.count(".") == 3:
+            value = _ip(value)
+            spec = {k: _ip(v) if k in ("gt", "gte", "lt", "lte") else v for k, v in spec.items()}
+        if "gt" in spec and not value > spec["gt"]:
+            return False
+        if "gte" in spec and not value >= spec["gte"]:
+            return False
+        if "lt" in spec and not value < spec["lt"]:
+            return False
+        if "lte" in spec and not value <= spec["lte"]:
+            return False
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _term_match(value: Any, expected: Any) -> bool:
+    if isinstance(expected, str) and "/" in expected and isinstance(value, str):
+        try:
+            return ipaddress.ip_address(value) in ipaddress.ip_network(expected, strict=False)
+        except ValueError:
+            return False
+    if isinstance(value, str) and isinstance(expected, str):
+        return value == expected
+    return value == expected
+
+
+def _clause_count(query: Any) -> int:
+    """Lucene clauses a query expands to: one per bool child, and one per CIDR in a terms query"""
+    if not isinstance(query, dict) or not query:
+        return 0
+    kind, spec = next(iter(query.items()))
+    if kind == "bool":
+        children = [q for key in ("must", "filter", "should", "must_not")
+                    for q in (spec.get(key) if isinstance(spec.get(key), list) else [spec[key]] if key in spec else [])]
+        return len(children) + sum(_clause_count(q) for q in children)
+    if kind == "terms":
+        values = next((v for k, v in spec.items() if k != "boost"), [])
+        return sum(1 for v in values if isinstance(v, str) and "/" in v)
+    if kind == "nested":
+        return _clause_count(spec.get("query"))
+    return 0
+
+
+def _check_clauses(query: Dict[str, Any]):
+    count = _clause_count(query)
+    if count > MAX_CLAUSE_COUNT:
+        raise RequestError(400, "search_phase_execution_exception",
+                           {"error": {"type": "too_many_clauses", "reason": f"maxClauseCount is set to {MAX_CLAUSE_COUNT}: {count}"}})
+
+
+def _matches(doc: Dict[str, Any], query: Dict[str, Any], _id: Optional[str] = None) -> bool:
+    if not query:
+        return True
+    kind, spec = next(iter(query.items()))
+    if kind == "match_all":
+        return True
+    if kind == "ids":
+        return _id in spec.get("values", [])
+    if kind == "match_none":
+        return False
+    if kind == "bool":
+        clauses = lambda key: spec.get(key) if isinstance(spec.get(key), list) else ([spec[key]] if key in spec else [])
+        if not all(_matches(doc, q, _id) for q in clauses("must") + clauses("filter")):
+            return False
+        if any(_matches(doc, q, _id) for q in clauses("must_not")):
+            return False
+        should = clauses("should")
+        minimum = spec.get("minimum_should_match", 0 if clauses("must") or clauses("filter") else 1)
+        return not should or sum(1 for q in should if _matches(doc, q, _id)) >= minimum
+    if kind == "term":
+        field, expected = next(iter(spec.items()))
+        if isinstance(expected, dict):
+            expected = expected.get("value")
+        return any(_term_match(v, expected) for v in _values(doc, field))
+    if kind == "terms":
+        field, expected = next((k, v) for k, v in spec.items() if k != "boost")
+        return any(_term_match(v, e) for v in _values(doc, field) for e in expected)
+    if kind == "range":
+        field, bounds = next(iter(spec.items()))
+        return any(_compare(v, bounds) for v in _values(doc, field))
+    if kind == "exists":
+        return bool(_values(doc, spec["field"]))
+    if kind == "prefix":
+        field, expected = next(iter(spec.items()))
+        fold = (lambda text: text.lower()) if isinstance(expected, dict) and expected.get("case_insensitive") else str
+        if isinstance(expected, dict):
+            expected = expected.get("value")
+        return any(fold(str(v)).startswith(fold(str(expected))) for v in _values(doc, field))
+    if kind == "geo_bounding_box":
+        field, box = next((k, v) for k, v in spec.items() if k not in ("validation_method", "type"))
+        point = _field(doc, field)
+        if not isinstance(point, dict) or point.get("lat") is None or point.get("lon") is None:
+            return False
+        return (box["bottom_right"]["lat"] <= point["lat"] <= box["top_left"]["lat"]
+                and box["top_left"]["lon"] <= point["lon"] <= box["bottom_right"]["lon"])
+    if kind == "nested":
+        path = spec["path"]
+        children = doc.get(path) or []
+        return any(_matches({path: child}, spec["query"]) for child in children)
+    if kind in ("match", "match_phrase", "match_phrase_prefix"):
+        field, expected = next(iter(spec.items()))
+        if isinstance(expected, dict):
+            expected = expected.get("query")
+        needle = str(expected).lower()
+        return any(token in str(v).lower() for v in _values(doc, field) for token in needle.split())
+    if kind in ("multi_match", "query_string", "simple_query_string"):
+        needle = str(spec.get("query", "")).lower()
+        fields = spec.get("fields") or list(doc.keys())
+        tokens = needle.split()
+        for field in fields:
+            field = field.split("^")[0]
+            for value in _values(doc, field):
+                text = str(value).lower()
+                if any(token in text for token in tokens):
+                    return True
+        return False
+    raise ValueError(f"Unsupported query in fake OpenSearch: {kind}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, Nagle plus
+    # delayed ACKs add ~40ms to every keep-alive round trip
+    disable_nagle_algorithm = True
+    fake: FakeOpenSearch = None  # set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, status: int, payload: Any = None, head: bool = False):
+        data = json.dumps(payload if payload is not None else {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(data)
+
+    def _route(self, method: str):
+        path = urlsplit(self.path).path
+        parts = [unquote(p) for p in path.split("/") if p]
+        query = dict(parse_qsl(urlsplit(self.path).query))
+        raw = self._body()
+        fake = self.fake
+        try:
+            if not parts:
+                if method == "HEAD":
+                    fake.ping()
+                    return self._reply(200, head=True)
+                return self._reply(200, fake.info())
+            if parts[:2] == ["_search", "scroll"]:
+                body = json.loads(raw) if raw else {}
+                if method == "DELETE":
+                    return self._reply(200, fake.clear_scroll(body=body))
+                return self._reply(200, fake.scroll(body=body))
+            if parts[0] == "_index_template" and len(parts) == 2:
+                return self._reply(200, fake.indices.put_index_template(parts[1], json.loads(raw or b"{}")))
+            if parts[0] == "_reindex":
+                return self._reply(200, fake.reindex(json.loads(raw or b"{}"),
+                                                     wait_for_completion=query.get("wait_for_completion", True)))
+            if parts[0] == "_tasks" and len(parts) == 2:
+                return self._reply(200, fake.tasks.get(parts[1]))
+            if parts[0] == "_aliases":
+                return self._reply(200, fake.indices.update_aliases(json.loads(raw or b"{}")))
+            if "_alias" in parts:
+                at = parts.index("_alias")
+                index = parts[0] if at == 1 else None
+                name = parts[at + 1] if len(parts) > at + 1 else None
+                if method == "HEAD":
+                    return self._reply(200 if fake.indices.exists_alias(name, index=index) else 404, head=True)
+                if method == "PUT":
+                    return self._reply(200, fake.indices.put_alias(index, name, json.loads(raw) if raw else None))
+                return self._reply(200, fake.indices.get_alias(name=name, index=index))
+            if len(parts) >= 2 and parts[1] == "_rollover":
+                return self._reply(200, fake.indices.rollover(parts[0], json.loads(raw or b"{}"),
+                                                             new_index=parts[2] if len(parts) > 2 else None,
+                                                             dry_run=query.get("dry_run", False)))
+            if parts[-1] == "_bulk":
+                lines = [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+                return self._reply(200, fake.bulk(lines, index=parts[0] if len(parts) > 1 else None))
+            body = json.loads(raw) if raw else {}
+            index = parts[0]
+            if len(parts) == 1:
+                if method == "HEAD":
+                    return self._reply(200 if fake.indices.exists(index) else 404, head=True)
+                if method == "PUT":
+                    return self._reply(200, fake.indices.create(index, body=body))
+                if method == "DELETE":
+                    return self._reply(200, fake.indices.delete(index))
+            elif parts[1] == "_search":
+                return self._reply(200, fake.search(index, body=body, scroll=query.get("scroll")))
+            elif parts[1] == "_mapping":
+                return self._reply(200, fake.indices.get_mapping(index))
+            elif parts[1] == "_count":
+                return self._reply(200, fake.count(index, body=body))
+            elif parts[1] == "_refresh":
+                return self._reply(200, fake.indices.refresh(index))
+            elif parts[1] == "_doc" and method in ("POST", "PUT"):
+                result = fake.index(index, body, id=parts[2] if len(parts) > 2 else None)
+                return self._reply(result.get("status", 201), result)
+            return self._reply(400, {"error": {"type": "unsupported_operation", "reason": f"{method} {path}"}})
+        except NotFoundError as e:
+            return self._reply(404, {"error": {"type": e.error, "reason": str(e.info)}, "status": 404})
+        except RequestError as e:
+            return self._reply(400, {"error": e.info.get("error"), "status": 400})
+        except ValueError as e:
+            return self._reply(400, {"error": {"type": "parsing_exception", "reason": str(e)}})
+
+    def do_HEAD(self):
+        self._route("HEAD")
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+def serve(fake: FakeOpenSearch, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start an HTTP front for `fake` on a daemon thread; port 0 picks a free port"""
+    handler = type("FakeHandler", (_Handler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve an in-memory OpenSearch stand-in over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per call")
+    args = parser.parse_args()
+    server = serve(FakeOpenSearch(latency=args.latency_ms / 1000.0), args.host, args.port)
+    print(f"Fake OpenSearch listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
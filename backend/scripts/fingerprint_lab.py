@@ -1,5 +1,12 @@
 #!/usr/bin/env python3
 
+# Lab-only fingerprinting of one or more targets. With --roe (a stored ROE id)
+# or --scope, targets outside the ROE scope are skipped before anything runs.
+#
+#   python scripts/fingerprint_lab.py --lab --target 192.168.56.10
+#   python scripts/fingerprint_lab.py --lab --targets-file lab_hosts.txt --roe <roe_id>
+#   python scripts/fingerprint_lab.py --lab --target 10.0.0.5,10.0.0.6 --scope "10.0.0.0/24 !10.0.0.1"
+
 
 import argparse
 import subprocess
@@ -9,6 +16,10 @@ import requests
 import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.scope import ScopeSet  # noqa: E402
+
 API_BASE = os.environ.get("API_BASE", "http://localhost:8000")
 
 def run_nmap(target):
@@ -27,17 +38,7 @@ def http_head(target, port=80):
     except Exception as e:
         return {"error": str(e)}
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--target", required=True, help="IP of lab device")
-    parser.add_argument("--lab", action="store_true", help="Enable lab mode")
-    args = parser.parse_args()
-
-    if not args.lab:
-        print("Refusing to run. This script is lab-only. Use --lab to confirm.")
-        sys.exit(1)
-
-    target = args.target
+def fingerprint(target):
     nmap_output = run_nmap(target)
     try:
         nmap_json = json.loads(nmap_output)
@@ -63,5 +64,53 @@ def main():
         json.dump({"nmap": nmap_json, "http": http_info}, f, indent=2)
     print(f"Saved fingerprint to fingerprint_{target}.json")
 
+def load_targets(args):
+    targets = []
+    for value in args.target or []:
+        targets.extend(t.strip() for t in value.split(",") if t.strip())
+    if args.targets_file:
+        with open(args.targets_file, "r", encoding="utf-8") as f:
+            targets.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return targets
+
+def load_scope(args):
+    """The ROE scope to enforce, from --scope or a stored ROE, or None"""
+    if args.scope:
+        return ScopeSet.from_text(args.scope)
+    if args.roe:
+        resp = requests.get(f"{API_BASE}/api/roes/{args.roe}", timeout=10)
+        if resp.status_code != 200:
+            print(f"Refusing to run. Could not load ROE {args.roe}: {resp.status_code} {resp.text}")
+            sys.exit(1)
+        return ScopeSet.from_text(resp.json().get("scope", ""))
+    return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", action="append", help="IP of lab device (repeatable, or comma-separated)")
+    parser.add_argument("--targets-file", help="File with one target per line")
+    parser.add_argument("--roe", help="Only fingerprint targets inside this stored ROE's scope")
+    parser.add_argument("--scope", help="Only fingerprint targets inside this scope (IPs, CIDRs, ranges)")
+    parser.add_argument("--lab", action="store_true", help="Enable lab mode")
+    args = parser.parse_args()
+
+    if not args.lab:
+        print("Refusing to run. This script is lab-only. Use --lab to confirm.")
+        sys.exit(1)
+
+    targets = load_targets(args)
+    if not targets:
+        parser.error("give --target or --targets-file")
+    scope = load_scope(args)
+    if scope is not None:
+        mask = scope.contains_many(targets)
+        for target, inside in zip(targets, mask):
+            if not inside:
+                print(f"Skipping {target}: outside the ROE scope")
+        targets = [target for target, inside in zip(targets, mask) if inside]
+
+    for target in targets:
+        fingerprint(target)
+
 if __name__ == "__main__":
     main()
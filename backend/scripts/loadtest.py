@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# API load test for backend/app/main.py.
+#
+# By default the FastAPI app is started in-process under uvicorn, pointed at
+# the HTTP OpenSearch stub from fake_opensearch.py (seeded with synthetic
+# devices), and hammered with a weighted mix of dashboard requests:
+#
+#   python scripts/loadtest.py --concurrency 1,8,32 --duration 20 --os-latency-ms 5
+#
+# Use --target to load an already running backend instead.
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_opensearch import FakeOpenSearch, serve  # noqa: E402
+
+DEFAULT_MIX = "devices=50,search=30,stats=15,health=5"
+SEARCH_TERMS = ["camera", "dvr", "nvr", "192.168.1.100", "10.0.0.51", "CVE-2024-1005", "webcam", "security",
+                "10.0.0.0/24 port:554", "cve:CVE-2024-*"]
+
+
+def build_requests() -> Dict[str, Any]:
+    """Endpoint name -> callable returning (path, params) for one request"""
+    return {
+        "devices": lambda rng: ("/api/devices", {"size": rng.choice([50, 100, 200])}),
+        "search": lambda rng: ("/api/devices/search", {"q": rng.choice(SEARCH_TERMS), "size": 50}),
+        "vulnerable": lambda rng: ("/api/devices/vulnerable", {"size": 100}),
+        "stats": lambda rng: ("/api/stats", {}),
+        "health": lambda rng: ("/health", {}),
+    }
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    known = build_requests()
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in known:
+            raise SystemExit(f"Unknown endpoint in --mix: {name} (choose from {', '.join(known)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def start_stack(devices: int, os_latency: float, port: int) -> str:
+    """Start the OpenSearch stub and the FastAPI app in-process; return the API base URL"""
+    fake = FakeOpenSearch()
+    stub = serve(fake)
+    os.environ["OPENSEARCH_URL"] = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    import uvicorn
+    from app.main import app, es
+    from app.synth import SyntheticDeviceGenerator
+
+    if es is None:
+        raise SystemExit("Backend failed to connect to the OpenSearch stub")
+    # Seed through the helper so documents look exactly like real ingests
+    for batch in SyntheticDeviceGenerator(seed=0, batch_size=5000).batches(devices):
+        es.bulk_index_devices(batch)
+    fake.latency = os_latency
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if server.started:
+            return base
+        time.sleep(0.1)
+    raise SystemExit("uvicorn did not start")
+
+
+def run_level(base: str, concurrency: int, duration: float, mix: List[Tuple[str, float]], seed: int) -> Dict[str, Any]:
+    """Run `concurrency` closed-loop clients for `duration` seconds"""
+    makers = build_requests()
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(worker: int):
+        rng = random.Random(seed * 1000 + worker)
+        session = requests.Session()
+        local_lat = defaultdict(list)
+        local_err = defaultdict(int)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            path, params = makers[name](rng)
+            started = time.perf_counter()
+            try:
+                resp = session.get(base + path, params=params, timeout=30)
+                ok = resp.status_code < 400
+                resp.content
+            except requests.RequestException:
+                ok = False
+            local_lat[name].append(time.perf_counter() - started)
+            if not ok:
+                local_err[name] += 1
+        with lock:
+            for name, values in local_lat.items():
+                latencies[name].extend(values)
+            for name, count in local_err.items():
+                errors[name] += count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name in names:
+        values = sorted(latencies.get(name, []))
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors.get(name, 0),
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": (values[-1] * 1000) if values else 0.0,
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "requests": total,
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "rps": total / elapsed,
+        "endpoints": endpoints,
+    }
+
+
+def print_level(result: Dict[str, Any]):
+    print(f"\nconcurrency={result['concurrency']}  {result['requests']} requests in {result['elapsed_s']:.1f}s  "
+          f"{result['rps']:.1f} req/s  errors={result['errors']}")
+    print(f"  {'endpoint':10s} {'reqs':>7s} {'err':>5s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}")
+    for name, e in result["endpoints"].items():
+        print(f"  {name:10s} {e['requests']:7d} {e['errors']:5d} {e['rps']:8.1f} "
+              f"{e['p50_ms']:8.1f} {e['p95_ms']:8.1f} {e['p99_ms']:8.1f} {e['max_ms']:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the AVAPT API")
+    parser.add_argument("--target", help="Base URL of a running backend (default: start one in-process)")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the in-process backend")
+    parser.add_argument("--devices", type=int, default=2000, help="Devices seeded into the OpenSearch stub")
+    parser.add_argument("--os-latency-ms", type=float, default=2.0, help="Stub latency added to every OpenSearch call")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated client counts to sweep")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted endpoint mix, e.g. devices=50,search=30")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    base = args.target.rstrip("/") if args.target else start_stack(args.devices, args.os_latency_ms / 1000.0, args.port)
+
+    levels = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        result = run_level(base, concurrency, args.duration, mix, args.seed)
+        print_level(result)
+        levels.append(result)
+
+    if args.out:
+        report = {
+            "target": args.target or "in-process",
+            "devices": None if args.target else args.devices,
+            "os_latency_ms": None if args.target else args.os_latency_ms,
+            "mix": dict(mix),
+            "levels": levels,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Device index management: bootstrap the dated indices and aliases, list
+# them, trigger rollover (e.g. from cron) by age or size, and migrate
+# indices created from an older mapping version.
+#
+#   python scripts/manage_indices.py bootstrap
+#   python scripts/manage_indices.py rollover --max-age 30d --max-size 5gb
+#   python scripts/manage_indices.py list
+#   python scripts/manage_indices.py migrate --dry-run
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.opensearch import OpenSearchHelper, MAPPING_VERSION, ROLLOVER_MAX_AGE, ROLLOVER_MAX_SIZE  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage AVAPT device indices")
+    parser.add_argument("--es", default=os.environ.get("OPENSEARCH_URL", "http://localhost:9200"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("bootstrap", help="Install the index template and create the first dated index")
+    sub.add_parser("list", help="List indices behind the search alias with their mapping version, newest first")
+    rollover = sub.add_parser("rollover", help="Roll the write alias over if a condition is met")
+    rollover.add_argument("--max-age", default=ROLLOVER_MAX_AGE)
+    rollover.add_argument("--max-size", default=ROLLOVER_MAX_SIZE)
+    rollover.add_argument("--dry-run", action="store_true")
+    migrate = sub.add_parser("migrate", help=f"Reindex indices older than mapping v{MAPPING_VERSION} and swap them in")
+    migrate.add_argument("--dry-run", action="store_true", help="Only show which indices would be reindexed")
+    args = parser.parse_args()
+
+    es = OpenSearchHelper(args.es)
+    if not es.client:
+        print("OpenSearch not available")
+        sys.exit(1)
+
+    if args.command == "bootstrap":
+        sys.exit(0 if es.create_index_mappings() else 1)
+    elif args.command == "list":
+        versions = es.get_mapping_versions()
+        for index in es.get_indices(max_age=0):
+            print(f"{index}\tv{versions.get(index, 1)}")
+    elif args.command == "rollover":
+        result = es.rollover(args.max_age or None, args.max_size or None, dry_run=args.dry_run)
+        print(json.dumps(result, indent=2))
+    elif args.command == "migrate":
+        plan = es.migrate_indices(dry_run=args.dry_run)
+        print(json.dumps(plan, indent=2))
+        sys.exit(1 if any(step.get("status") == "failed" for step in plan) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# Synthetic device fleet for load and scale testing: seeded, reproducible,
+# generated in NumPy batches (see app/synth.py for the distributions).
+#
+#   python scripts/synth_devices.py --count 2000000 --format ndjson --out devices.ndjson
+#   python scripts/synth_devices.py --count 2000000 --format parquet --out devices.parquet
+#   python scripts/synth_devices.py --count 2000000 --format index --es http://localhost:9200
+#   python scripts/synth_devices.py --count 200000 --format index --sqlite data/avapt.db
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.synth import SyntheticDeviceGenerator  # noqa: E402
+
+
+def write_ndjson(batches, out):
+    handle = sys.stdout if out == "-" else open(out, "w", encoding="utf-8")
+    try:
+        for devices in batches:
+            handle.write("".join(json.dumps(device, separators=(",", ":")) + "\n" for device in devices))
+            yield len(devices)
+    finally:
+        if handle is not sys.stdout:
+            handle.close()
+
+
+def write_parquet(batches, out):
+    import pyarrow.parquet as pq
+    from app.export import DEVICE_SCHEMA, devices_to_record_batch
+
+    with pq.ParquetWriter(out, DEVICE_SCHEMA, compression="zstd") as writer:
+        for devices in batches:
+            writer.write_batch(devices_to_record_batch(devices))
+            yield len(devices)
+
+
+def index_devices(batches, store, bulk_size):
+    for devices in batches:
+        for start in range(0, len(devices), bulk_size):
+            if not store.bulk_index_devices(devices[start:start + bulk_size]):
+                raise SystemExit("Bulk indexing failed; see the log above")
+        yield len(devices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic device fleet")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cve-rate", type=float, default=0.3, help="Share of devices with at least one CVE")
+    parser.add_argument("--batch-size", type=int, default=100000)
+    parser.add_argument("--now-ms", type=float, default=None,
+                        help="Anchor for last_seen/timestamp (default: now); fix it for byte-identical output")
+    parser.add_argument("--format", choices=["ndjson", "parquet", "index"], default="ndjson")
+    parser.add_argument("--out", default="-", help="Output file for ndjson (- for stdout) or parquet")
+    parser.add_argument("--es", default=os.environ.get("OPENSEARCH_URL", "http://localhost:9200"))
+    parser.add_argument("--sqlite", help="Index into the embedded SQLite store at this path instead of OpenSearch")
+    parser.add_argument("--bulk-size", type=int, default=5000, help="Devices per bulk request with --format index")
+    args = parser.parse_args()
+
+    generator = SyntheticDeviceGenerator(args.seed, args.cve_rate, args.batch_size, args.now_ms)
+    batches = generator.batches(args.count)
+    if args.format == "ndjson":
+        progress = write_ndjson(batches, args.out)
+    elif args.format == "parquet":
+        if args.out == "-":
+            raise SystemExit("--format parquet needs --out <file>")
+        progress = write_parquet(batches, args.out)
+    else:
+        if args.sqlite:
+            from app.sqlite_store import SQLiteDeviceStore
+            store = SQLiteDeviceStore(args.sqlite)
+        else:
+            from app.opensearch import OpenSearchHelper
+            store = OpenSearchHelper(args.es)
+        if not store.create_index_mappings():
+            raise SystemExit("Storage backend not available")
+        progress = index_devices(batches, store, args.bulk_size)
+
+    start = time.time()
+    done = 0
+    for written in progress:
+        done += written
+        print(f"{done}/{args.count} devices ({done / max(time.time() - start, 1e-9):.0f}/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import streamlit as st
+import html
 import requests
 import time
 import random
+import json
+import threading
+from collections import deque
 from datetime import datetime, timedelta
 import pandas as pd
 import pydeck as pdk
@@ -212,15 +216,154 @@ def get_health():
         pass
     return {"status": "unreachable"}
 
-def get_devices(size=50):
+def get_dashboard_summary(top=5):
+    """All Command Center figures in one backend call; None if the backend is unreachable"""
     try:
-        r = requests.get(f"{BACKEND_URL}/api/devices?size={size}", timeout=3)
+        r = requests.get(f"{BACKEND_URL}/api/dashboard/summary", params={"top": top}, timeout=3)
+        if r.status_code == 200:
+            return r.json()
+    except Exception:
+        pass
+    return None
+
+def get_devices(size=50, fields=None):
+    """Device list; pass `fields` (e.g. ["ip", "port", "status"]) to skip the raw banners"""
+    params = {"size": size}
+    if fields:
+        params["fields"] = ",".join(fields)
+    try:
+        r = requests.get(f"{BACKEND_URL}/api/devices", params=params, timeout=3)
         if r.status_code == 200:
             return r.json()
     except Exception:
         return []
     return []
 
+def fetch_device_changes(cursor=None, size=1000, max_pages=20):
+    """Pull devices changed since `cursor`; returns (devices, new_cursor) or (None, cursor) on failure"""
+    devices = []
+    for _ in range(max_pages):
+        params = {"size": size}
+        if cursor:
+            params["since"] = cursor
+        try:
+            r = requests.get(f"{BACKEND_URL}/api/devices/changes", params=params, timeout=5)
+            if r.status_code != 200:
+                return None, cursor
+            page = r.json()
+        except Exception:
+            return None, cursor
+        devices.extend(page.get("devices", []))
+        cursor = page.get("cursor") or cursor
+        if not page.get("has_more"):
+            break
+    return devices, cursor
+
+def merge_device_changes(df, devices):
+    """Patch the cached device frame with changed rows, keyed by document _id"""
+    if not devices:
+        return df
+    changes = pd.DataFrame(devices).set_index("_id")
+    if df.empty:
+        return changes
+    for column in changes.columns.difference(df.columns):
+        df[column] = None
+    existing = changes.index.intersection(df.index)
+    if len(existing):
+        df.loc[existing, changes.columns] = changes.loc[existing, changes.columns]
+    added = changes.index.difference(df.index)
+    if len(added):
+        df = pd.concat([df, changes.loc[added]])
+    return df
+
+def load_device_frame():
+    """Session-cached device DataFrame kept current through the changes feed"""
+    state = st.session_state
+    if "device_frame" not in state:
+        state.device_frame = pd.DataFrame()
+        state.device_cursor = None
+    devices, cursor = fetch_device_changes(state.device_cursor)
+    if devices is not None:
+        state.device_frame = merge_device_changes(state.device_frame, devices)
+        state.device_cursor = cursor
+    return state.device_frame
+
+class DeviceEventFeed:
+    """Background subscriber to the backend's /api/events/stream SSE feed"""
+
+    def __init__(self, url, maxlen=200):
+        self.url = url
+        self.events = deque(maxlen=maxlen)
+        self.counts = {}
+        self.connected = False
+        self.last_event_id = None
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                headers = {"Accept": "text/event-stream"}
+                if self.last_event_id:
+                    headers["Last-Event-ID"] = self.last_event_id
+                # Read timeout comfortably above the server's 15s keepalive
+                with requests.get(self.url, stream=True, headers=headers, timeout=(3, 45)) as r:
+                    r.raise_for_status()
+                    self.connected = True
+                    backoff = 1
+                    self._consume(r.iter_lines(decode_unicode=True))
+            except Exception:
+                pass
+            self.connected = False
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _consume(self, lines):
+        event_id, event_type, data = None, "message", []
+        for line in lines:
+            if line is None:
+                continue
+            if line == "":
+                if data:
+                    self._dispatch(event_id, event_type, "\n".join(data))
+                event_id, event_type, data = None, "message", []
+            elif line.startswith(":"):
+                continue
+            else:
+                field, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if field == "id":
+                    event_id = value
+                elif field == "event":
+                    event_type = value
+                elif field == "data":
+                    data.append(value)
+
+    def _dispatch(self, event_id, event_type, payload):
+        if event_id:
+            self.last_event_id = event_id
+        if event_type == "dropped":
+            # Server gave up on us; reconnecting resumes from last_event_id
+            raise ConnectionError("event stream dropped")
+        try:
+            device = json.loads(payload)
+        except ValueError:
+            return
+        self.events.appendleft({"type": event_type, "device": device, "received": datetime.now()})
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+
+@st.cache_resource
+def get_event_feed():
+    return DeviceEventFeed(f"{BACKEND_URL}/api/events/stream")
+
+def time_ago(moment):
+    seconds = int((datetime.now() - moment).total_seconds())
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{seconds // 60} min ago"
+    return f"{seconds // 3600} h ago"
+
 # Command Center
 if page == "Command Center":
     st.markdown('<h1 class="gradient-text">COMMAND CENTER</h1>', unsafe_allow_html=True)
@@ -228,11 +371,18 @@ if page == "Command Center":
     
     st.markdown("<br>", unsafe_allow_html=True)
     
-    active_cameras = random.randint(28, 35)
-    total_cameras = 35
-    alerts = random.randint(2, 8)
-    uptime = round(random.uniform(99.2, 99.97), 2)
-    bandwidth = round(random.uniform(450, 890), 1)
+    summary = get_dashboard_summary()
+    if summary is None:
+        st.warning("Backend unreachable - showing empty figures")
+        summary = {"total_devices": 0, "online": 0, "online_ratio": 0.0, "vulnerable_devices": 0,
+                   "severity": {}, "top_services": [], "top_ports": [], "ingest": {"per_hour": 0, "hourly": []}}
+    
+    active_cameras = summary["online"]
+    total_cameras = summary["total_devices"]
+    alerts = summary["vulnerable_devices"]
+    critical = summary["severity"].get("critical", 0)
+    uptime = round(summary["online_ratio"] * 100, 2)
+    ingest_rate = summary["ingest"]["per_hour"]
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -249,14 +399,14 @@ if page == "Command Center":
         """, unsafe_allow_html=True)
     
     with col2:
-        alert_color = "#ef4444" if alerts > 5 else "#f59e0b"
+        alert_color = "#ef4444" if critical else "#f59e0b"
         st.markdown(f"""
             <div class='metric-card'>
                 <div style='font-size: 2.5rem; margin-bottom: 10px;'>Alerts</div>
                 <div style='font-size: 2.8rem; font-weight: 800; color: {alert_color};'>{alerts}</div>
-                <div style='color: #94a3b8; margin-top: 5px; font-size: 0.95rem;'>Active Alerts</div>
+                <div style='color: #94a3b8; margin-top: 5px; font-size: 0.95rem;'>Vulnerable Devices</div>
                 <div style='margin-top: 10px;'>
-                    <span class='status-badge status-{"alert" if alerts > 5 else "warning"}'>{"CRITICAL" if alerts > 5 else "MODERATE"}</span>
+                    <span class='status-badge status-{"alert" if critical else "warning"}'>{f"{critical} CRITICAL" if critical else "MODERATE"}</span>
                 </div>
             </div>
         """, unsafe_allow_html=True)
@@ -264,9 +414,9 @@ if page == "Command Center":
     with col3:
         st.markdown(f"""
             <div class='metric-card'>
-                <div style='font-size: 2.5rem; margin-bottom: 10px;'>Uptime</div>
+                <div style='font-size: 2.5rem; margin-bottom: 10px;'>Online</div>
                 <div style='font-size: 2.8rem; font-weight: 800; color: #10b981;'>{uptime}%</div>
-                <div style='color: #94a3b8; margin-top: 5px; font-size: 0.95rem;'>System Uptime</div>
+                <div style='color: #94a3b8; margin-top: 5px; font-size: 0.95rem;'>Devices Online</div>
                 <div style='margin-top: 10px;'>
                     <span class='status-badge status-online'>STABLE</span>
                 </div>
@@ -276,9 +426,9 @@ if page == "Command Center":
     with col4:
         st.markdown(f"""
             <div class='metric-card'>
-                <div style='font-size: 2.5rem; margin-bottom: 10px;'>Bandwidth</div>
-                <div style='font-size: 2.8rem; font-weight: 800; color: #8b5cf6;'>{bandwidth}</div>
-                <div style='color: #94a3b8; margin-top: 5px; font-size: 0.95rem;'>Bandwidth (Mbps)</div>
+                <div style='font-size: 2.5rem; margin-bottom: 10px;'>Ingest</div>
+                <div style='font-size: 2.8rem; font-weight: 800; color: #8b5cf6;'>{ingest_rate}</div>
+                <div style='color: #94a3b8; margin-top: 5px; font-size: 0.95rem;'>Devices / hour (24h)</div>
                 <div style='margin-top: 10px;'>
                     <span class='status-badge status-online'>OPTIMAL</span>
                 </div>
@@ -292,25 +442,19 @@ if page == "Command Center":
     with col1:
         st.markdown("### Network Activity Stream")
         
-        time_points = pd.date_range(end=datetime.now(), periods=30, freq='1min')
-        camera_data = [random.randint(20, 35) for _ in range(30)]
-        bandwidth_data = [random.randint(400, 900) for _ in range(30)]
+        hourly = summary["ingest"]["hourly"]
+        time_points = pd.to_datetime([point["time"] for point in hourly], unit='ms')
+        ingest_data = [point["count"] for point in hourly]
         
         fig = make_subplots(specs=[[{"secondary_y": True}]])
         
         fig.add_trace(
-            go.Scatter(x=time_points, y=camera_data, name="Active Cameras", 
+            go.Scatter(x=time_points, y=ingest_data, name="Devices Ingested / hour",
                       line=dict(color='#6366f1', width=3),
                       fill='tozeroy', fillcolor='rgba(99, 102, 241, 0.1)'),
             secondary_y=False
         )
         
-        fig.add_trace(
-            go.Scatter(x=time_points, y=bandwidth_data, name="Bandwidth (Mbps)",
-                      line=dict(color='#8b5cf6', width=3, dash='dot')),
-            secondary_y=True
-        )
-        
         fig.update_layout(
             plot_bgcolor='rgba(0,0,0,0)',
             paper_bgcolor='rgba(0,0,0,0)',
@@ -324,13 +468,17 @@ if page == "Command Center":
         fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='rgba(99, 102, 241, 0.1)')
         
         st.plotly_chart(fig, use_container_width=True)
+        
+        top_services = ", ".join(f"{s['service']} ({s['count']})" for s in summary["top_services"])
+        top_ports = ", ".join(f"{p['port']} ({p['count']})" for p in summary["top_ports"])
+        st.caption(f"Top services: {top_services or 'none'} | Top ports: {top_ports or 'none'}")
     
     with col2:
         st.markdown("### Alert Distribution")
         
-        alert_types = ['Motion', 'Tampering', 'Connection', 'Quality', 'Other']
-        alert_counts = [random.randint(0, 5) for _ in range(5)]
-        colors = ['#ef4444', '#f59e0b', '#6366f1', '#8b5cf6', '#ec4899']
+        alert_types = ['Critical', 'High', 'Medium', 'Low']
+        alert_counts = [summary["severity"].get(t.lower(), 0) for t in alert_types]
+        colors = ['#ef4444', '#f59e0b', '#6366f1', '#8b5cf6']
         
         fig = go.Figure(data=[go.Pie(
             labels=alert_types,
@@ -526,23 +674,32 @@ elif page == "Live Feed":
     
     col1, col2 = st.columns([2, 1])
     
+    feed = get_event_feed()
+    events = list(feed.events)
+    
     with col1:
         st.markdown("### Real-Time Event Log")
         
-        log_entries = [
-            ("INFO", "System initialized successfully", "just now", "#6366f1"),
-            ("SUCCESS", "Camera 12 stream connected", "1 min ago", "#10b981"),
-            ("INFO", "Health check passed", "2 min ago", "#6366f1"),
-            ("WARNING", "Camera 5 experiencing high latency", "3 min ago", "#f59e0b"),
-            ("SUCCESS", "Analytics module loaded", "5 min ago", "#10b981"),
-            ("ALERT", "Motion detected in Zone A - Camera 8", "7 min ago", "#ef4444"),
-            ("INFO", "Database backup completed", "10 min ago", "#6366f1"),
-            ("WARNING", "Frame drop detected on Camera 3", "12 min ago", "#f59e0b"),
-            ("SUCCESS", "Network optimization applied", "15 min ago", "#10b981"),
-            ("INFO", "Scheduled maintenance reminder", "18 min ago", "#6366f1"),
-        ]
-        
-        for log_type, message, time_ago, color in log_entries:
+        if not feed.connected:
+            st.warning("Not connected to the backend event stream. Retrying in the background...")
+        elif not events:
+            st.info("Subscribed to the device event stream. New and changed devices will appear here as they are indexed.")
+        
+        for event in events[:25]:
+            device = event["device"]
+            if event["type"] == "device.indexed":
+                log_type, color, verb = "NEW", "#10b981", "indexed"
+            else:
+                log_type, color, verb = "UPDATE", "#6366f1", "changed"
+            if device.get("status") == "offline":
+                log_type, color = "WARNING", "#f59e0b"
+            if device.get("vulnerabilities"):
+                log_type, color = "ALERT", "#ef4444"
+            vuln_note = f" • {len(device['vulnerabilities'])} CVE(s)" if device.get("vulnerabilities") else ""
+            # Banner fields come from Shodan unfiltered; escape them before they go into the HTML below
+            service, ip, port, status = (html.escape(str(device.get(key, default))) for key, default in
+                                         (("service", "Device"), ("ip", "?"), ("port", "?"), ("status", "unknown")))
+            message = f"{service} {ip}:{port} {verb} ({status}){vuln_note}"
             st.markdown(f"""
                 <div style='background: rgba(99, 102, 241, 0.05); padding: 15px 20px; border-radius: 10px; margin: 8px 0; border-left: 4px solid {color};'>
                     <div style='display: flex; justify-content: space-between; align-items: center;'>
@@ -550,7 +707,7 @@ elif page == "Live Feed":
                             <span style='color: {color}; font-weight: 700; margin-right: 10px;'>[{log_type}]</span>
                             <span style='color: #e0e7ff;'>{message}</span>
                         </div>
-                        <span style='color: #94a3b8; font-size: 0.85rem;'>{time_ago}</span>
+                        <span style='color: #94a3b8; font-size: 0.85rem;'>{time_ago(event["received"])}</span>
                     </div>
                 </div>
             """, unsafe_allow_html=True)
@@ -559,13 +716,13 @@ elif page == "Live Feed":
         st.markdown("### Event Statistics")
         
         event_counts = {
-            'INFO': random.randint(120, 200),
-            'SUCCESS': random.randint(80, 150),
-            'WARNING': random.randint(10, 40),
-            'ALERT': random.randint(5, 15)
+            'NEW': feed.counts.get('device.indexed', 0),
+            'UPDATE': feed.counts.get('device.changed', 0),
+            'WARNING': sum(1 for e in events if e["device"].get("status") == "offline"),
+            'ALERT': sum(1 for e in events if e["device"].get("vulnerabilities"))
         }
         
-        colors_map = {'INFO': '#6366f1', 'SUCCESS': '#10b981', 'WARNING': '#f59e0b', 'ALERT': '#ef4444'}
+        colors_map = {'NEW': '#10b981', 'UPDATE': '#6366f1', 'WARNING': '#f59e0b', 'ALERT': '#ef4444'}
         
         fig = go.Figure(data=[go.Bar(
             x=list(event_counts.values()),
@@ -589,12 +746,13 @@ elif page == "Live Feed":
         
         st.plotly_chart(fig, use_container_width=True)
         
+        last_hour = sum(1 for e in events if (datetime.now() - e["received"]) < timedelta(hours=1))
         st.markdown("### Activity Heatmap")
         st.markdown(f"""
             <div style='background: rgba(99, 102, 241, 0.1); padding: 15px; border-radius: 10px; text-align: center;'>
                 <div style='color: #e0e7ff; font-size: 1.2rem; font-weight: 600; margin-bottom: 10px;'>Last Hour</div>
-                <div style='color: #6366f1; font-size: 2.5rem; font-weight: 800;'>{sum(event_counts.values())}</div>
-                <div style='color: #94a3b8; margin-top: 5px;'>Total Events</div>
+                <div style='color: #6366f1; font-size: 2.5rem; font-weight: 800;'>{last_hour}</div>
+                <div style='color: #94a3b8; margin-top: 5px;'>Device Events</div>
             </div>
         """, unsafe_allow_html=True)
 
@@ -797,17 +955,33 @@ elif page == "Global Map":
     ]
     
     data_list = []
-    for lat, lon, device_id, location in sample_locations:
-        lat_var = lat + random.uniform(-0.01, 0.01)
-        lon_var = lon + random.uniform(-0.01, 0.01)
-        status = random.choice(["online", "online", "online", "online", "warning"])
-        data_list.append({
-            "lat": lat_var,
-            "lon": lon_var,
-            "device": device_id,
-            "location": location,
-            "status": status
-        })
+    devices_df = load_device_frame()
+    if not devices_df.empty and "location" in devices_df.columns:
+        for _, row in devices_df.iterrows():
+            geo = row.get("location")
+            if not isinstance(geo, dict) or geo.get("lat") is None or geo.get("lon") is None:
+                continue
+            data_list.append({
+                "lat": geo["lat"],
+                "lon": geo["lon"],
+                "device": row.get("hostname") or f"{row.get('ip')}:{row.get('port')}",
+                "location": row.get("service") or row.get("ip"),
+                "status": "online" if row.get("status") == "online" else "warning"
+            })
+    
+    if not data_list:
+        st.info("No geolocated devices indexed yet. Showing sample locations.")
+        for lat, lon, device_id, location in sample_locations:
+            lat_var = lat + random.uniform(-0.01, 0.01)
+            lon_var = lon + random.uniform(-0.01, 0.01)
+            status = random.choice(["online", "online", "online", "online", "warning"])
+            data_list.append({
+                "lat": lat_var,
+                "lon": lon_var,
+                "device": device_id,
+                "location": location,
+                "status": status
+            })
     
     data = pd.DataFrame(data_list)
     